@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 HTTP Client for flash-proxy
-Sends directory paths to the flash proxy server
+Sends directory paths to the flash proxy server, or to the proxies of a
+fleet of boards at once
 """
 
 import json
@@ -10,18 +11,53 @@ import argparse
 import sys
 import os
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from images import CODECS, chunk_at, compress, format_bytes, image_manifest, map_image
+from metrics import histogram_quantile, parse_metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Seconds without an event or keep-alive before the stream counts as lost
+STREAM_TIMEOUT = 60
+MAX_RECONNECTS = 5
+# Parallel flashes of a fleet, and attempts per board
+FLEET_WORKERS = 8
+FLEET_RETRIES = 2
+# Chunks uploaded in parallel to one server
+UPLOAD_WORKERS = 4
+
+
+def make_session(pool_size=FLEET_WORKERS):
+    """Session with keep-alive connections to every proxy, retrying requests on
+    connection errors and gateway errors with backoff. The server keys flash
+    requests by image content and board, so a retried POST attaches to the
+    job it already started"""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset({'GET', 'PUT', 'POST'}))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
 class FlashClient:
-    def __init__(self, server_url):
+    def __init__(self, server_url, session=None):
         """Initialize the flash client"""
         self.server_url = server_url.rstrip('/')
+        self.session = session or make_session(UPLOAD_WORKERS)
         
-    def send_flash_request(self, directory_path):
-        """Send a flash request to the server"""
+    def send_flash_request(self, directory_path, wait=True, force=False, upload=False):
+        """Send a flash request to the server, as a job the client follows
+        when the server supports it. The request carries the chunk hashes of
+        the images, so the server only writes what changed unless forced.
+        With upload, the images are sent to the server rather than read from
+        a filesystem it shares with the client"""
         # Validate directory exists
         if not os.path.isdir(directory_path):
             logger.error(f"Directory does not exist: {directory_path}")
@@ -30,16 +66,245 @@ class FlashClient:
         # Convert to absolute path
         directory_path = os.path.abspath(directory_path)
         
+        logger.info(f"Sending flash request for directory: {directory_path}")
+        
+        try:
+            if upload:
+                manifest = image_manifest(directory_path)
+                if self.upload(directory_path, manifest) is None:
+                    print(f"❌ Server at {self.server_url} does not accept uploads")
+                    return False
+                job = self.start_flash(None, force, manifest, upload=True)
+            else:
+                job = self.start_flash(directory_path, force)
+        except requests.exceptions.ConnectionError:
+            logger.error(f"Could not connect to server at {self.server_url}")
+            print(f"❌ Could not connect to server at {self.server_url}")
+            print("Make sure the server is running!")
+            return False
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Flash request failed: {e}")
+            print(f"❌ Flash request to {self.server_url} failed: {e}")
+            return False
+        if job is None:
+            # Server without the job API
+            return self.send_blocking_request(directory_path)
+        if 'id' not in job:
+            print(f"❌ Server refused the flash request: {job.get('error', job)}")
+            return False
+        
+        if job.get('coalesced'):
+            print(f"Attached to flash job {job['id']} of an identical request")
+        else:
+            print(f"Started flash job {job['id']}")
+        if not wait:
+            print(f"Follow it with: --attach {job['id']}")
+            return True
+        return self.attach(job['id'])
+    
+    def start_flash(self, directory_path, force=False, manifest=None, upload=False):
+        """Start a flash job, return its status, or None if the server has no job API.
+        An upload job flashes the images of the manifest from the server's chunk store.
+        A job already flashing the same images to the same board is returned instead
+        of starting a second one"""
+        manifest = manifest or image_manifest(directory_path)
+        response = self.session.post(
+            f"{self.server_url}/jobs",
+            json={'directory_path': directory_path, 'manifest': manifest, 'force': force,
+                  'upload': upload},
+            timeout=30
+        )
+        if response.status_code in (404, 405, 501):
+            return None
+        return response.json()
+    
+    def upload(self, directory_path, manifest, workers=UPLOAD_WORKERS, verbose=True):
+        """Upload the image chunks the server does not hold yet, compressed.
+        After a dropped connection the server is asked again which chunks it
+        lacks, so an interrupted upload resumes where it stopped.
+        Returns (bytes of chunk data, bytes sent), or None if the server has no
+        upload API"""
+        locations = {}
+        for image in manifest['images']:
+            path = os.path.join(directory_path, image['file'])
+            for index, sha256 in enumerate(image['chunks']):
+                locations.setdefault(sha256, (path, index))
+        chunk_size = manifest['chunk_size']
+        raw = sent = 0
+        failures = 0
+        while True:
+            try:
+                reply = self.session.post(f"{self.server_url}/chunks/missing",
+                                          json={'hashes': list(locations)}, timeout=60)
+                if reply.status_code in (404, 405, 501):
+                    return None
+                reply.raise_for_status()
+                reply = reply.json()
+                missing = reply['missing']
+                if not missing:
+                    if verbose and raw:
+                        print(f"\rUploaded {format_bytes(raw)} as {format_bytes(sent)}"
+                              + ' ' * 30)
+                    return raw, sent
+                codec = next(c for c in CODECS if c in reply.get('codecs', ['identity']))
+                by_path = {}
+                for sha256 in missing:
+                    path, index = locations[sha256]
+                    by_path.setdefault(path, []).append((sha256, index))
+                for path, chunks in by_path.items():
+                    with map_image(path) as view, ThreadPoolExecutor(max_workers=workers) as pool:
+                        for n, m in pool.map(
+                                lambda chunk: self._put_chunk(view, *chunk, chunk_size, codec),
+                                chunks):
+                            raw += n
+                            sent += m
+                            failures = 0
+                            if verbose:
+                                print(f"\rUploading {os.path.basename(path)}: "
+                                      f"{format_bytes(raw)} as {format_bytes(sent)} ({codec})",
+                                      end='', flush=True)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                failures += 1
+                if failures > MAX_RECONNECTS:
+                    raise
+                logger.warning(f"Upload interrupted ({e}), resuming")
+                time.sleep(min(30, 2 ** failures))
+    
+    def _put_chunk(self, view, sha256, index, chunk_size, codec):
+        with chunk_at(view, index, chunk_size) as chunk:
+            body = compress(chunk, codec)
+            size = len(chunk)
+            if codec != 'identity' and len(body) >= size:
+                # Already compressed data
+                body, codec = bytes(chunk), 'identity'
+        response = self.session.put(f"{self.server_url}/chunks/{sha256}", data=body,
+                                    headers={'Content-Encoding': codec}, timeout=60)
+        response.raise_for_status()
+        return size, len(body)
+    
+    def job_status(self, job_id):
+        """Status of a job, None if the server does not know it"""
+        response = self.session.get(f"{self.server_url}/jobs/{job_id}", timeout=30)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+    
+    def events(self, job_id, last_event_id=0):
+        """Yield (id, event, data) of a job's event stream, reconnecting after
+        a disconnect with the id of the last event received"""
+        failures = 0
+        while True:
+            try:
+                response = self.session.get(
+                    f"{self.server_url}/jobs/{job_id}/events",
+                    headers={'Accept': 'text/event-stream', 'Last-Event-ID': str(last_event_id)},
+                    stream=True,
+                    timeout=(5, STREAM_TIMEOUT)
+                )
+                if response.status_code == 404:
+                    raise KeyError(job_id)
+                response.raise_for_status()
+                event = {}
+                for line in response.iter_lines(decode_unicode=True):
+                    failures = 0
+                    if line:
+                        field, _, value = line.partition(':')
+                        if field:
+                            event[field] = value[1:] if value.startswith(' ') else value
+                        continue
+                    if 'data' in event:
+                        last_event_id = int(event.get('id', last_event_id))
+                        yield last_event_id, event.get('event', 'message'), json.loads(event['data'])
+                        if event.get('event') == 'done':
+                            return
+                    event = {}
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                failures += 1
+                if failures > MAX_RECONNECTS:
+                    raise
+                logger.warning(f"Event stream lost ({e}), reattaching to job {job_id}")
+                time.sleep(min(30, 2 ** failures))
+                continue
+            # The server closed the stream without a done event
+            failures += 1
+            if failures > MAX_RECONNECTS:
+                raise requests.exceptions.ConnectionError(f"Event stream of job {job_id} ended")
+    
+    def wait(self, job_id, on_event=None):
+        """Follow a job until it finishes and return its final status"""
+        for _, event, data in self.events(job_id):
+            if on_event:
+                on_event(event, data)
+            if event == 'done':
+                return data
+        raise requests.exceptions.ConnectionError(f"Job {job_id} ended without a result")
+    
+    def attach(self, job_id, last_event_id=0):
+        """Follow a job until it finishes, printing its progress"""
+        try:
+            for _, event, data in self.events(job_id, last_event_id):
+                if event == 'progress':
+                    self._print_progress(data)
+                elif event == 'partition' and data['state'] != 'flashing':
+                    written = f"{format_bytes(data['write_size'])} of " \
+                        if data.get('action') == 'delta' else ''
+                    print(f"\r{data['name']}: {data['state']} ({written}"
+                          f"{format_bytes(data['size'])})" + ' ' * 30)
+                elif event == 'log':
+                    logger.debug(data['line'])
+                elif event == 'done':
+                    return self._report(data)
+        except KeyError:
+            print(f"❌ Unknown job: {job_id}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Lost job {job_id}: {e}")
+            print(f"❌ Lost connection to job {job_id}, reattach with: --attach {job_id}")
+        return False
+    
+    def _print_progress(self, data):
+        percent = 100 * data['bytes_written'] / max(1, data['bytes_total'])
+        print(f"\r{data['partition']}: {format_bytes(data['written'])}/"
+              f"{format_bytes(data['size'])}, total {percent:5.1f}% at "
+              f"{format_bytes(data['throughput'])}/s", end='', flush=True)
+    
+    def _report(self, result):
+        """Print the result of a flash, return whether it succeeded"""
+        if result.get('success'):
+            logger.info("Flash operation completed successfully!")
+            print("✅ Flash operation completed successfully!")
+            if result.get('bytes_avoided'):
+                print(f"Wrote {format_bytes(result['bytes_written'])}, skipped "
+                      f"{format_bytes(result['bytes_avoided'])} already on the board")
+            
+            if result.get('stdout'):
+                print(f"\nOutput:\n{result['stdout']}")
+            
+            return True
+        else:
+            logger.error("Flash operation failed!")
+            print("❌ Flash operation failed!")
+            
+            if result.get('stderr'):
+                print(f"\nError output:\n{result['stderr']}")
+            if result.get('stdout'):
+                print(f"\nStandard output:\n{result['stdout']}")
+            
+            print(f"Return code: {result.get('returncode', 'unknown')}")
+            return False
+    
+    def send_blocking_request(self, directory_path):
+        """Flash with one blocking request, for servers without the job API"""
         # Prepare request data
         request_data = {
             'directory_path': directory_path
         }
         
-        logger.info(f"Sending flash request for directory: {directory_path}")
-        
         try:
             # Send POST request
-            response = requests.post(
+            response = self.session.post(
                 f"{self.server_url}/",
                 json=request_data,
                 headers={'Content-Type': 'application/json'},
@@ -48,27 +313,7 @@ class FlashClient:
             
             # Check response status
             if response.status_code == 200:
-                result = response.json()
-                
-                if result.get('success'):
-                    logger.info("Flash operation completed successfully!")
-                    print("✅ Flash operation completed successfully!")
-                    
-                    if result.get('stdout'):
-                        print(f"\nOutput:\n{result['stdout']}")
-                    
-                    return True
-                else:
-                    logger.error("Flash operation failed!")
-                    print("❌ Flash operation failed!")
-                    
-                    if result.get('stderr'):
-                        print(f"\nError output:\n{result['stderr']}")
-                    if result.get('stdout'):
-                        print(f"\nStandard output:\n{result['stdout']}")
-                    
-                    print(f"Return code: {result.get('returncode', 'unknown')}")
-                    return False
+                return self._report(response.json())
             else:
                 logger.error(f"Server returned error: {response.status_code}")
                 print(f"❌ Server error: {response.status_code}")
@@ -98,7 +343,7 @@ class FlashClient:
     def check_server_status(self):
         """Check if the server is running"""
         try:
-            response = requests.get(f"{self.server_url}/status", timeout=5)
+            response = self.session.get(f"{self.server_url}/status", timeout=5)
             if response.status_code == 200:
                 status_data = response.json()
                 print(f"✅ Server is running: {status_data.get('message', 'OK')}")
@@ -112,18 +357,198 @@ class FlashClient:
         except Exception as e:
             print(f"❌ Error checking server status: {str(e)}")
             return False
+    
+    def get_stats(self):
+        """Samples of the server's /metrics, {(name, labels): value}"""
+        response = self.session.get(f"{self.server_url}/metrics", timeout=5)
+        response.raise_for_status()
+        return parse_metrics(response.text)
+    
+    def show_stats(self):
+        """Print the server's queue, job outcomes and per-partition write speeds"""
+        try:
+            samples = self.get_stats()
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Could not read metrics of {self.server_url}: {e}")
+            return False
+        
+        def value(name, **labels):
+            return samples.get((name, tuple(sorted(labels.items()))), 0)
+        
+        print(f"{self.server_url}: {value('flash_proxy_jobs_queued'):.0f} queued, "
+              f"{value('flash_proxy_jobs_in_flight'):.0f} in flight, "
+              f"{value('flash_proxy_jobs_total', state='succeeded'):.0f} succeeded, "
+              f"{value('flash_proxy_jobs_total', state='failed'):.0f} failed, "
+              f"{format_bytes(value('flash_proxy_bytes_avoided_total'))} not rewritten")
+        partitions = sorted({dict(labels)['partition'] for (_, labels) in samples
+                             if dict(labels).get('partition')})
+        if not partitions:
+            return True
+        print(f"{'partition':<12}{'writes':>7}{'fails':>6}{'p50 (s)':>9}{'p90 (s)':>9}"
+              f"{'written':>11}{'last speed':>13}")
+        for partition in partitions:
+            buckets = [(float(dict(labels)['le']), count)
+                       for (name, labels), count in samples.items()
+                       if name == 'flash_proxy_partition_write_seconds_bucket'
+                       and dict(labels).get('partition') == partition]
+            print(f"{partition:<12}"
+                  f"{value('flash_proxy_partition_write_seconds_count', partition=partition):>7.0f}"
+                  f"{value('flash_proxy_partition_failures_total', partition=partition):>6.0f}"
+                  f"{histogram_quantile(0.5, buckets):>9.1f}{histogram_quantile(0.9, buckets):>9.1f}"
+                  f"{format_bytes(value('flash_proxy_partition_bytes_total', partition=partition)):>11}"
+                  f"{format_bytes(value('flash_proxy_partition_bytes_per_second', partition=partition)):>11}/s")
+        return True
+
+
+def read_fleet(path):
+    """Boards of a fleet file: a JSON list of {"server", "directory", "name"},
+    directory and name being optional"""
+    with open(path, 'r') as f:
+        boards = json.load(f)
+    for board in boards:
+        if 'server' not in board:
+            raise ValueError(f"Board without a server in {path}: {board}")
+    return boards
+
+
+def flash_board(client, directory, force=False, manifest=None, retries=FLEET_RETRIES,
+                upload=False):
+    """Flash one board of a fleet, retrying with backoff; return its summary row"""
+    start = time.time()
+    row = {'server': client.server_url, 'state': 'failed', 'attempts': 0,
+           'bytes_written': 0, 'bytes_avoided': 0, 'error': ''}
+    for attempt in range(retries + 1):
+        row['attempts'] = attempt + 1
+        if attempt:
+            time.sleep(min(60, 5 * 2 ** (attempt - 1)))
+        try:
+            if upload:
+                if client.upload(directory, manifest, verbose=False) is None:
+                    row['error'] = 'server has no upload API'
+                    break
+                job = client.start_flash(None, force, manifest, upload=True)
+            else:
+                job = client.start_flash(directory, force, manifest)
+            if job is None:
+                row['error'] = 'server has no job API'
+                break
+            if 'id' not in job:
+                row['error'] = job.get('error', str(job))
+                break
+            result = client.wait(job['id'])
+        except requests.exceptions.ConnectionError as e:
+            row['error'] = f"cannot reach {client.server_url}"
+            logger.warning(f"{client.server_url}: attempt {attempt + 1} failed: {e}")
+            continue
+        except (requests.exceptions.RequestException, ValueError) as e:
+            row['error'] = str(e)
+            logger.warning(f"{client.server_url}: attempt {attempt + 1} failed: {e}")
+            response = getattr(e, 'response', None)
+            if response is not None and 400 <= response.status_code < 500:
+                # Refused by the server, a retry would be refused too
+                break
+            continue
+        row.update(state=result['state'], bytes_written=result['bytes_written'],
+                   bytes_avoided=result.get('bytes_avoided', 0),
+                   error=result.get('stderr', '').strip().split('\n')[-1])
+        if result.get('success'):
+            break
+        logger.warning(f"{client.server_url}: flash failed: {row['error']}")
+    row['duration'] = time.time() - start
+    return row
+
+
+def flash_fleet(boards, directory=None, force=False, workers=FLEET_WORKERS,
+                retries=FLEET_RETRIES, upload=False):
+    """Flash every board of a fleet at once, each with its own directory or
+    the common one; return the summary rows in board order and the wall time"""
+    session = make_session(workers)
+    manifests = {}
+    jobs = []
+    for board in boards:
+        path = os.path.abspath(board.get('directory') or directory)
+        if path not in manifests:
+            # Boards sharing an image set share its hashes
+            manifests[path] = image_manifest(path)
+        jobs.append((board, path))
+
+    def run(job):
+        board, path = job
+        client = FlashClient(board['server'], session)
+        row = flash_board(client, path, force, manifests[path], retries, upload)
+        row['name'] = board.get('name', board['server'])
+        print(f"{'✅' if row['state'] == 'succeeded' else '❌'} {row['name']}: "
+              f"{row['state']} in {row['duration']:.1f}s", flush=True)
+        return row
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(run, jobs))
+    return rows, time.time() - start
+
+
+def print_fleet_summary(rows, wall_time):
+    width = max([len('board')] + [len(row['name']) for row in rows])
+    print(f"\n{'board':<{width}}  {'state':<10}{'attempts':>9}{'written':>11}"
+          f"{'skipped':>11}{'time (s)':>10}  error")
+    for row in rows:
+        print(f"{row['name']:<{width}}  {row['state']:<10}{row['attempts']:>9}"
+              f"{format_bytes(row['bytes_written']):>11}{format_bytes(row['bytes_avoided']):>11}"
+              f"{row['duration']:>10.1f}  {row['error'] if row['state'] != 'succeeded' else ''}")
+    ok = sum(row['state'] == 'succeeded' for row in rows)
+    print(f"{ok}/{len(rows)} boards flashed, wall time {wall_time:.1f}s")
 
 def main():
     """Main function"""
     parser = argparse.ArgumentParser(description='Flash Proxy HTTP Client')
-    parser.add_argument('directory_path', help='Directory path containing images to flash')
+    parser.add_argument('directory_path', nargs='?', help='Directory path containing images to flash')
     parser.add_argument('--server', default='http://localhost:8080', 
                        help='Server URL (default: http://localhost:8080)')
     parser.add_argument('--check-status', action='store_true', 
                        help='Check server status only')
+    parser.add_argument('--stats', action='store_true',
+                       help='Show flash metrics of the server (or of every --servers) only')
+    parser.add_argument('--attach', metavar='JOB_ID',
+                       help='Follow a running flash job instead of starting one')
+    parser.add_argument('--no-wait', action='store_true',
+                       help='Start the flash job and exit without following it')
+    parser.add_argument('--force', action='store_true',
+                       help='Flash every image, even those the server records as on the board')
+    parser.add_argument('--upload', action='store_true',
+                       help='Send the images to the server, which need not share this filesystem')
+    parser.add_argument('--servers', nargs='+', metavar='URL',
+                       help='Flash the directory to the boards of all these servers at once')
+    parser.add_argument('--fleet', metavar='FILE',
+                       help='JSON list of boards, {"server", "directory", "name"}, to flash at once')
+    parser.add_argument('--workers', type=int, default=FLEET_WORKERS,
+                       help=f'Boards flashed in parallel (default: {FLEET_WORKERS})')
+    parser.add_argument('--retries', type=int, default=FLEET_RETRIES,
+                       help=f'Retries of a failed board flash (default: {FLEET_RETRIES})')
     
     args = parser.parse_args()
     
+    if args.stats:
+        servers = args.servers or [args.server]
+        ok = [FlashClient(url).show_stats() for url in servers]
+        sys.exit(0 if all(ok) else 1)
+    
+    if args.servers or args.fleet:
+        boards = [{'server': url} for url in args.servers or []]
+        try:
+            boards += read_fleet(args.fleet) if args.fleet else []
+        except (OSError, ValueError) as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+        for board in boards:
+            path = board.get('directory') or args.directory_path
+            if not path or not os.path.isdir(path):
+                print(f"❌ Error: No image directory for {board['server']}: {path}")
+                sys.exit(1)
+        rows, wall_time = flash_fleet(boards, args.directory_path, args.force, args.workers,
+                                      args.retries, args.upload)
+        print_fleet_summary(rows, wall_time)
+        sys.exit(0 if all(row['state'] == 'succeeded' for row in rows) else 1)
+    
     # Create client
     client = FlashClient(args.server)
     
@@ -132,6 +557,11 @@ def main():
         client.check_server_status()
         return
     
+    if args.attach:
+        sys.exit(0 if client.attach(args.attach) else 1)
+    if args.directory_path is None:
+        parser.error('directory_path is required unless --check-status, --stats or --attach is given')
+    
     # Validate directory path
     if not os.path.exists(args.directory_path):
         print(f"❌ Error: Directory does not exist: {args.directory_path}")
@@ -142,7 +572,8 @@ def main():
         sys.exit(1)
     
     # Send flash request
-    success = client.send_flash_request(args.directory_path)
+    success = client.send_flash_request(args.directory_path, wait=not args.no_wait,
+                                       force=args.force, upload=args.upload)
     
     if success:
         sys.exit(0)
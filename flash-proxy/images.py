@@ -0,0 +1,140 @@
+"""
+Image manifests for delta flashing
+A manifest lists every image of a directory with the SHA-256 of the whole
+image and of each fixed-size chunk, so the proxy can tell which partitions,
+and which block ranges of them, differ from what is on the board. Uploads
+send the same chunks compressed, with zstd when the zstandard module is
+installed and zlib otherwise
+"""
+
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1 << 20
+# Content-Encoding values, preferred first
+CODECS = (['zstd'] if zstandard else []) + ['deflate', 'identity']
+
+
+def list_images(directory):
+    """(partition, path) of every image of a directory, boot.img -> boot"""
+    images = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            images.append((os.path.splitext(name)[0], path))
+    return images
+
+
+@contextlib.contextmanager
+def map_image(path):
+    """Read-only memoryview of an image, mapped rather than read into memory"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield memoryview(b'')
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+
+def chunk_at(view, index, chunk_size=CHUNK_SIZE):
+    """Zero-copy slice of chunk index of a mapped image"""
+    return view[index * chunk_size:(index + 1) * chunk_size]
+
+
+def hash_image(path, chunk_size=CHUNK_SIZE):
+    """SHA-256 of a whole image and of each of its chunks"""
+    whole = hashlib.sha256()
+    chunks = []
+    with map_image(path) as view:
+        for index in range(-(-len(view) // chunk_size)):
+            with chunk_at(view, index, chunk_size) as chunk:
+                whole.update(chunk)
+                chunks.append(hashlib.sha256(chunk).hexdigest())
+    return whole.hexdigest(), chunks
+
+
+def image_manifest(directory, chunk_size=CHUNK_SIZE):
+    """Manifest of the images of a directory"""
+    images = []
+    for partition, path in list_images(directory):
+        sha256, chunks = hash_image(path, chunk_size)
+        images.append({
+            'partition': partition,
+            'file': os.path.basename(path),
+            'size': os.path.getsize(path),
+            'sha256': sha256,
+            'chunks': chunks,
+        })
+    return {'chunk_size': chunk_size, 'images': images}
+
+
+def content_key(manifest):
+    """Hash of what a manifest would put on a board, independent of paths"""
+    content = sorted((image['partition'], image['size'], image['sha256'])
+                     for image in manifest['images'])
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+def idempotency_key(manifest, board):
+    """Key of flashing a manifest's images to one board: retries and
+    concurrent identical requests share it"""
+    return hashlib.sha256(f'{board}:{content_key(manifest)}'.encode()).hexdigest()
+
+
+def changed_ranges(image, record, chunk_size):
+    """(offset, length) byte ranges of an image that differ from the record of
+    what is on the board, adjacent chunks merged; None if only a full flash will do"""
+    if not record or record.get('chunk_size') != chunk_size or record.get('size') != image['size']:
+        return None
+    ranges = []
+    for i, (new, old) in enumerate(zip(image['chunks'], record['chunks'])):
+        if new == old:
+            continue
+        offset = i * chunk_size
+        length = min(chunk_size, image['size'] - offset)
+        if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == 'deflate':
+        return zlib.compress(data, 1)
+    return bytes(data)
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd chunks need the zstandard module')
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=CHUNK_SIZE << 4)
+    if codec == 'deflate':
+        return zlib.decompress(data)
+    if codec in ('identity', None):
+        return data
+    raise ValueError(f'Unknown chunk encoding {codec}')
@@ -0,0 +1,120 @@
+"""
+Flash proxy metrics in the Prometheus text format
+The server counts into a Metrics registry and serves it on /metrics; the
+client parses the same text for its --stats view
+"""
+
+import math
+import re
+import threading
+
+# Partition write durations, s
+WRITE_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+# Whole job durations, s
+JOB_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 1200)
+
+METRICS = {
+    'flash_proxy_jobs_queued': ('gauge', 'Flash jobs waiting for the board'),
+    'flash_proxy_jobs_in_flight': ('gauge', 'Flash jobs writing to the board'),
+    'flash_proxy_jobs_total': ('counter', 'Finished flash jobs by outcome'),
+    'flash_proxy_job_duration_seconds': ('histogram', 'Flash job wall time'),
+    'flash_proxy_partition_write_seconds': ('histogram', 'Time to write one partition'),
+    'flash_proxy_partition_bytes_total': ('counter', 'Bytes written to a partition'),
+    'flash_proxy_partition_bytes_per_second': ('gauge', 'Write speed of the last flash of a partition'),
+    'flash_proxy_partition_failures_total': ('counter', 'Failed writes of a partition'),
+    'flash_proxy_bytes_avoided_total': ('counter', 'Bytes not written because they were unchanged'),
+    'flash_proxy_upload_chunks_total': ('counter', 'Uploaded chunks stored'),
+    'flash_proxy_upload_bytes_total': ('counter', 'Uploaded chunk bytes, by raw or wire size'),
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+def _value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms keyed by name and labels"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.histograms = {}
+        self.buckets = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, buckets, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            counts, total, n = self.histograms.get(key, ([0] * len(buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, buckets)]
+            self.histograms[key] = (counts, total + value, n + 1)
+            self.buckets[name] = buckets
+
+    def render(self):
+        """Exposition text of every metric with at least one sample"""
+        with self.lock:
+            values = dict(self.values)
+            histograms = dict(self.histograms)
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            samples = []
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    samples.append(f'{name}{_labels(labels)} {_value(value)}')
+            for (metric, labels), (counts, total, n) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets[name], counts):
+                    samples.append(f'{name}_bucket{_labels(labels + (("le", f"{bound:g}"),))} {count}')
+                samples.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {n}')
+                samples.append(f'{name}_sum{_labels(labels)} {_value(total)}')
+                samples.append(f'{name}_count{_labels(labels)} {n}')
+            if samples:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'] + samples
+        return '\n'.join(lines) + '\n'
+
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text):
+    """{(name, ((label, value), ...)): value} of an exposition text"""
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line.strip())
+        if match:
+            name, labels, value = match.groups()
+            samples[(name, tuple(_LABEL.findall(labels or '')))] = float(value)
+    return samples
+
+
+def histogram_quantile(q, buckets):
+    """Quantile estimate from cumulative (upper bound, count) buckets, linear
+    within a bucket as Prometheus does"""
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] == 0:
+        return math.nan
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if math.isinf(bound):
+                return lower
+            return lower + (bound - lower) * (rank - below) / max(1, count - below)
+        lower, below = bound, count
+    return lower
@@ -0,0 +1,670 @@
+#!/usr/bin/env python3
+"""
+Reference flash-proxy server
+Flashes every image of a directory (boot.img -> partition boot, ...) on the
+board attached to this host, as background jobs with streamed progress
+
+    POST /                   flash and wait, reply {success, stdout, stderr, returncode}
+    POST /jobs               start a flash job, reply 202 {id, ...} at once
+    GET  /jobs/<id>          job state, per-partition progress and result
+    GET  /jobs/<id>/events   Server-Sent Events; resumes after Last-Event-ID
+    GET  /board              record of the images on the board
+    GET  /status             server status
+    GET  /metrics            queue, job and per-partition metrics, Prometheus text format
+    POST /chunks/missing     which of {hashes} the chunk store lacks
+    PUT  /chunks/<sha256>    store one chunk, compressed per Content-Encoding
+
+The proxy records the chunk hashes of every image it flashed, hashing the
+images itself rather than trusting a client's manifest (see images.py);
+partitions whose image is unchanged are skipped, and flashers that can
+write block ranges only write the chunks that changed. `force` flashes
+everything.
+
+Requests with the same idempotency key (derived from the image hashes and
+the board id, or given as an Idempotency-Key header) share one job: a
+request that arrives while an identical flash is queued or running attaches
+to it, and so does a retry after it succeeded, until another flash changes
+the board. A forced request only attaches to a forced flash still in progress.
+
+A client that does not share this host's filesystem uploads the chunks the
+store lacks and sends `upload: true` with the manifest instead of a
+directory; the images are then assembled from the store. Chunks are
+content-addressed, so an interrupted upload resumes with the chunks that
+are still missing.
+
+`--simulate DIR` writes images into DIR at a fixed throughput instead of
+calling the flash tool, so the protocol can be exercised without a board.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import queue
+import shlex
+import socket
+import subprocess
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from images import (CHUNK_SIZE, CODECS, changed_ranges, decompress, idempotency_key,
+                    image_manifest, list_images)
+from metrics import JOB_BUCKETS, WRITE_BUCKETS, Metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FLASH_COMMAND = 'upgrade_tool di -{partition} {image}'
+REBOOT_COMMAND = 'upgrade_tool rd'
+STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'board-state.json')
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+# Largest chunk body accepted, compressed or not
+MAX_CHUNK_BODY = 64 << 20
+# Minimum interval between two progress events of a partition, s
+PROGRESS_INTERVAL = 0.25
+# Finished jobs kept for status queries and reattaching clients
+MAX_FINISHED_JOBS = 100
+
+
+class BoardState:
+    """Chunk hashes of the image last flashed to each partition, kept on disk"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                self.partitions = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.partitions = {}
+
+    def get(self, partition):
+        with self.lock:
+            return self.partitions.get(partition)
+
+    def set(self, partition, record):
+        """Record a partition's content, None while it is being written"""
+        with self.lock:
+            if record is None:
+                self.partitions.pop(partition, None)
+            else:
+                self.partitions[partition] = record
+            tmp = f'{self.path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.partitions, f, indent=1)
+            os.replace(tmp, self.path)
+
+    def snapshot(self):
+        with self.lock:
+            return {name: {k: v for k, v in record.items() if k != 'chunks'}
+                    for name, record in self.partitions.items()}
+
+
+class ChunkStore:
+    """Uploaded image chunks by SHA-256, and the images assembled from them"""
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, 'chunks'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'images'), exist_ok=True)
+
+    def path(self, sha256):
+        return os.path.join(self.root, 'chunks', sha256[:2], sha256)
+
+    def missing(self, hashes):
+        return [h for h in dict.fromkeys(hashes) if not os.path.exists(self.path(h))]
+
+    def put(self, sha256, data):
+        """Store a chunk whose content matches its hash"""
+        if hashlib.sha256(data).hexdigest() != sha256:
+            raise ValueError(f'Chunk does not match its hash {sha256}')
+        path = self.path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def assemble(self, manifest):
+        """Directory holding the images of a manifest, written from stored chunks"""
+        key = hashlib.sha256(''.join(f"{image['file']}:{image['sha256']};"
+                                     for image in manifest['images']).encode()).hexdigest()
+        directory = os.path.join(self.root, 'images', key[:16])
+        os.makedirs(directory, exist_ok=True)
+        for image in manifest['images']:
+            path = os.path.join(directory, os.path.basename(image['file']))
+            if os.path.exists(path) and os.path.getsize(path) == image['size']:
+                continue
+            whole = hashlib.sha256()
+            with open(f'{path}.tmp', 'wb') as f:
+                for sha256 in image['chunks']:
+                    with open(self.path(sha256), 'rb') as chunk:
+                        data = chunk.read()
+                    whole.update(data)
+                    f.write(data)
+            if whole.hexdigest() != image['sha256']:
+                os.remove(f'{path}.tmp')
+                raise RuntimeError(f"Assembled {image['file']} does not match its hash")
+            os.replace(f'{path}.tmp', path)
+        return directory
+
+
+class FlashJob:
+    """One flash of a directory, with the events clients stream"""
+
+    def __init__(self, directory, manifest=None, force=False, key=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.directory = directory
+        self.manifest = manifest
+        self.force = force
+        self.key = key
+        self.requests = 1
+        self.state = 'queued'
+        self.partitions = []
+        self.stdout = []
+        self.stderr = []
+        self.returncode = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.events = []
+        self.cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.state in ('succeeded', 'failed')
+
+    def emit(self, kind, **data):
+        with self.cond:
+            self.events.append((len(self.events) + 1, kind, data))
+            self.cond.notify_all()
+
+    def events_after(self, last_id, timeout=15):
+        """Events newer than last_id, waiting up to timeout for one to arrive"""
+        with self.cond:
+            if len(self.events) <= last_id and not self.done:
+                self.cond.wait(timeout)
+            return self.events[last_id:]
+
+    def progress(self):
+        written = sum(p['written'] for p in self.partitions)
+        total = sum(p['write_size'] for p in self.partitions)
+        elapsed = (self.finished or time.time()) - self.started if self.started else 0
+        return {
+            'bytes_written': written,
+            'bytes_total': total,
+            'bytes_avoided': sum(p['size'] - p['write_size'] for p in self.partitions),
+            'throughput': written / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def summary(self):
+        return dict({
+            'id': self.id,
+            'idempotency_key': self.key,
+            'requests': self.requests,
+            'directory': self.directory,
+            'state': self.state,
+            'partitions': self.partitions,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'returncode': self.returncode,
+            'success': self.state == 'succeeded',
+            'stdout': '\n'.join(self.stdout),
+            'stderr': '\n'.join(self.stderr),
+            'last_event_id': len(self.events),
+        }, **self.progress())
+
+
+class CommandFlasher:
+    """Flashes through the vendor tool, one command per partition"""
+
+    # The tool writes whole partitions by name
+    block_writes = False
+
+    def __init__(self, flash_command=FLASH_COMMAND, reboot_command=REBOOT_COMMAND):
+        self.flash_command = flash_command
+        self.reboot_command = reboot_command
+
+    def _run(self, job, command):
+        proc = subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, text=True)
+        for line in proc.stdout:
+            line = line.rstrip('\n')
+            job.stdout.append(line)
+            job.emit('log', line=line)
+        return proc.wait()
+
+    def flash(self, job, partition, on_progress=None, ranges=None):
+        """The tool reports no byte counts, a partition completes at once"""
+        command = self.flash_command.format(partition=partition['name'],
+                                            image=shlex.quote(partition['path']))
+        rc = self._run(job, command)
+        if rc == 0:
+            partition['written'] = partition['write_size']
+            if on_progress:
+                on_progress()
+        return rc
+
+    def finish(self, job):
+        return self._run(job, self.reboot_command) if self.reboot_command else 0
+
+
+class SimulatedFlasher:
+    """Writes images into a directory standing in for the board's partitions"""
+
+    block_writes = True
+
+    def __init__(self, board_dir, throughput=20e6):
+        self.board_dir = board_dir
+        self.throughput = throughput
+        os.makedirs(board_dir, exist_ok=True)
+
+    def flash(self, job, partition, on_progress=None, ranges=None):
+        """Write the whole image, or only the given (offset, length) ranges"""
+        target = os.path.join(self.board_dir, partition['name'] + '.img')
+        if ranges is None or not os.path.exists(target):
+            ranges = [(0, partition['size'])]
+            partition['write_size'] = partition['size']
+            mode = 'wb'
+        else:
+            mode = 'r+b'
+        with open(partition['path'], 'rb') as src, open(target, mode) as dst:
+            for offset, length in ranges:
+                src.seek(offset)
+                dst.seek(offset)
+                while length > 0:
+                    chunk = src.read(min(CHUNK_SIZE, length))
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    time.sleep(len(chunk) / self.throughput)
+                    length -= len(chunk)
+                    partition['written'] += len(chunk)
+                    if on_progress:
+                        on_progress()
+        line = f"Download {partition['name']} ({partition['written']} bytes) ok"
+        job.stdout.append(line)
+        job.emit('log', line=line)
+        return 0
+
+    def finish(self, job):
+        job.stdout.append('Reset Device OK.')
+        return 0
+
+
+class JobManager:
+    """Runs flash jobs one at a time, a board can only take one flash"""
+
+    def __init__(self, flasher, board, store, metrics):
+        self.flasher = flasher
+        self.board = board
+        self.store = store
+        self.metrics = metrics
+        self.jobs = {}
+        # Idempotency key -> job, for jobs that describe the board's current content
+        self.keys = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, directory, manifest=None, force=False, key=None):
+        """Queue a flash, or return the job with the same key when it is queued,
+        running, or (unless forced) finished and still what is on the board.
+        A forced flash only joins a forced job that has not finished, and is
+        otherwise queued behind the job with its key.
+        Returns (job, whether it already existed)"""
+        with self.lock:
+            job = self.keys.get(key) if key else None
+            if job and job.state != 'failed' and (not force or job.force and not job.done):
+                job.requests += 1
+                logger.info(f"Job {job.id}: coalesced request {job.requests}")
+                return job, True
+            job = FlashJob(directory, manifest, force, key)
+            # Finished flashes no longer describe the board once another one starts
+            self.keys = {k: j for k, j in self.keys.items() if not j.done}
+            if key:
+                self.keys[key] = job
+            self.jobs[job.id] = job
+            finished = sorted((j for j in self.jobs.values() if j.done), key=lambda j: j.finished)
+            for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[old.id]
+        job.emit('state', state=job.state)
+        self.queue.put(job)
+        self.metrics.set('flash_proxy_jobs_queued', self.queue.qsize())
+        logger.info(f"Job {job.id}: flash {directory}")
+        return job, False
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def active(self):
+        with self.lock:
+            return sum(not job.done for job in self.jobs.values())
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            self.metrics.set('flash_proxy_jobs_queued', self.queue.qsize())
+            self.metrics.set('flash_proxy_jobs_in_flight', 1)
+            try:
+                self._run(job)
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.stderr.append(str(e))
+                job.returncode = job.returncode if job.returncode not in (None, 0) else 1
+            # Waiters on job.cond see the final state together with its done event
+            with self.lock, job.cond:
+                job.state = 'succeeded' if job.returncode == 0 else 'failed'
+                job.finished = time.time()
+                # This flash replaced whatever earlier finished jobs had written
+                self.keys = {k: j for k, j in self.keys.items() if not j.done or j is job}
+                job.emit('done', **job.summary())
+            self.metrics.set('flash_proxy_jobs_in_flight', 0)
+            self.metrics.inc('flash_proxy_jobs_total', state=job.state)
+            self.metrics.observe('flash_proxy_job_duration_seconds',
+                                 job.finished - job.created, JOB_BUCKETS)
+            logger.info(f"Job {job.id}: {job.state}")
+
+    def _plan(self, job):
+        """Partitions of a job, each with what has to be written to it"""
+        manifest = job.manifest or image_manifest(job.directory)
+        chunk_size = manifest['chunk_size']
+        paths = dict(list_images(job.directory))
+        partitions = []
+        for image in manifest['images']:
+            if image['partition'] not in paths:
+                raise RuntimeError(f"Image {image['file']} is not in {job.directory}")
+            record = None if job.force else self.board.get(image['partition'])
+            partition = {'name': image['partition'], 'path': paths[image['partition']],
+                         'size': image['size'], 'written': 0, 'state': 'pending'}
+            if record and record['sha256'] == image['sha256']:
+                partition.update(action='unchanged', write_size=0, ranges=[])
+            else:
+                ranges = changed_ranges(image, record, chunk_size) \
+                    if self.flasher.block_writes else None
+                if ranges is None:
+                    partition.update(action='full', write_size=image['size'], ranges=None)
+                else:
+                    partition.update(action='delta', ranges=ranges,
+                                     write_size=sum(length for _, length in ranges))
+            partitions.append((partition, dict(image, chunk_size=chunk_size, flashed=None)))
+        return partitions
+
+    def _run(self, job):
+        if job.directory is None:
+            job.emit('state', state='assembling')
+            job.directory = self.store.assemble(job.manifest)
+            # The uploaded manifest only names the chunks, the plan is built from the images
+            job.manifest = image_manifest(job.directory)
+        plan = self._plan(job)
+        job.partitions = [partition for partition, _ in plan]
+        if not job.partitions:
+            raise RuntimeError(f"No images in {job.directory}")
+        job.state = 'running'
+        job.started = time.time()
+        job.emit('state', state=job.state, partitions=[p['name'] for p in job.partitions])
+
+        for partition, record in plan:
+            if partition['action'] == 'unchanged':
+                partition['state'] = 'unchanged'
+                job.emit('partition', name=partition['name'], state='unchanged',
+                         size=partition['size'], action='unchanged', write_size=0)
+                continue
+            partition['state'] = 'flashing'
+            job.emit('partition', name=partition['name'], state='flashing', size=partition['size'],
+                     action=partition['action'], write_size=partition['write_size'])
+            # A partition interrupted mid-write has unknown content
+            self.board.set(partition['name'], None)
+            last = [0.0]
+
+            def on_progress(partition=partition, last=last):
+                now = time.time()
+                if now - last[0] >= PROGRESS_INTERVAL or \
+                        partition['written'] == partition['write_size']:
+                    last[0] = now
+                    job.emit('progress', partition=partition['name'], written=partition['written'],
+                             size=partition['write_size'], **job.progress())
+
+            start = time.time()
+            rc = self.flasher.flash(job, partition, on_progress, partition['ranges'])
+            self._count_write(partition, rc, time.time() - start)
+            partition['state'] = 'done' if rc == 0 else 'failed'
+            job.emit('partition', name=partition['name'], state=partition['state'],
+                     size=partition['size'], action=partition['action'],
+                     write_size=partition['write_size'])
+            if rc != 0:
+                job.returncode = rc
+                return
+            record['flashed'] = time.time()
+            self.board.set(partition['name'], record)
+        avoided = job.progress()['bytes_avoided']
+        self.metrics.inc('flash_proxy_bytes_avoided_total', avoided)
+        logger.info(f"Job {job.id}: avoided writing {avoided} bytes")
+        job.returncode = self.flasher.finish(job)
+
+    def _count_write(self, partition, rc, seconds):
+        name = partition['name']
+        if rc != 0:
+            self.metrics.inc('flash_proxy_partition_failures_total', partition=name)
+            return
+        self.metrics.observe('flash_proxy_partition_write_seconds', seconds, WRITE_BUCKETS,
+                             partition=name)
+        self.metrics.inc('flash_proxy_partition_bytes_total', partition['written'], partition=name)
+        if seconds > 0:
+            self.metrics.set('flash_proxy_partition_bytes_per_second',
+                             round(partition['written'] / seconds), partition=name)
+
+
+class FlashHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled clients reuse connections across chunks and polls
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _json(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def _read_request(self):
+        """Body of a flash request, None after replying with an error"""
+        request = self._read_json()
+        if request.get('upload'):
+            manifest = request.get('manifest')
+            if not manifest:
+                self._json(400, {'error': 'An upload needs a manifest'})
+                return None
+            missing = self.server.store.missing(
+                h for image in manifest['images'] for h in image['chunks'])
+            if missing:
+                self._json(409, {'error': f'{len(missing)} chunks not uploaded',
+                                 'missing': missing})
+                return None
+            request['directory_path'] = None
+            return request
+        directory = request.get('directory_path')
+        if not directory or not os.path.isdir(directory):
+            self._json(400, {'error': f'Not a directory: {directory}'})
+            return None
+        # Hashed here rather than taken from the client, since the board record
+        # and the idempotency key are built from it
+        request['manifest'] = image_manifest(directory)
+        return request
+
+    def _submit(self, request):
+        key = self.headers.get('Idempotency-Key') or \
+            idempotency_key(request['manifest'], self.server.board_id)
+        return self.server.manager.submit(request['directory_path'], request['manifest'],
+                                          request.get('force', False), key)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        manager = self.server.manager
+        if parts == ['board']:
+            return self._json(200, self.server.board.snapshot())
+        if parts == ['metrics']:
+            data = self.server.metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if parts == ['status']:
+            return self._json(200, {'message': 'Flash proxy is running',
+                                    'board': self.server.board_id,
+                                    'active_jobs': manager.active()})
+        if len(parts) >= 2 and parts[0] == 'jobs':
+            job = manager.get(parts[1])
+            if job is None:
+                return self._json(404, {'error': f'Unknown job {parts[1]}'})
+            if len(parts) == 2:
+                return self._json(200, job.summary())
+            if parts[2:] == ['events']:
+                after = self.headers.get('Last-Event-ID') or \
+                    parse_qs(url.query).get('after', ['0'])[0]
+                return self._stream(job, int(after) if after.isdigit() else 0)
+        self._json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip('/')
+        if path == '/chunks/missing':
+            hashes = self._read_json().get('hashes', [])
+            return self._json(200, {'missing': self.server.store.missing(hashes),
+                                    'codecs': CODECS})
+        if path == '/jobs':
+            request = self._read_request()
+            if request:
+                job, coalesced = self._submit(request)
+                self._json(200 if coalesced else 202,
+                           dict(job.summary(), coalesced=coalesced, status_url=f'/jobs/{job.id}',
+                                events_url=f'/jobs/{job.id}/events'))
+            return
+        if path == '':
+            # Blocking request of the original protocol
+            request = self._read_request()
+            if request:
+                job, _ = self._submit(request)
+                while not job.done:
+                    job.events_after(len(job.events))
+                self._json(200, job.summary())
+            return
+        self._json(404, {'error': 'Not found'})
+
+    def do_PUT(self):
+        parts = [p for p in urlparse(self.path).path.split('/') if p]
+        if len(parts) != 2 or parts[0] != 'chunks':
+            return self._json(404, {'error': 'Not found'})
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_CHUNK_BODY:
+            return self._json(413, {'error': f'Chunk body over {MAX_CHUNK_BODY} bytes'})
+        body = self.rfile.read(length)
+        store = self.server.store
+        if os.path.exists(store.path(parts[1])):
+            return self._json(200, {'stored': False})
+        try:
+            data = decompress(body, self.headers.get('Content-Encoding'))
+            store.put(parts[1], data)
+        except (ValueError, zlib.error) as e:
+            return self._json(400, {'error': str(e)})
+        self.server.metrics.inc('flash_proxy_upload_chunks_total')
+        self.server.metrics.inc('flash_proxy_upload_bytes_total', len(data), size='raw')
+        self.server.metrics.inc('flash_proxy_upload_bytes_total', len(body), size='wire')
+        self._json(201, {'stored': True})
+
+    def _stream(self, job, last_id):
+        """Replay the events after last_id, then follow the job until it is done"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        # The stream has no length, it ends when the connection closes
+        self.send_header('Connection', 'close')
+        self.close_connection = True
+        self.end_headers()
+        try:
+            while True:
+                events = job.events_after(last_id)
+                for event_id, kind, data in events:
+                    self.wfile.write(f'id: {event_id}\nevent: {kind}\n'
+                                     f'data: {json.dumps(data)}\n\n'.encode())
+                    last_id = event_id
+                if not events:
+                    # Keeps proxies and idle clients from dropping the stream
+                    self.wfile.write(b': keep-alive\n\n')
+                self.wfile.flush()
+                if job.done and last_id >= len(job.events):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def make_server(host, port, flasher, state_file=STATE_FILE, store_dir=STORE_DIR, board_id=None):
+    server = ThreadingHTTPServer((host, port), FlashHandler)
+    server.daemon_threads = True
+    server.board_id = board_id or f'{socket.gethostname()}:{port}'
+    server.board = BoardState(state_file)
+    server.store = ChunkStore(store_dir)
+    server.metrics = Metrics()
+    server.manager = JobManager(flasher, server.board, server.store, server.metrics)
+    return server
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Flash Proxy HTTP Server')
+    parser.add_argument('--host', default='0.0.0.0', help='Listen address (default: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=8080, help='Listen port (default: 8080)')
+    parser.add_argument('--flash-command', default=FLASH_COMMAND,
+                        help=f'Command per image (default: "{FLASH_COMMAND}")')
+    parser.add_argument('--reboot-command', default=REBOOT_COMMAND,
+                        help=f'Command after the last image (default: "{REBOOT_COMMAND}")')
+    parser.add_argument('--simulate', metavar='DIR',
+                        help='Write images into DIR instead of flashing a board')
+    parser.add_argument('--throughput', type=float, default=20e6,
+                        help='Simulated write speed in bytes/s (default: 20e6)')
+    parser.add_argument('--state', default=STATE_FILE,
+                        help='Record of the images on the board (default: board-state.json '
+                             'next to this script); delete it after flashing by other means')
+    parser.add_argument('--board-id',
+                        help='Name of the attached board in idempotency keys (default: host:port)')
+    parser.add_argument('--store', default=STORE_DIR,
+                        help='Directory for uploaded chunks and images (default: uploads/ '
+                             'next to this script)')
+
+    args = parser.parse_args()
+
+    if args.simulate:
+        flasher = SimulatedFlasher(args.simulate, args.throughput)
+    else:
+        flasher = CommandFlasher(args.flash_command, args.reboot_command)
+    server = make_server(args.host, args.port, flasher, args.state, args.store,
+                         args.board_id)
+    print(f"✅ Flash proxy listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
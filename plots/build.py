@@ -0,0 +1,148 @@
+#!/bin/python
+"""
+Build every figure in a process pool
+
+A figure is only rebuilt when its input result files or its code changed since
+the last build; its printed analysis is replayed from the previous build.
+
+    python3 plots                       # all figures, PDF at 1000 dpi
+    python3 plots figure14 --preview    # low-dpi PNG for iterating
+"""
+
+import argparse
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from common import load_results
+from results_store import SIDECARS, sidecar_path
+
+PLOT_DIR = os.path.dirname(os.path.realpath(__file__))
+FIGURES = ["figure10", "figure11", "figure14", "token_latency", "prefill_timeline"]
+# Modules every figure depends on besides its own script
+SHARED_CODE = ["common.py", "stats.py", "results_store.py", "tokens.py", "prefill_trace.py",
+               os.path.join("..", "scripts", "workload.py")]
+STATE_FILE = os.path.join(PLOT_DIR, ".build-state.json")
+PREVIEW_DPI = 100
+
+
+def code_hash(figure):
+    digest = hashlib.sha256()
+    for filename in [figure + ".py"] + SHARED_CODE:
+        with open(os.path.join(PLOT_DIR, filename), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def input_files(results, selections):
+    """Result files matched by any of a figure's selections, and their sidecars"""
+    selected = np.zeros(len(results), dtype=bool)
+    for selection in selections:
+        selected |= results.mask(**selection)
+    files = [results.files[i] for i in np.flatnonzero(selected)]
+    for path, _, _ in list(files):
+        for kind in SIDECARS:
+            try:
+                stat = os.stat(sidecar_path(path, kind))
+            except FileNotFoundError:
+                continue
+            files.append((sidecar_path(path, kind), stat.st_mtime, stat.st_size))
+    return sorted(files)
+
+
+def input_hash(files):
+    return hashlib.sha256(json.dumps(files).encode()).hexdigest()
+
+
+def build_figure(figure, name, fmt, dpi):
+    """Render one figure, return what it printed"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        importlib.import_module(figure).main(name, fmt, dpi)
+    return output.getvalue()
+
+
+def load_state():
+    try:
+        with open(STATE_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(state):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, STATE_FILE)
+
+
+def build(figures, preview=False, force=False, jobs=None, results=None):
+    """Rebuild the figures whose inputs changed, return {figure: printed output}"""
+    fmt, dpi = ("png", PREVIEW_DPI) if preview else ("pdf", 1000)
+    results = results if results is not None else load_results()
+    state = load_state()
+
+    todo = {}
+    outputs = {}
+    for figure in figures:
+        name = os.path.join(PLOT_DIR, figure)
+        key = f"{figure}.{fmt}"
+        entry = {
+            "inputs": input_hash(input_files(results, importlib.import_module(figure).SELECTIONS)),
+            "code": code_hash(figure),
+            "dpi": dpi,
+        }
+        previous = state.get(key, {})
+        if not force and os.path.exists(f"{name}.{fmt}") and \
+                all(previous.get(k) == v for k, v in entry.items()):
+            outputs[figure] = previous.get("stdout", "")
+            print(f"{figure}: up to date")
+            continue
+        todo[figure] = (key, entry, name)
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs or min(len(todo), os.cpu_count())) as pool:
+            futures = {figure: pool.submit(build_figure, figure, name, fmt, dpi)
+                       for figure, (_, _, name) in todo.items()}
+            for figure, future in futures.items():
+                key, entry, name = todo[figure]
+                outputs[figure] = future.result()
+                state[key] = dict(entry, stdout=outputs[figure])
+                print(f"{figure}: built {name}.{fmt}")
+        save_state(state)
+
+    return outputs
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Build the result figures")
+    parser.add_argument("figures", nargs="*", metavar="figure",
+                        help=f"Figures to build: {', '.join(FIGURES)} (default: all)")
+    parser.add_argument("--preview", action="store_true",
+                        help=f"Render PNG at {PREVIEW_DPI} dpi instead of PDF at 1000 dpi")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if up to date")
+    parser.add_argument("--jobs", type=int, help="Worker processes (default: one per figure)")
+    args = parser.parse_args()
+    figures = args.figures or FIGURES
+    for figure in figures:
+        if figure not in FIGURES:
+            parser.error(f"unknown figure {figure}")
+
+    outputs = build(figures, args.preview, args.force, args.jobs)
+    for figure in figures:
+        if outputs.get(figure):
+            print(f"\n=== {figure} ===")
+            sys.stdout.write(outputs[figure])
+
+
+if __name__ == "__main__":
+    main()
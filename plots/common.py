@@ -1,6 +1,17 @@
 import os
+import json
+import sys
+from collections import namedtuple
+
+import numpy as np
 import matplotlib.font_manager as fm
 
+from results_store import AXES, RESULTS_DIR, STORED_METRICS, ResultsStore
+
+# Benchmark workloads and the names of their samples come from scripts/workload.py
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+from workload import load_workload, manifest_path, sampling
+
 
 # font = fm.FontProperties(fname = '/usr/local/share/fonts/Helvetica.ttc')
 
@@ -42,11 +53,11 @@ def adjust_ax_style(ax, disable=True):
     ax.yaxis.grid(color='black', linestyle=(0, (5, 10)), linewidth=0.1, zorder=0)
 
 
-def save_figure(fig, name):
+def save_figure(fig, name, fmt="pdf", dpi=1000):
     fig.savefig(
-        name + ".pdf",
-        dpi=1000,
-        format="pdf",
+        name + "." + fmt,
+        dpi=dpi,
+        format=fmt,
         bbox_inches="tight",
     )
     # fig.savefig(
@@ -55,3 +66,112 @@ def save_figure(fig, name):
     #     format="eps",
     #     bbox_inches="tight",
     # )
+
+
+RunKey = namedtuple("RunKey", AXES + ["repetition"])
+
+
+class Results:
+    """Parsed result files as NumPy columns, one entry per run"""
+
+    def __init__(self, rows):
+        self._build(rows)
+
+    def _build(self, rows):
+        """Index every run of rows from scratch"""
+        self.keys = [RunKey(*(row[axis] for axis in RunKey._fields)) for row in rows]
+        # (path, mtime, size) of the result file behind every run
+        self.files = [(row["path"], row["timestamp"], row["size"]) for row in rows]
+        self.axes = {axis: np.array([getattr(key, axis) for key in self.keys])
+                     for axis in RunKey._fields}
+        self._rows = rows
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, rows):
+        """Add runs of result files that just landed, replacing older runs of the same files"""
+        rows = list(rows)
+        paths = {row["path"] for row in rows}
+        if not len(self) or any(path in paths for path, _, _ in self.files):
+            self._build([row for row in self._rows if row["path"] not in paths] + rows)
+            return
+        new = Results(rows)
+        self.keys += new.keys
+        self.files += new.files
+        self._rows = self._rows + rows
+        self.axes = {axis: np.concatenate([self.axes[axis], new.axes[axis]]) for axis in self.axes}
+        self._columns = {metric: np.concatenate([column, new.column(metric)])
+                         for metric, column in self._columns.items()}
+
+    def column(self, metric):
+        """Values of a metric for every run, NaN where it was not reported"""
+        if metric not in self._columns:
+            if metric in STORED_METRICS:
+                values = [row[metric] for row in self._rows]
+            else:
+                values = [json.loads(row["metrics"]).get(metric) for row in self._rows]
+            self._columns[metric] = np.array(
+                [value if isinstance(value, float) else np.nan for value in values], dtype=float)
+        return self._columns[metric]
+
+    def mask(self, **axes):
+        """Runs matching the given axes, each a value or a list of values"""
+        selected = np.ones(len(self), dtype=bool)
+        for axis, value in axes.items():
+            values = value if isinstance(value, (list, tuple, set, range)) else [value]
+            selected &= np.isin(self.axes[axis], list(values))
+        return selected
+
+    def get(self, metric, **axes):
+        values = self.column(metric)[self.mask(**axes)]
+        return values[~np.isnan(values)]
+
+    def paths(self, **axes):
+        """Result files of the matching runs"""
+        return [self.files[i][0] for i in np.flatnonzero(self.mask(**axes))]
+
+    def grouped(self, metric, by, **axes):
+        """Metric values of the matching runs, grouped by one axis"""
+        selected = self.mask(**axes)
+        values = self.column(metric)
+        groups = {}
+        for group in np.unique(self.axes[by][selected]):
+            group_values = values[selected & (self.axes[by] == group)]
+            groups[group.item()] = group_values[~np.isnan(group_values)]
+        return groups
+
+    def mean(self, metric, **axes):
+        """Mean over repetitions, or None when no run matches"""
+        values = self.get(metric, **axes)
+        return float(values.mean()) if len(values) else None
+
+
+def load_results(results_dir=RESULTS_DIR, db_path=None):
+    """Load every result file of a directory
+
+    Parsed results are cached in the results store, keyed on path, mtime and size,
+    so only new or changed files are read again.
+    """
+    store = ResultsStore(db_path or os.path.join(results_dir, "results.db"))
+    try:
+        return Results(store.sync(results_dir))
+    finally:
+        store.close()
+
+
+def workload_prompts(name, results_dir=RESULTS_DIR, size=None):
+    """Prompt values of a benchmark workload: the prompts built into the binaries
+    that its spec lists, or the sample of size prompts (default: the spec's)
+    that scripts/workload.py drew from its dataset with the spec's seed"""
+    spec = load_workload(name)
+    if "prompts" in spec:
+        return list(spec["prompts"])[:size] if size else list(spec["prompts"])
+    size, seed = sampling(spec, size)
+    try:
+        with open(manifest_path(name, size, seed, os.path.join(results_dir, "workloads")), "r") as f:
+            return list(json.load(f)["prompts"])
+    except FileNotFoundError:
+        raise ValueError(f"workload {name} has no sample of {size} prompts yet, draw it with "
+                         f"scripts/workload.py resolve {name} --size {size}")
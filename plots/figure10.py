@@ -6,9 +6,9 @@ import os
 import matplotlib as mpl
 import matplotlib.gridspec as gridspec
 from matplotlib import rc
-import re
 
 from common import *
+from stats import bootstrap_ci, format_ci, geometric_mean_change, paired_ratios
 
 
 fontsize = 11
@@ -37,39 +37,39 @@ models = [LLAMA_3_8B]
 setups = [BASE_FLASH, TZ_LLM_STRESS, STRAWMAN]
 benchmarks = [ULTRA, DROIDTASK]
 
-def read_ttft_data(prefix):
+# Prompts of each benchmark, by workload name (scripts/workloads)
+benchmark_prompts = {
+    ULTRA: workload_prompts("uc"),  # 5-9
+    PERSONA: workload_prompts("pc"),  # 10-14
+    DROIDTASK: workload_prompts("dt"),  # 15-17
+}
+
+# Result files the figure is built from
+SELECTIONS = [
+    dict(setup=["base", "tz", "strawman"], stress="s", cache=0, model="llama", n_tokens=1,
+         prompt=[p for b in benchmarks for p in benchmark_prompts[b]]),
+]
+
+def read_ttft_data(results, prefix):
     """Read TTFT data from result files and compute averages for given prefix"""
-    results_dir = os.path.join(os.path.dirname(__file__), '..', 'results')
-    
-    # File ranges for each benchmark
-    ultra_files = [f"{prefix}-s-0-{i}-llama-1.txt" for i in range(5, 10)]  # 5-9
-    persona_files = [f"{prefix}-s-0-{i}-llama-1.txt" for i in range(10, 15)]  # 10-14
-    droidtask_files = [f"{prefix}-s-0-{i}-llama-1.txt" for i in range(15, 18)]  # 15-17
-    
-    def read_files_data(file_list):
+    def read_prompts_data(prompts):
+        per_prompt = results.grouped('ttft', 'prompt', setup=prefix, stress='s', cache=0,
+                                     model='llama', n_tokens=1, prompt=prompts)
         ttft_values = []
-        for filename in file_list:
-            filepath = os.path.join(results_dir, filename)
-            try:
-                with open(filepath, 'r') as f:
-                    content = f.read().strip()
-                    # Extract TTFT value using regex
-                    match = re.search(r'ttft: ([0-9.]+)', content)
-                    if match:
-                        ttft_values.append(float(match.group(1)))
-                    else:
-                        print(f"Warning: Could not parse TTFT from {filename}")
-            except FileNotFoundError:
-                print(f"Warning: File {filename} not found")
-            except Exception as e:
-                print(f"Error reading {filename}: {e}")
-        
+        for prompt in prompts:
+            values = per_prompt.get(prompt)
+            if values is None or len(values) == 0:
+                print(f"Warning: File {prefix}-s-0-{prompt}-llama-1.txt not found")
+                continue
+            # One value per prompt, averaged over repetitions
+            ttft_values.append(float(values.mean()))
+
         average = sum(ttft_values) / len(ttft_values) if ttft_values else 0
         return average, ttft_values
     
     # Compute averages and collect all values
-    ultra_avg, ultra_values = read_files_data(ultra_files)
-    droidtask_avg, droidtask_values = read_files_data(droidtask_files)
+    ultra_avg, ultra_values = read_prompts_data(benchmark_prompts[ULTRA])
+    droidtask_avg, droidtask_values = read_prompts_data(benchmark_prompts[DROIDTASK])
     
     # print(f"{prefix.upper()} averages - ULTRA: {ultra_avg:.2f}, DROIDTASK: {droidtask_avg:.2f}")
     
@@ -81,52 +81,45 @@ def read_ttft_data(prefix):
         DROIDTASK: droidtask_values
     }
 
-def read_tz_ttft_data():
+def read_tz_ttft_data(results):
     """Read TZ_LLM_STRESS data from result files"""
-    return read_ttft_data("tz")
+    return read_ttft_data(results, "tz")
 
-def read_base_ttft_data():
+def read_base_ttft_data(results):
     """Read BASE_FLASH data from result files"""
-    return read_ttft_data("base")
+    return read_ttft_data(results, "base")
 
-def read_strawman_ttft_data():
+def read_strawman_ttft_data(results):
     """Read STRAWMAN data from result files"""
-    return read_ttft_data("strawman")
-
-# Read data from files for both TZ and BASE setups
-tz_llm_stress_data, tz_llm_stress_values = read_tz_ttft_data()
-base_flash_data, base_flash_values = read_base_ttft_data()
-strawman_data, strawman_values = read_strawman_ttft_data()
-
-# Data with dynamic reading for BASE_FLASH and TZ_LLM_STRESS, hard-coded for STRAWMAN
-data = {
-    LLAMA_3_8B: {
-        BASE_FLASH: base_flash_data,  # dynamically read from base-s-0-*-llama-1.txt files
-        TZ_LLM_STRESS: tz_llm_stress_data,  # dynamically read from tz-s-0-*-llama-1.txt files
-        STRAWMAN: strawman_data,  # dynamically read from strawman-s-0-*-llama-1.txt files
-    },
-}
+    return read_ttft_data(results, "strawman")
+
+def load_data(results):
+    """Return the averages and the individual values of every setup"""
+    # Read data from files for both TZ and BASE setups
+    tz_llm_stress_data, tz_llm_stress_values = read_tz_ttft_data(results)
+    base_flash_data, base_flash_values = read_base_ttft_data(results)
+    strawman_data, strawman_values = read_strawman_ttft_data(results)
+
+    # Data with dynamic reading for BASE_FLASH and TZ_LLM_STRESS, hard-coded for STRAWMAN
+    data = {
+        LLAMA_3_8B: {
+            BASE_FLASH: base_flash_data,  # dynamically read from base-s-0-*-llama-1.txt files
+            TZ_LLM_STRESS: tz_llm_stress_data,  # dynamically read from tz-s-0-*-llama-1.txt files
+            STRAWMAN: strawman_data,  # dynamically read from strawman-s-0-*-llama-1.txt files
+        },
+    }
 
-# Individual values for geometric mean calculations
-individual_values = {
-    LLAMA_3_8B: {
-        BASE_FLASH: base_flash_values,
-        TZ_LLM_STRESS: tz_llm_stress_values,
-        STRAWMAN: strawman_values,
-    },
-}
+    # Individual values for geometric mean calculations
+    individual_values = {
+        LLAMA_3_8B: {
+            BASE_FLASH: base_flash_values,
+            TZ_LLM_STRESS: tz_llm_stress_values,
+            STRAWMAN: strawman_values,
+        },
+    }
+    return data, individual_values
 
-def geometric_mean(values):
-    """Calculate geometric mean without scipy"""
-    if not values or any(v <= 0 for v in values):
-        return 0
-    n = len(values)
-    product = 1
-    for v in values:
-        product *= v
-    return product ** (1.0 / n)
-
-def calculate_reduction_and_overhead():
+def calculate_reduction_and_overhead(individual_values):
     """Calculate TTFT reduction and overhead using geometric means"""
     model = LLAMA_3_8B
     
@@ -137,6 +130,9 @@ def calculate_reduction_and_overhead():
     # Calculate reductions (TZ_LLM_STRESS vs STRAWMAN) and overhead (TZ_LLM_STRESS vs BASE_FLASH)
     reductions = {}  # TZ_LLM_STRESS vs STRAWMAN
     overheads = {}   # TZ_LLM_STRESS vs BASE_FLASH
+    # Bootstrap (estimate, low, high) of the geometric means, resampling prompts
+    reduction_cis = {}
+    overhead_cis = {}
     
     for benchmark in benchmarks:
         tz_values = individual_values[model][TZ_LLM_STRESS][benchmark]
@@ -147,36 +143,18 @@ def calculate_reduction_and_overhead():
             print(f"Warning: Missing data for {benchmark}")
             continue
             
-        # Calculate point-wise reductions and overheads
-        point_reductions = []
-        point_overheads = []
+        # Point-wise reductions (TZ vs STRAWMAN) and overheads (TZ vs BASE)
+        point_reductions = 1 - paired_ratios(tz_values, strawman_values)
+        point_overheads = paired_ratios(tz_values, base_values) - 1
         
-        # For reduction calculation (TZ vs STRAWMAN)
-        min_len_reduction = min(len(tz_values), len(strawman_values))
-        for i in range(min_len_reduction):
-            if strawman_values[i] > 0:
-                reduction = (strawman_values[i] - tz_values[i]) / strawman_values[i]
-                point_reductions.append(reduction)
+        # Geometric means of (1 + change), minus 1, to handle negative changes
+        if len(point_reductions):
+            reduction_cis[benchmark] = bootstrap_ci(point_reductions, geometric_mean_change)
+            reductions[benchmark] = reduction_cis[benchmark][0]
         
-        # For overhead calculation (TZ vs BASE)
-        min_len_overhead = min(len(tz_values), len(base_values))
-        for i in range(min_len_overhead):
-            if base_values[i] > 0:
-                overhead = (tz_values[i] - base_values[i]) / base_values[i]
-                point_overheads.append(overhead)
-        
-        # Calculate geometric means
-        if point_reductions:
-            # Convert to positive values for geometric mean (add 1 to handle negative reductions)
-            positive_reductions = [r + 1 for r in point_reductions]
-            geom_mean_reduction = geometric_mean(positive_reductions) - 1
-            reductions[benchmark] = geom_mean_reduction
-        
-        if point_overheads:
-            # Convert to positive values for geometric mean (add 1 to handle negative overheads)
-            positive_overheads = [o + 1 for o in point_overheads]
-            geom_mean_overhead = geometric_mean(positive_overheads) - 1
-            overheads[benchmark] = geom_mean_overhead
+        if len(point_overheads):
+            overhead_cis[benchmark] = bootstrap_ci(point_overheads, geometric_mean_change)
+            overheads[benchmark] = overhead_cis[benchmark][0]
         
         # print(f"\n{benchmark}:")
         # print(f"  {TZ_LLM_STRESS} vs {STRAWMAN} reduction (geometric mean): {reductions.get(benchmark, 0)*100:.2f}%")
@@ -198,13 +176,16 @@ def calculate_reduction_and_overhead():
     print("SUMMARY:")
     print(f"TTFT reduction ({TZ_LLM_STRESS} vs {STRAWMAN}): {min_reduction*100:.2f}% ~ {max_reduction*100:.2f}%")
     print(f"TTFT overhead ({TZ_LLM_STRESS} vs {BASE_FLASH}): {min_overhead*100:.2f}% ~ {max_overhead*100:.2f}%")
+    print("95% confidence intervals:")
+    for benchmark in benchmarks:
+        if benchmark in reduction_cis:
+            print(f"  {benchmark} reduction: {format_ci(*reduction_cis[benchmark])}")
+        if benchmark in overhead_cis:
+            print(f"  {benchmark} overhead:  {format_ci(*overhead_cis[benchmark])}")
     print("-"*60)
     
     return reductions, overheads
 
-# Calculate and print reduction and overhead analysis
-calculate_reduction_and_overhead()
-
 colors = {
     BASE_FLASH: "#6BAED6",
     TZ_LLM_STRESS: "#2171B5",
@@ -220,7 +201,7 @@ yticks_top = {
 }
 
 
-def plot(fig, ax):
+def plot(fig, ax, data):
     # Single subplot for Llama-3-8B only
     model = LLAMA_3_8B
     
@@ -318,16 +299,26 @@ def plot(fig, ax):
     )
 
 
-if __name__ == "__main__":
+def main(name=os.path.splitext(__file__)[0], fmt="pdf", dpi=1000, results=None):
+    data, individual_values = load_data(results if results is not None else load_results())
+
+    # Calculate and print reduction and overhead analysis
+    calculate_reduction_and_overhead(individual_values)
+
     plt.rcParams["lines.markersize"] = 3
     plt.rcParams["font.family"] = 'sans-serif'
 
     fig = plt.figure(constrained_layout=False)
 
-    plot(fig, None)
+    plot(fig, None, data)
 
     # Adjust figure size for single subplot
     fig.set_size_inches(get_figsize(latex_col, wf=0.8, hf=0.12 * 4))  # Smaller size for single subplot
     fig.subplots_adjust(top=0.85)  # Leave space for legend
 
-    save_figure(fig, os.path.splitext(__file__)[0])
+    save_figure(fig, name, fmt, dpi)
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    main()
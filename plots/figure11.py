@@ -3,9 +3,9 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import os
-import re
 import matplotlib as mpl
 from common import *
+from stats import bootstrap_ratio_ci
 
 fontsize = 15
 latex_col = 241.02039  ## pt
@@ -34,59 +34,42 @@ TZ_LLM = "TZ-LLM"
 models = [QWEN25_3B, LLAMA_3_8B]
 setups = [BASE, TZ_LLM, STRAWMAN]
 
-def read_data_from_files(prefix):
-    """Read data from results directory files with given prefix"""
-    results_dir = os.path.join(os.path.dirname(__file__), '..', 'results')
-    
-    # Model name mapping for file names
-    model_file_map = {
-        QWEN25_3B: 'qwen',
-        LLAMA_3_8B: 'llama'
-    }
-    
-    data = []
+# Model name mapping for file names
+model_file_map = {
+    QWEN25_3B: 'qwen',
+    LLAMA_3_8B: 'llama'
+}
+
+SETUP_PREFIX = {'strawman': STRAWMAN, 'base': BASE, 'tz': TZ_LLM}
+
+# Result files the figure is built from
+SELECTIONS = [
+    dict(setup=list(SETUP_PREFIX), stress='s', cache=5, prompt=128,
+         model=[model_file_map[model] for model in models], n_tokens=64),
+]
+
+def read_runs_from_files(results, prefix):
+    """Read decoding speed of every repetition, per model, for given prefix"""
+    model_runs = []
     for model in models:
         file_model = model_file_map[model]
-        filename = f'{prefix}-s-5-128-{file_model}-64.txt'
-        filepath = os.path.join(results_dir, filename)
-        
-        try:
-            with open(filepath, 'r') as f:
-                content = f.read().strip()
-                # Extract decoding_thpt value using regex
-                match = re.search(r'decoding_thpt: ([0-9.]+)', content)
-                if match:
-                    data.append(float(match.group(1)))
-                else:
-                    print(f"Warning: Could not parse decoding_thpt from {filename}")
-                    data.append(0.0)
-        except FileNotFoundError:
-            print(f"Warning: File {filename} not found")
-            data.append(0.0)
-        except Exception as e:
-            print(f"Error reading {filename}: {e}")
-            data.append(0.0)
+        thpt = results.get('decoding_thpt', setup=prefix, stress='s', cache=5, prompt=128,
+                           model=file_model, n_tokens=64)
+        if len(thpt) == 0:
+            print(f"Warning: File {prefix}-s-5-128-{file_model}-64.txt not found")
+        model_runs.append(thpt)
     
-    return data
-
-def read_tz_data():
-    """Read TZ_LLM data from results directory"""
-    return read_data_from_files('tz')
+    return model_runs
 
-def read_base_data():
-    """Read BASE data from results directory"""
-    return read_data_from_files('base')
+def load_data(results):
+    """Return the mean decoding speed and every repetition, per setup and model"""
+    # Every repetition, for the speedup and overhead intervals
+    runs = {setup: read_runs_from_files(results, prefix) for prefix, setup in SETUP_PREFIX.items()}
 
-def read_strawman_data():
-    """Read STRAWMAN data from results directory"""
-    return read_data_from_files('strawman')
-
-# Hard-coded data for STRAWMAN, dynamic data for BASE and TZ_LLM
-data = {
-    STRAWMAN: read_strawman_data(),  # dynamically read from strawman-s-0-128-$model-64.txt files
-    BASE: read_base_data(),  # dynamically read from base-s-0-128-$model-64.txt files
-    TZ_LLM: read_tz_data()   # dynamically read from tz-s-0-128-$model-64.txt files
-}
+    # dynamically read from $setup-s-5-128-$model-64.txt files, 0 when missing
+    data = {setup: [float(thpt.mean()) if len(thpt) else 0.0 for thpt in runs[setup]]
+            for setup in runs}
+    return data, runs
 
 colors = {
     BASE: "#C6DBEF",
@@ -94,7 +77,7 @@ colors = {
     STRAWMAN: "#084594"
 }
 
-def plot():
+def plot(data, name=os.path.splitext(__file__)[0], fmt="pdf", dpi=1000):
     plt.rcParams["lines.markersize"] = 3
     plt.rcParams["font.family"] = 'sans-serif'
 
@@ -121,6 +104,9 @@ def plot():
             for idx, rect in enumerate(bars):
                 height = rect.get_height()
                 tz_value = data[TZ_LLM][idx]
+                if height == 0 or tz_value == 0:
+                    # Missing result, e.g. while a sweep is still running
+                    continue
                 
                 # Calculate percentage difference
                 pct_diff = ((tz_value - height) / height) * 100
@@ -163,51 +149,62 @@ def plot():
     fig.set_size_inches(get_figsize(latex_col, wf=0.8 * 2, hf=0.37 * 2))
     plt.tight_layout()
     
-    save_figure(fig, os.path.splitext(__file__)[0])
+    save_figure(fig, name, fmt, dpi)
+    plt.close(fig)
 
-def calculate_and_print_ranges():
+def calculate_and_print_ranges(runs):
     """Calculate and print speedup ranges comparing TZ_LLM to STRAWMAN and overhead comparing TZ_LLM to BASE"""
     
     # print("\n=== Decoding Speed Analysis ===")
     # print(f"Models: {models}")
     # print(f"Data: {data}")
     
-    # Calculate speedups (TZ_LLM vs STRAWMAN)
+    # Calculate speedups (TZ_LLM vs STRAWMAN) as bootstrap (estimate, low, high) over repetitions
     speedups = []
     overheads = []
     
     for i, model in enumerate(models):
-        tz_speed = data[TZ_LLM][i]
-        strawman_speed = data[STRAWMAN][i]
-        base_speed = data[BASE][i]
+        tz_runs = runs[TZ_LLM][i]
+        strawman_runs = runs[STRAWMAN][i]
+        base_runs = runs[BASE][i]
         
         # Speedup: TZ_LLM / STRAWMAN (higher is better)
-        speedup = tz_speed / strawman_speed if strawman_speed > 0 else 0
-        speedups.append(speedup)
+        speedup = bootstrap_ratio_ci(tz_runs, strawman_runs)
+        if not np.isnan(speedup[0]):
+            speedups.append(speedup)
         
         # Overhead: TZ_LLM / BASE (closer to 1 is better, <1 means TZ_LLM is slower)
-        overhead = tz_speed / base_speed if base_speed > 0 else 0
-        overheads.append(overhead)
+        overhead = bootstrap_ratio_ci(tz_runs, base_runs)
+        if not np.isnan(overhead[0]):
+            overheads.append(overhead)
         
         # print(f"\n{model}:")
-        # print(f"  TZ_LLM:   {tz_speed:.2f} tokens/s")
-        # print(f"  BASE:     {base_speed:.2f} tokens/s")
-        # print(f"  STRAWMAN: {strawman_speed:.2f} tokens/s")
-        # print(f"  Speedup vs STRAWMAN: {speedup:.2f}x ({((speedup-1)*100):+.1f}%)")
-        # print(f"  Overhead vs BASE: {overhead:.2f}x ({((overhead-1)*100):+.1f}%)")
+        # print(f"  TZ_LLM:   {data[TZ_LLM][i]:.2f} tokens/s")
+        # print(f"  BASE:     {data[BASE][i]:.2f} tokens/s")
+        # print(f"  STRAWMAN: {data[STRAWMAN][i]:.2f} tokens/s")
+        # print(f"  Speedup vs STRAWMAN: {speedup[0]:.2f}x ({((speedup[0]-1)*100):+.1f}%)")
+        # print(f"  Overhead vs BASE: {overhead[0]:.2f}x ({((overhead[0]-1)*100):+.1f}%)")
     
     # print(f"\n=== Summary Ranges ===")
     if speedups:
         min_speedup = min(speedups)
         max_speedup = max(speedups)
-        print(f"Speedup vs {STRAWMAN}: percentage range: {((min_speedup-1)*100):.1f}% to {((max_speedup-1)*100):.1f}%")
+        print(f"Speedup vs {STRAWMAN}: percentage range: {((min_speedup[0]-1)*100):.1f}% to {((max_speedup[0]-1)*100):.1f}%")
+        print(f"  95% CI: [{(min_speedup[1]-1)*100:.1f}%, {(min_speedup[2]-1)*100:.1f}%] to "
+              f"[{(max_speedup[1]-1)*100:.1f}%, {(max_speedup[2]-1)*100:.1f}%]")
     
     if overheads:
         min_overhead = min(overheads)
         max_overhead = max(overheads)
-        print(f"Overhead vs {BASE}: percentage range: {((1-max_overhead)*100):.1f}% to {((1-min_overhead)*100):.1f}%")
+        print(f"Overhead vs {BASE}: percentage range: {((1-max_overhead[0])*100):.1f}% to {((1-min_overhead[0])*100):.1f}%")
+        print(f"  95% CI: [{(1-max_overhead[2])*100:.1f}%, {(1-max_overhead[1])*100:.1f}%] to "
+              f"[{(1-min_overhead[2])*100:.1f}%, {(1-min_overhead[1])*100:.1f}%]")
+
+def main(name=os.path.splitext(__file__)[0], fmt="pdf", dpi=1000, results=None):
+    data, runs = load_data(results if results is not None else load_results())
+    calculate_and_print_ranges(runs)
+    plot(data, name, fmt, dpi)
 
 
 if __name__ == "__main__":
-    calculate_and_print_ranges()
-    plot()
+    main()
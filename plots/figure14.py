@@ -17,56 +17,41 @@ LLAMA_3_8B = "Llama-3-8B"
 BASE = "REE-LLM"
 TZ_LLM = "TZ-LLM"
 
-def read_result_file(filepath):
-    """Read a result file and return a dictionary of metrics"""
-    data = {}
-    try:
-        with open(filepath, 'r') as f:
-            for line in f:
-                if ':' in line:
-                    key, value = line.strip().split(': ')
-                    try:
-                        data[key] = float(value)
-                    except ValueError:
-                        data[key] = value
-    except FileNotFoundError:
-        print(f"Warning: File {filepath} not found")
-        return None
-    return data
-
 models = [LLAMA_3_8B]
 setups = [BASE, TZ_LLM]
 contexts = [32, 256, 512]
 cache_percentages = [0, 20, 40, 60, 80, 100]
 cache_values = [0, 1, 2, 3, 4, 5]  # Maps to cache_percentages
 
-# Read data from result files
-results_dir = os.path.join(os.path.dirname(__file__), '..', 'results')
+# Result files the figure is built from
+SELECTIONS = [
+    dict(setup='tz', stress='s', cache=cache_values, prompt=contexts, model='llama', n_tokens=1),
+]
 
-# Initialize data structure
-data = {LLAMA_3_8B: {}}
+def load_data(results):
+    """Read TTFT of every cache proportion and context length"""
+    # Initialize data structure
+    data = {LLAMA_3_8B: {}}
 
-for context in contexts:
-    data[LLAMA_3_8B][context] = {TZ_LLM: []}
-    
-    for cache_val in cache_values:
-        # Read the result file: tz-s-$cache-$prompt_length-llama-1.txt
-        filename = f"tz-s-{cache_val}-{context}-llama-1.txt"
-        filepath = os.path.join(results_dir, filename)
-        result_data = read_result_file(filepath)
+    for context in contexts:
+        data[LLAMA_3_8B][context] = {TZ_LLM: []}
         
-        if result_data is not None:
+        for cache_val in cache_values:
+            # Result files: tz-s-$cache-$prompt_length-llama-1.txt
             # Use ttft as the metric (TTFT in milliseconds)
-            ttft = result_data.get('ttft', 0)
-            data[LLAMA_3_8B][context][TZ_LLM].append(ttft)
-        else:
-            # Fill with 0 if file not found
-            data[LLAMA_3_8B][context][TZ_LLM].append(0)
-            print(f"Missing file: {filename}")
-
-print("Data loaded:")
-for context in contexts:
-    print(f"Context {context}: {data[LLAMA_3_8B][context][TZ_LLM]}")
+            ttft = results.mean('ttft', setup='tz', stress='s', cache=cache_val, prompt=context,
+                                model='llama', n_tokens=1)
+            if ttft is not None:
+                data[LLAMA_3_8B][context][TZ_LLM].append(ttft)
+            else:
+                # Fill with 0 if file not found
+                data[LLAMA_3_8B][context][TZ_LLM].append(0)
+                print(f"Missing file: tz-s-{cache_val}-{context}-llama-1.txt")
+
+    print("Data loaded:")
+    for context in contexts:
+        print(f"Context {context}: {data[LLAMA_3_8B][context][TZ_LLM]}")
+    return data
 
 RPS = "rps"
 LATENCY = "latency"
@@ -88,60 +73,73 @@ colors = {
     512: color_list[4],
 }
 
-fig, ax = plt.subplots(1, 1, figsize=(6, 4))
+def plot(data, name=os.path.splitext(__file__)[0], fmt="pdf", dpi=1000):
+    fig, ax = plt.subplots(1, 1, figsize=(6, 4))
 
-model = LLAMA_3_8B
+    model = LLAMA_3_8B
 
-ylim_upper = 0
+    ylim_upper = 0
 
-for ctx in contexts:
-    tz_llm_data = [ttft / data[model][ctx][TZ_LLM][0] for ttft in data[model][ctx][TZ_LLM]]
-    # base_data = data[model][ctx][BASE] / 1000
-    ylim_upper = max(ylim_upper, max(tz_llm_data))
+    for ctx in contexts:
+        # Missing results (0) are left out, e.g. while a sweep is still running
+        base_ttft = data[model][ctx][TZ_LLM][0]
+        tz_llm_data = [ttft / base_ttft if ttft and base_ttft else float("nan")
+                       for ttft in data[model][ctx][TZ_LLM]]
+        # base_data = data[model][ctx][BASE] / 1000
+        ylim_upper = max([ylim_upper] + [v for v in tz_llm_data if v == v])
     
-    # Plot TZ-LLM line
-    ax.plot(
-        cache_percentages,
-        tz_llm_data,
-        label=f"len={ctx}",
-        marker=markers[ctx],
-        color=colors[ctx],
-        linewidth=linewidth,
-        markersize=marker_sz,
-        markeredgewidth=marker_edge_w,
-    )
+        # Plot TZ-LLM line
+        ax.plot(
+            cache_percentages,
+            tz_llm_data,
+            label=f"len={ctx}",
+            marker=markers[ctx],
+            color=colors[ctx],
+            linewidth=linewidth,
+            markersize=marker_sz,
+            markeredgewidth=marker_edge_w,
+        )
     
-    # Plot baseline horizontal line
-    # ax.axhline(
-    #     y=base_data,
-    #     color=colors[ctx],
-    #     linestyle='--',
-    #     label=f"{BASE} (len={ctx})"
-    # )
-
-ax.set_xlabel('Cache Proportion (%)', fontsize=fontsize)
-ax.set_ylabel('Normalized TTFT', fontsize=fontsize)
-
-ax.text(0.5, 1.05, model,
-        horizontalalignment='center',
-        transform=ax.transAxes,
-        fontsize=fontsize)
+        # Plot baseline horizontal line
+        # ax.axhline(
+        #     y=base_data,
+        #     color=colors[ctx],
+        #     linestyle='--',
+        #     label=f"{BASE} (len={ctx})"
+        # )
+
+    ax.set_xlabel('Cache Proportion (%)', fontsize=fontsize)
+    ax.set_ylabel('Normalized TTFT', fontsize=fontsize)
+
+    ax.text(0.5, 1.05, model,
+            horizontalalignment='center',
+            transform=ax.transAxes,
+            fontsize=fontsize)
         
-ax.grid(True, linestyle='--')
-ax.tick_params(axis='both', labelsize=fontsize-2)
-
-# Set only the lower bound of y-axis
-ax.set_ylim([0, ylim_upper * 1.1])
-
-# Adjust legend - show all lines
-handles, labels = ax.get_legend_handles_labels()
-fig.legend(handles, labels, 
-          ncol=3, 
-          bbox_to_anchor=(0.5, 1.07),
-          loc='center', 
-          fontsize=fontsize,
-        #   columnspacing=0.6,
-          frameon=False)
-
-plt.tight_layout()
-save_figure(fig, os.path.splitext(__file__)[0])
+    ax.grid(True, linestyle='--')
+    ax.tick_params(axis='both', labelsize=fontsize-2)
+
+    # Set only the lower bound of y-axis
+    ax.set_ylim([0, (ylim_upper or 1) * 1.1])
+
+    # Adjust legend - show all lines
+    handles, labels = ax.get_legend_handles_labels()
+    fig.legend(handles, labels, 
+              ncol=3, 
+              bbox_to_anchor=(0.5, 1.07),
+              loc='center', 
+              fontsize=fontsize,
+            #   columnspacing=0.6,
+              frameon=False)
+
+    plt.tight_layout()
+    save_figure(fig, name, fmt, dpi)
+    plt.close(fig)
+
+
+def main(name=os.path.splitext(__file__)[0], fmt="pdf", dpi=1000, results=None):
+    plot(load_data(results if results is not None else load_results()), name, fmt, dpi)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/bin/python
+
+import matplotlib.pyplot as plt
+import numpy as np
+import os
+from common import *
+from prefill_trace import STAGES, WAIT, analyze, format_analysis, read_trace, trace_path
+
+fontsize = 11
+latex_col = 241.02039  ## pt
+lane_height = 0.8
+
+STRAWMAN = "Strawman"
+BASE = "REE-LLM"
+TZ_LLM = "TZ-LLM"
+
+setups = [BASE, TZ_LLM, STRAWMAN]
+SETUP_PREFIX = {'base': BASE, 'tz': TZ_LLM, 'strawman': STRAWMAN}
+
+# Prefill runs of E1 (figure10), the timeline is drawn for one prompt
+prompts = list(range(5, 10)) + list(range(15, 18))
+timeline_prompt = 5
+
+# Result files the figure is built from, read through their .trace sidecars
+SELECTIONS = [
+    dict(setup=list(SETUP_PREFIX), stress='s', cache=0, prompt=prompts, model='llama', n_tokens=1),
+]
+
+colors = {
+    "load": color_list[0],
+    "decrypt": color_list[3],
+    "compute": color_list[4],
+}
+
+def load_data(results):
+    """Event traces of every run with one, per setup and prompt"""
+    data = {}
+    for prefix, setup in SETUP_PREFIX.items():
+        data[setup] = {}
+        for prompt in prompts:
+            paths = results.paths(setup=prefix, stress='s', cache=0, prompt=prompt,
+                                  model='llama', n_tokens=1)
+            traces = [read_trace(trace_path(path)) for path in paths]
+            traces = [events for events in traces if events is not None and len(events)]
+            if traces:
+                data[setup][prompt] = traces
+    return data
+
+def print_analysis(data):
+    """Timeline of the plotted runs, and the average over every traced run"""
+    for setup in setups:
+        traces = [events for runs in data[setup].values() for events in runs]
+        if not traces:
+            print(f"{setup}: no traces")
+            continue
+        if timeline_prompt in data[setup]:
+            print(f"{setup} (prompt {timeline_prompt}): "
+                  f"{format_analysis(analyze(data[setup][timeline_prompt][0]))}")
+        analyses = [analyze(events) for events in traces]
+        efficiency = np.nanmean([a["overlap_efficiency"] for a in analyses])
+        shares = {stage: np.mean([a["critical"][stage] / a["makespan"] for a in analyses])
+                  for stage in STAGES + [WAIT]}
+        print(f"{setup} ({len(traces)} runs): overlap efficiency {efficiency * 100:.1f}%, "
+              "critical path share: " +
+              ", ".join(f"{stage} {share * 100:.0f}%" for stage, share in shares.items() if share > 0))
+
+def plot(data, name=os.path.splitext(__file__)[0], fmt="pdf", dpi=1000):
+    plt.rcParams["font.family"] = 'sans-serif'
+
+    fig, axes = plt.subplots(len(setups), 1, sharex=True)
+
+    for ax, setup in zip(axes, setups):
+        runs = data[setup].get(timeline_prompt)
+        if runs:
+            events = runs[0]
+            on_path = np.zeros(len(events), dtype=bool)
+            on_path[analyze(events)["critical_path"]] = True
+            for s, stage in enumerate(STAGES):
+                for critical in (False, True):
+                    selected = (events["stage"] == s) & (on_path == critical)
+                    if not selected.any():
+                        continue
+                    ax.broken_barh(
+                        list(zip(events["start"][selected],
+                                 events["end"][selected] - events["start"][selected])),
+                        (len(STAGES) - 1 - s - lane_height / 2, lane_height),
+                        facecolors=colors[stage],
+                        edgecolor="black" if critical else "none",
+                        lw=0.4,
+                        alpha=1.0 if critical else 0.45,
+                        zorder=3,
+                    )
+
+        ax.set_yticks(range(len(STAGES)))
+        ax.set_yticklabels(STAGES[::-1], fontsize=fontsize - 2)
+        ax.set_ylim(-0.6, len(STAGES) - 0.4)
+        ax.set_ylabel(setup, fontsize=fontsize, rotation=0, ha="right", va="center")
+        ax.tick_params(axis='x', labelsize=fontsize - 2)
+        adjust_ax_style(ax, disable=False)
+        ax.xaxis.grid(color='black', linestyle=(0, (5, 10)), linewidth=0.1, zorder=0)
+
+    axes[-1].set_xlabel("Time since prompt submission (ms)", fontsize=fontsize)
+    axes[-1].set_xlim(left=0)
+
+    fig.set_size_inches(get_figsize(latex_col, wf=0.8 * 3, hf=0.37 * 3))
+    plt.tight_layout()
+
+    save_figure(fig, name, fmt, dpi)
+    plt.close(fig)
+
+def main(name=os.path.splitext(__file__)[0], fmt="pdf", dpi=1000, results=None):
+    data = load_data(results if results is not None else load_results())
+    print_analysis(data)
+    plot(data, name, fmt, dpi)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/bin/python
+"""
+Prefill event trace of a run and its critical path
+
+Next to results/<name>[.<k>].txt the harness keeps the text sidecar
+results/<name>[.<k>].trace pulled from /dev/shm/current_measure.trace, one
+event per line ("#" starts a comment):
+
+    <stage> <layer> <start_us> <end_us>
+
+where stage is load (from flash), decrypt (into secure memory) or compute
+(on the NPU), and times are in microseconds since the prompt was submitted.
+
+    python3 plots/prefill_trace.py results/tz-s-0-5-llama-1.trace
+"""
+
+import argparse
+
+import numpy as np
+
+from results_store import sidecar_path
+
+STAGES = ["load", "decrypt", "compute"]
+WAIT = "wait"
+EVENT = np.dtype([("stage", "<i1"), ("layer", "<i4"), ("start", "<f8"), ("end", "<f8")])
+# Slack (ms) within which an event counts as having started when another ended
+TOLERANCE = 0.05
+
+
+def trace_path(result_path):
+    """Sidecar of a result file, results/<name>[.<k>].trace"""
+    return sidecar_path(result_path, "trace")
+
+
+def read_trace(path):
+    """Events of a trace in ms sorted by start, None if there is none"""
+    try:
+        f = open(path, "r")
+    except FileNotFoundError:
+        return None
+    events = []
+    with f:
+        for line in f:
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) != 4 or fields[0] not in STAGES:
+                raise ValueError(f"{path}: bad trace line: {line.strip()}")
+            stage, layer, start, end = fields
+            events.append((STAGES.index(stage), int(layer), int(start) / 1000, int(end) / 1000))
+    return np.sort(np.array(events, dtype=EVENT), order=["start", "end"])
+
+
+def _predecessor(events, i):
+    """Event that gated the start of event i: the latest one to end before it started
+
+    Among events ending at the same time, the previous stage of the same layer
+    and the previous layer of the same stage are preferred.
+    """
+    ended = events["end"] <= events["start"][i] + TOLERANCE
+    ended[i] = False
+    if not ended.any():
+        return None
+    latest = events["end"][ended].max()
+    candidates = np.flatnonzero(ended & (events["end"] >= latest - TOLERANCE))
+    for j in candidates:
+        if events["layer"][j] == events["layer"][i] or events["stage"][j] == events["stage"][i]:
+            return j
+    return candidates[-1]
+
+
+def critical_path(events):
+    """Indices of the events on the critical path, in time order"""
+    if len(events) == 0:
+        return []
+    path = [int(np.argmax(events["end"]))]
+    while True:
+        j = _predecessor(events, path[-1])
+        if j is None:
+            return path[::-1]
+        path.append(int(j))
+
+
+def analyze(events):
+    """Timeline summary of a trace, all times in ms
+
+    overlap_efficiency is the share of the possible overlap that was achieved:
+    0 when the stages ran back to back (makespan = sum of all events), 1 when the
+    makespan is down to the busiest stage.
+    """
+    path = critical_path(events)
+    makespan = float(events["end"].max()) if len(events) else 0.0
+    durations = events["end"] - events["start"]
+    busy = {stage: float(durations[events["stage"] == s].sum()) for s, stage in enumerate(STAGES)}
+
+    critical = dict.fromkeys(STAGES + [WAIT], 0.0)
+    previous_end = 0.0
+    for i in path:
+        critical[WAIT] += max(0.0, events["start"][i] - previous_end)
+        critical[STAGES[events["stage"][i]]] += durations[i]
+        previous_end = events["end"][i]
+
+    serial = sum(busy.values())
+    bound = max(busy.values()) if busy else 0.0
+    efficiency = (serial - makespan) / (serial - bound) if serial > bound else np.nan
+    return {
+        "makespan": makespan,
+        "busy": busy,
+        "critical": {stage: float(t) for stage, t in critical.items()},
+        "critical_path": path,
+        "overlap_efficiency": float(np.clip(efficiency, 0, 1)),
+    }
+
+
+def format_analysis(analysis):
+    critical = analysis["critical"]
+    makespan = analysis["makespan"] or 1.0
+    return (f"makespan {analysis['makespan']:.1f} ms, "
+            f"overlap efficiency {analysis['overlap_efficiency'] * 100:.1f}%, critical path: " +
+            ", ".join(f"{stage} {t:.1f} ms ({t / makespan * 100:.0f}%)"
+                      for stage, t in critical.items() if t > 0))
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Critical path of prefill traces")
+    parser.add_argument("traces", nargs="+", help="results/<args>.trace files")
+    args = parser.parse_args()
+
+    for path in args.traces:
+        events = read_trace(path)
+        if events is None:
+            print(f"{path}: not found")
+            continue
+        print(f"{path}: {format_analysis(analyze(events))}")
+
+
+if __name__ == "__main__":
+    main()
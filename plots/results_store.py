@@ -0,0 +1,235 @@
+#!/bin/python
+"""
+Append-only, indexed store of experiment results
+
+Every run lands in one SQLite table keyed by
+(setup, stress, cache, prompt, model, n_tokens, repetition, timestamp),
+so figures can query any axis instead of globbing and parsing results/*.txt.
+
+    python3 results_store.py ingest [results_dir]
+    python3 results_store.py query --setup tz --cache 0 1
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+
+RESULTS_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', 'results'))
+DEFAULT_DB = os.path.join(RESULTS_DIR, 'results.db')
+
+# Same order as the run-mem-retry.sh arguments the file name is built from
+AXES = ['setup', 'stress', 'cache', 'prompt', 'model', 'n_tokens']
+INT_AXES = {'cache', 'prompt', 'n_tokens', 'repetition'}
+# Metrics with their own column, every metric is also kept in the JSON column
+STORED_METRICS = ['ttft', 'decoding_thpt']
+
+# <setup>-<stress>-<cache>-<prompt>-<model>-<n>[.<repetition>].txt
+RUN_NAME = re.compile(
+    r'^(?P<setup>[a-z]+)-(?P<stress>[a-z][a-z0-9_]*)-(?P<cache>\d+)-(?P<prompt>\d+)-'
+    r'(?P<model>[a-z0-9]+)-(?P<n_tokens>\d+)(?:\.(?P<repetition>\d+))?\.txt$')
+
+# Optional per-run files next to <name>[.<repetition>].txt, e.g. <name>.tokens
+SIDECARS = ['tokens', 'trace', 'pressure']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    setup TEXT NOT NULL,
+    stress TEXT NOT NULL,
+    cache INTEGER NOT NULL,
+    prompt INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    n_tokens INTEGER NOT NULL,
+    repetition INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    ttft REAL,
+    decoding_thpt REAL,
+    metrics TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    UNIQUE (setup, stress, cache, prompt, model, n_tokens, repetition, timestamp)
+);
+CREATE INDEX IF NOT EXISTS runs_setup ON runs (setup);
+CREATE INDEX IF NOT EXISTS runs_stress ON runs (stress);
+CREATE INDEX IF NOT EXISTS runs_cache ON runs (cache);
+CREATE INDEX IF NOT EXISTS runs_prompt ON runs (prompt);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model);
+CREATE INDEX IF NOT EXISTS runs_n_tokens ON runs (n_tokens);
+CREATE INDEX IF NOT EXISTS runs_path ON runs (path, timestamp, size);
+"""
+
+
+def parse_run_name(filename):
+    """Run key encoded in a result file name, or None for other files"""
+    match = RUN_NAME.match(os.path.basename(filename))
+    if not match:
+        return None
+    key = match.groupdict()
+    key['repetition'] = key['repetition'] or 0
+    return {k: int(v) if k in INT_AXES else v for k, v in key.items()}
+
+
+def sidecar_path(result_path, kind):
+    """Sidecar of a result file, <name>[.<repetition>].<kind> next to it"""
+    stem, ext = os.path.splitext(result_path)
+    return f"{stem if ext == '.txt' else result_path}.{kind}"
+
+
+def parse_result(text):
+    """Metrics of a result file, `key: value` per line"""
+    metrics = {}
+    for line in text.splitlines():
+        key, sep, value = line.strip().partition(': ')
+        if not sep:
+            continue
+        try:
+            metrics[key] = float(value)
+        except ValueError:
+            metrics[key] = value
+    return metrics
+
+
+def scan_results(results_dir=RESULTS_DIR):
+    """Result files of a directory and their stat, in a single scandir pass"""
+    files = {}
+    try:
+        entries = os.scandir(results_dir)
+    except FileNotFoundError:
+        return files
+    with entries:
+        for entry in entries:
+            if parse_run_name(entry.name) is not None and entry.is_file():
+                files[os.path.abspath(entry.path)] = entry.stat()
+    return files
+
+
+class ResultsStore:
+    """SQLite-backed store, one row per (run key, repetition, timestamp)"""
+
+    def __init__(self, path=DEFAULT_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def insert(self, key, metrics, timestamp, path='', size=0):
+        """Append one run, return False if it is already stored"""
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO runs (setup, stress, cache, prompt, model, n_tokens, "
+            "repetition, timestamp, ttft, decoding_thpt, metrics, path, size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [key[axis] for axis in AXES] + [
+                key.get('repetition', 0), timestamp,
+                _number(metrics.get('ttft')), _number(metrics.get('decoding_thpt')),
+                json.dumps(metrics), path, size])
+        return cursor.rowcount == 1
+
+    def ingest_file(self, path, stat=None):
+        """Store a result file, keyed by its name and modification time"""
+        key = parse_run_name(path)
+        if key is None:
+            return False
+        stat = stat or os.stat(path)
+        with open(path, 'r') as f:
+            metrics = parse_result(f.read())
+        return self.insert(key, metrics, stat.st_mtime, os.path.abspath(path), stat.st_size)
+
+    def find(self, path, stat):
+        """Stored run of a result file as it is on disk now, or None"""
+        return self.db.execute(
+            "SELECT * FROM runs WHERE path = ? AND timestamp = ? AND size = ?",
+            (os.path.abspath(path), stat.st_mtime, stat.st_size)).fetchone()
+
+    def ingest_dir(self, results_dir=RESULTS_DIR, files=None):
+        """Bulk-import every result file of a directory, return the number of new runs"""
+        if files is None:
+            files = scan_results(results_dir)
+        known = {(row['path'], row['timestamp'], row['size'])
+                 for row in self.db.execute("SELECT path, timestamp, size FROM runs")}
+        added = 0
+        with self.db:
+            for path, stat in files.items():
+                if (path, stat.st_mtime, stat.st_size) in known:
+                    continue
+                added += self.ingest_file(path, stat)
+        return added
+
+    def sync(self, results_dir=RESULTS_DIR):
+        """Runs of the result files currently in a directory
+
+        Only files that are new or changed since they were last stored are parsed.
+        """
+        files = scan_results(results_dir)
+        self.ingest_dir(results_dir, files)
+        current = {(path, stat.st_mtime, stat.st_size) for path, stat in files.items()}
+        rows = self.db.execute("SELECT * FROM runs ORDER BY " +
+                               ', '.join(AXES + ['repetition', 'timestamp'])).fetchall()
+        return [row for row in rows if (row['path'], row['timestamp'], row['size']) in current]
+
+    def query(self, latest=True, **axes):
+        """Runs matching the given axes, each a value or a list of values
+
+        With latest=True only the newest run of every (key, repetition) is returned.
+        """
+        where, params = [], []
+        for axis, value in axes.items():
+            if axis not in INT_AXES and axis not in AXES:
+                raise ValueError(f"unknown axis {axis}")
+            values = value if isinstance(value, (list, tuple, set, range)) else [value]
+            where.append(f"{axis} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+
+        sql = "SELECT * FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if latest:
+            group = ', '.join(AXES + ['repetition'])
+            sql = sql.replace("SELECT *", f"SELECT *, ROW_NUMBER() OVER (PARTITION BY {group} "
+                                          f"ORDER BY timestamp DESC) AS newest", 1)
+            sql = f"SELECT * FROM ({sql}) WHERE newest = 1"
+        sql += " ORDER BY " + ', '.join(AXES + ['repetition', 'timestamp'])
+        return self.db.execute(sql, params).fetchall()
+
+
+def _number(value):
+    return value if isinstance(value, float) else None
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Indexed store of experiment results')
+    parser.add_argument('--db', default=DEFAULT_DB, help=f'Store path (default: {DEFAULT_DB})')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = sub.add_parser('ingest', help='Import result files')
+    ingest_parser.add_argument('results_dir', nargs='?', default=RESULTS_DIR)
+
+    query_parser = sub.add_parser('query', help='Print stored runs')
+    for axis in AXES + ['repetition']:
+        query_parser.add_argument(f'--{axis.replace("_", "-")}', nargs='+',
+                                  type=int if axis in INT_AXES else str)
+    query_parser.add_argument('--all', action='store_true',
+                              help='Include superseded runs, not only the latest')
+
+    args = parser.parse_args()
+    store = ResultsStore(args.db)
+
+    if args.command == 'ingest':
+        added = store.ingest_dir(args.results_dir)
+        print(f"Ingested {added} new run(s) from {args.results_dir}")
+    else:
+        axes = {axis: getattr(args, axis) for axis in AXES + ['repetition']
+                if getattr(args, axis) is not None}
+        for row in store.query(latest=not args.all, **axes):
+            key = '-'.join(str(row[axis]) for axis in AXES)
+            print(f"{key}.{row['repetition']}\tttft: {row['ttft']}\tdecoding_thpt: {row['decoding_thpt']}")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
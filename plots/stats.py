@@ -0,0 +1,133 @@
+#!/bin/python
+"""
+Vectorized statistics for the result analysis
+
+Geometric means are computed in log space, and bootstrap confidence intervals
+draw all resamples as one index array (in chunks bounded by MAX_CHUNK elements).
+"""
+
+import numpy as np
+
+N_RESAMPLES = 5000
+CONFIDENCE = 0.95
+MAX_CHUNK = 1 << 22  # elements per resample chunk
+# Two-sided 95% Student t quantiles for 1..30 degrees of freedom
+T_975 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+         2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def _scalar(value):
+    return float(value) if np.ndim(value) == 0 else value
+
+
+def geometric_mean(values, axis=-1):
+    """Geometric mean in log space, 0 when empty or when any value is not positive"""
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return 0.0
+    positive = (values > 0).all(axis=axis)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.exp(np.log(np.where(values > 0, values, 1.0)).mean(axis=axis))
+    return _scalar(np.where(positive, result, 0.0))
+
+
+def geometric_mean_change(changes, axis=-1):
+    """Geometric mean of relative changes, e.g. reductions or overheads"""
+    return _scalar(geometric_mean(1 + np.asarray(changes, dtype=float), axis=axis) - 1)
+
+
+def paired_ratios(numerator, denominator):
+    """Element-wise ratios of two aligned series, skipping non-positive denominators"""
+    n = min(len(numerator), len(denominator))
+    numerator = np.asarray(numerator[:n], dtype=float)
+    denominator = np.asarray(denominator[:n], dtype=float)
+    valid = denominator > 0
+    return numerator[valid] / denominator[valid]
+
+
+def bootstrap(values, statistic, n_resamples=N_RESAMPLES, seed=0):
+    """Bootstrap distribution of statistic(values, axis=1) over resampled values"""
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    rng = np.random.default_rng(seed)
+    chunk = max(1, MAX_CHUNK // max(1, values.size))
+    samples = []
+    for start in range(0, n_resamples, chunk):
+        idx = rng.integers(0, n, size=(min(chunk, n_resamples - start), n))
+        samples.append(statistic(values[idx], axis=1))
+    return np.concatenate(samples)
+
+
+# Statistics that are a plain mean in a transformed space: (domain check, forward, inverse)
+LOG_SPACE = {
+    geometric_mean: (lambda v: (v > 0).all(), np.log, np.exp),
+    geometric_mean_change: (lambda v: (v > -1).all(), np.log1p, np.expm1),
+}
+
+
+def bootstrap_ci(values, statistic=np.mean, confidence=CONFIDENCE,
+                 n_resamples=N_RESAMPLES, seed=0):
+    """(estimate, low, high) of a statistic with a percentile bootstrap interval"""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.nan, np.nan, np.nan
+    estimate = _scalar(statistic(values, axis=0))
+    if len(values) < 2:
+        return estimate, estimate, estimate
+    if statistic in LOG_SPACE and LOG_SPACE[statistic][0](values):
+        # Transform once instead of taking logs of every resample
+        _, forward, inverse = LOG_SPACE[statistic]
+        samples = inverse(bootstrap(forward(values), np.mean, n_resamples, seed))
+    else:
+        samples = bootstrap(values, statistic, n_resamples, seed)
+    alpha = (1 - confidence) / 2 * 100
+    low, high = np.percentile(samples, [alpha, 100 - alpha])
+    return estimate, float(low), float(high)
+
+
+def bootstrap_ratio_ci(numerator, denominator, confidence=CONFIDENCE,
+                       n_resamples=N_RESAMPLES, seed=0):
+    """(estimate, low, high) of mean(numerator) / mean(denominator) for unpaired runs"""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    if len(numerator) == 0 or len(denominator) == 0 or denominator.mean() <= 0:
+        return np.nan, np.nan, np.nan
+    estimate = numerator.mean() / denominator.mean()
+    if len(numerator) < 2 and len(denominator) < 2:
+        return estimate, estimate, estimate
+    num = bootstrap(numerator, np.mean, n_resamples, seed)
+    den = bootstrap(denominator, np.mean, n_resamples, seed + 1)
+    alpha = (1 - confidence) / 2 * 100
+    low, high = np.percentile(num / den, [alpha, 100 - alpha])
+    return float(estimate), float(low), float(high)
+
+
+def ci_half_width(values, statistic=np.mean, confidence=CONFIDENCE,
+                  n_resamples=N_RESAMPLES, seed=0):
+    """Half width of the bootstrap interval relative to the estimate"""
+    estimate, low, high = bootstrap_ci(values, statistic, confidence, n_resamples, seed)
+    if not np.isfinite(estimate) or estimate == 0:
+        return np.inf
+    return (high - low) / 2 / abs(estimate)
+
+
+def t_half_width(values):
+    """Half width of the 95% Student t interval of the mean, relative to the mean
+
+    Unlike the percentile bootstrap it stays conservative at a handful of runs,
+    so it is the one to stop repeating on.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n < 2:
+        return np.inf
+    mean = values.mean()
+    if not np.isfinite(mean) or mean == 0:
+        return np.inf
+    t = T_975[n - 2] if n - 1 <= len(T_975) else 1.96
+    return float(t * values.std(ddof=1) / np.sqrt(n) / abs(mean))
+
+
+def format_ci(estimate, low, high, scale=100, unit='%'):
+    return f"{estimate * scale:.2f}{unit} [{low * scale:.2f}, {high * scale:.2f}]"
@@ -0,0 +1,122 @@
+#!/bin/python
+
+import matplotlib.pyplot as plt
+import numpy as np
+import os
+from common import *
+from tokens import run_latencies, tpot_summary
+
+fontsize = 13
+latex_col = 241.02039  ## pt
+linewidth = 1.0
+
+QWEN25_3B = "Qwen2.5-3B"
+LLAMA_3_8B = "Llama-3-8B"
+
+STRAWMAN = "Strawman"
+BASE = "REE-LLM"
+TZ_LLM = "TZ-LLM"
+
+models = [QWEN25_3B, LLAMA_3_8B]
+setups = [BASE, TZ_LLM, STRAWMAN]
+
+model_file_map = {
+    QWEN25_3B: 'qwen',
+    LLAMA_3_8B: 'llama'
+}
+
+SETUP_PREFIX = {'base': BASE, 'tz': TZ_LLM, 'strawman': STRAWMAN}
+
+# Same decoding runs as figure11, read through their .tokens sidecars
+SELECTIONS = [
+    dict(setup=list(SETUP_PREFIX), stress='s', cache=5, prompt=128,
+         model=[model_file_map[model] for model in models], n_tokens=64),
+]
+
+colors = {
+    QWEN25_3B: color_list[0],
+    LLAMA_3_8B: color_list[4],
+}
+
+def load_data(results):
+    """Per-token latencies (ms) of every repetition, per setup and model"""
+    data = {}
+    for prefix, setup in SETUP_PREFIX.items():
+        data[setup] = {}
+        for model in models:
+            paths = results.paths(setup=prefix, stress='s', cache=5, prompt=128,
+                                  model=model_file_map[model], n_tokens=64)
+            data[setup][model] = run_latencies(paths)
+            if paths and not data[setup][model]:
+                print(f"Warning: no token timestamps for {prefix}-s-5-128-{model_file_map[model]}-64")
+    return data
+
+def print_summary(data):
+    """TPOT percentiles and jitter over all tokens of all repetitions"""
+    print(f"{'setup':<10}{'model':<12}{'runs':>5}{'p50':>9}{'p90':>9}{'p99':>9}{'jitter':>9}{'max':>9}  (ms)")
+    for setup in setups:
+        for model in models:
+            runs = data[setup][model]
+            summary = tpot_summary(np.concatenate(runs)) if runs else None
+            if summary is None:
+                continue
+            print(f"{setup:<10}{model:<12}{len(runs):>5}"
+                  f"{summary['p50']:>9.1f}{summary['p90']:>9.1f}{summary['p99']:>9.1f}"
+                  f"{summary['jitter']:>9.1f}{summary['max']:>9.1f}")
+
+def plot(data, name=os.path.splitext(__file__)[0], fmt="pdf", dpi=1000):
+    plt.rcParams["font.family"] = 'sans-serif'
+
+    fig, axes = plt.subplots(1, len(setups), sharey=True)
+
+    for ax, setup in zip(axes, setups):
+        for model in models:
+            runs = data[setup][model]
+            if not runs:
+                continue
+            # Align repetitions on token index, up to the shortest decode
+            length = min(len(run) for run in runs)
+            latencies = np.stack([run[:length] for run in runs])
+            tokens = np.arange(2, length + 2)
+            ax.plot(tokens, np.median(latencies, axis=0), color=colors[model],
+                    lw=linewidth, label=model, zorder=3)
+            if len(runs) > 1:
+                ax.fill_between(tokens, latencies.min(axis=0), latencies.max(axis=0),
+                                color=colors[model], alpha=0.25, lw=0, zorder=2)
+
+        ax.set_title(setup, fontsize=fontsize)
+        ax.set_xlabel("Token", fontsize=fontsize)
+        ax.tick_params(axis='both', labelsize=fontsize - 2)
+        ax.set_ylim(bottom=0)
+        adjust_ax_style(ax, disable=False)
+
+    axes[0].set_ylabel("Per-Token\nLatency (ms)", fontsize=fontsize)
+    handles, labels = axes[0].get_legend_handles_labels()
+    for ax in axes[1:]:
+        if handles:
+            break
+        handles, labels = ax.get_legend_handles_labels()
+    fig.legend(
+        handles,
+        labels,
+        fontsize=fontsize,
+        frameon=False,
+        loc="upper center",
+        ncol=len(models),
+        bbox_to_anchor=(0.5, 1.08),
+    )
+
+    fig.set_size_inches(get_figsize(latex_col, wf=0.8 * 3, hf=0.37 * 2))
+    plt.tight_layout()
+
+    save_figure(fig, name, fmt, dpi)
+    plt.close(fig)
+
+def main(name=os.path.splitext(__file__)[0], fmt="pdf", dpi=1000, results=None):
+    data = load_data(results if results is not None else load_results())
+    print_summary(data)
+    plot(data, name, fmt, dpi)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/bin/python
+"""
+Per-token emission timestamps of a run
+
+Next to results/<name>[.<k>].txt the harness keeps the binary sidecar
+results/<name>[.<k>].tokens pulled from /dev/shm/current_measure.tokens:
+
+    16-byte header   magic b"TKTS", uint16 version (1), uint16 reserved, uint64 count
+    count x uint64   emission time of every token, in ns since the prompt was submitted
+
+All fields are little-endian. The first timestamp is the TTFT, and the
+differences between consecutive timestamps are the per-token decode latencies
+(TPOT). Sidecars are opened with numpy.memmap, so long decodes are not read
+into memory just to compute a few percentiles.
+"""
+
+import os
+
+import numpy as np
+
+from results_store import sidecar_path
+
+MAGIC = b"TKTS"
+VERSION = 1
+HEADER = np.dtype([("magic", "S4"), ("version", "<u2"), ("reserved", "<u2"), ("count", "<u8")])
+TIMESTAMP = np.dtype("<u8")
+PERCENTILES = [50, 90, 99]
+
+
+def token_path(result_path):
+    """Sidecar of a result file, results/<name>[.<k>].tokens"""
+    return sidecar_path(result_path, "tokens")
+
+
+def write_tokens(path, timestamps_ns):
+    """Write a sidecar, e.g. for recorded or simulated runs"""
+    timestamps = np.asarray(timestamps_ns, dtype=TIMESTAMP)
+    header = np.array([(MAGIC, VERSION, 0, len(timestamps))], dtype=HEADER)
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(timestamps.tobytes())
+
+
+def read_tokens(path):
+    """Token timestamps (ns) of a sidecar as a read-only memmap, None if there is none
+
+    A truncated sidecar, e.g. from a run that crashed while decoding, yields the
+    timestamps that were completely written.
+    """
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+    if size < HEADER.itemsize:
+        return None
+    header = np.fromfile(path, dtype=HEADER, count=1)[0]
+    if header["magic"] != MAGIC or header["version"] != VERSION:
+        raise ValueError(f"{path}: not a token timestamp file")
+    count = min(int(header["count"]), (size - HEADER.itemsize) // TIMESTAMP.itemsize)
+    if count == 0:
+        return np.empty(0, dtype=TIMESTAMP)
+    return np.memmap(path, dtype=TIMESTAMP, mode="r", offset=HEADER.itemsize, shape=(count,))
+
+
+def token_latencies(timestamps):
+    """Per-token decode latencies in ms, one less than the number of tokens"""
+    return np.diff(np.asarray(timestamps, dtype=np.int64)) / 1e6
+
+
+def tpot_summary(latencies):
+    """p50/p90/p99, mean and jitter (standard deviation) of per-token latencies in ms"""
+    latencies = np.asarray(latencies, dtype=float)
+    if latencies.size == 0:
+        return None
+    p50, p90, p99 = np.percentile(latencies, PERCENTILES)
+    return {
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "mean": float(latencies.mean()),
+        "jitter": float(latencies.std()),
+        "max": float(latencies.max()),
+    }
+
+
+def run_latencies(paths):
+    """Per-token latencies of every result file that has a sidecar"""
+    runs = []
+    for path in paths:
+        timestamps = read_tokens(token_path(path))
+        if timestamps is not None and len(timestamps) > 1:
+            runs.append(token_latencies(timestamps))
+    return runs
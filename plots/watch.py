@@ -0,0 +1,217 @@
+#!/bin/python
+"""
+Live figures while a sweep is running
+
+Follows the results directory (inotify, or polling where it is unavailable),
+ingests each result file as it lands and re-renders preview PNGs of only the
+figures it belongs to. plots/watch-status.json always holds the number of
+points done and remaining per figure.
+
+    python3 plots/watch.py [figure ...] [--poll] [--interval 2]
+"""
+
+import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import importlib
+import io
+import itertools
+import json
+import os
+import select
+import struct
+import time
+
+from build import FIGURES, PLOT_DIR, PREVIEW_DPI
+from common import RESULTS_DIR, Results
+from results_store import AXES, ResultsStore, parse_run_name, scan_results
+
+STATUS_FILE = os.path.join(PLOT_DIR, "watch-status.json")
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Result files closed after writing or renamed into the directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"cannot watch {directory}")
+
+    def changes(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        buf = os.read(self.fd, 64 * 1024)
+        paths = set()
+        offset = 0
+        while offset < len(buf):
+            _, _, _, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            if parse_run_name(name) is not None:
+                paths.add(os.path.join(self.directory, name))
+        return paths
+
+
+class PollingWatcher:
+    """Fallback that compares (mtime, size) of every result file"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.seen = self._scan()
+
+    def _scan(self):
+        return {path: (stat.st_mtime, stat.st_size)
+                for path, stat in scan_results(self.directory).items()}
+
+    def changes(self, timeout):
+        time.sleep(timeout)
+        current = self._scan()
+        paths = {path for path, stamp in current.items() if self.seen.get(path) != stamp}
+        self.seen = current
+        return paths
+
+
+def make_watcher(directory, poll=False):
+    if not poll:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), polling instead")
+    return PollingWatcher(directory)
+
+
+def _values(value):
+    return value if isinstance(value, (list, tuple, set, range)) else [value]
+
+
+def expected_points(selections):
+    """Run keys (without repetition) a figure needs, from its selections"""
+    points = set()
+    for selection in selections:
+        points.update(itertools.product(*(_values(selection[axis]) for axis in AXES)))
+    return points
+
+
+def matches(key, selections):
+    return any(all(getattr(key, axis) in _values(value) for axis, value in selection.items())
+               for selection in selections)
+
+
+class LiveFigures:
+    """Preview figures and progress of a running sweep"""
+
+    def __init__(self, figures, results_dir=RESULTS_DIR, status_file=STATUS_FILE):
+        self.figures = figures
+        self.results_dir = results_dir
+        self.status_file = status_file
+        self.modules = {figure: importlib.import_module(figure) for figure in figures}
+        self.expected = {figure: expected_points(module.SELECTIONS)
+                         for figure, module in self.modules.items()}
+        self.store = ResultsStore(os.path.join(results_dir, "results.db"))
+        self.results = Results(self.store.sync(results_dir))
+
+    def render(self, figure):
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                self.modules[figure].main(os.path.join(PLOT_DIR, figure), "png",
+                                          PREVIEW_DPI, self.results)
+        except Exception as e:
+            print(f"{figure}: could not render partial figure: {e}")
+
+    def status(self):
+        present = {tuple(getattr(key, axis) for axis in AXES) for key in self.results.keys}
+        status = {"updated": time.time(), "figures": {}}
+        for figure, expected in self.expected.items():
+            remaining = sorted(expected - present, key=str)
+            status["figures"][figure] = {
+                "done": len(expected) - len(remaining),
+                "total": len(expected),
+                "remaining": ["-".join(str(v) for v in point) for point in remaining],
+                "preview": os.path.join(PLOT_DIR, f"{figure}.png"),
+            }
+        return status
+
+    def write_status(self):
+        status = self.status()
+        tmp = self.status_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(status, f, indent=1)
+        os.replace(tmp, self.status_file)
+        print(time.strftime("%H:%M:%S"), "  ".join(
+            f"{figure}: {s['done']}/{s['total']}" for figure, s in status["figures"].items()))
+
+    def update(self, paths):
+        """Ingest changed result files, re-render the figures they belong to"""
+        rows = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            self.store.ingest_file(path, stat)
+            self.store.db.commit()
+            row = self.store.find(path, stat)
+            if row is not None:
+                rows.append(row)
+        if not rows:
+            return []
+
+        self.results.add(rows)
+        keys = Results(rows).keys
+        affected = [figure for figure, module in self.modules.items()
+                    if any(matches(key, module.SELECTIONS) for key in keys)]
+        for figure in affected:
+            self.render(figure)
+        self.write_status()
+        return affected
+
+    def run(self, poll=False, interval=2.0):
+        os.makedirs(self.results_dir, exist_ok=True)
+        watcher = make_watcher(self.results_dir, poll)
+        for figure in self.figures:
+            self.render(figure)
+        self.write_status()
+        while True:
+            paths = watcher.changes(interval)
+            if paths:
+                self.update(paths)
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Update preview figures while a sweep runs")
+    parser.add_argument("figures", nargs="*", metavar="figure",
+                        help=f"Figures to follow: {', '.join(FIGURES)} (default: all)")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--poll", action="store_true", help="Poll instead of using inotify")
+    parser.add_argument("--interval", type=float, default=2.0,
+                        help="Seconds between polls (default: 2)")
+    args = parser.parse_args()
+
+    figures = args.figures or FIGURES
+    for figure in figures:
+        if figure not in FIGURES:
+            parser.error(f"unknown figure {figure}")
+
+    live = LiveFigures(figures, args.results_dir)
+    try:
+        live.run(args.poll, args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -5,5 +5,5 @@ PLOT_DIR=$(realpath $(dirname $0)/../plots)
 
 $SCRIPT_DIR/end-to-end-prefill.sh
 
-python3 $PLOT_DIR/figure10.py
+python3 $PLOT_DIR figure10
 
@@ -0,0 +1,59 @@
+#!/bin/sh
+# Long-lived device agent, driven by scripts/channel.py over one hdc shell session.
+#
+# Requests, one per line on stdin:   <id> <command>
+# Replies, one line per output line: @@<id>:<line>  then  @@<id>=<exit code>
+# Events:                            @@!<name>
+#
+# Every request runs in the background so slow commands do not block others.
+# The watcher emits measure_done as soon as mem-stress.sh marks its result done.
+
+shm=${1:-/dev/shm}
+done_file=$shm/current_measure.done
+tmp=$shm/agent.$$
+
+stty -echo 2>/dev/null
+mkdir -p $tmp
+
+emit() {
+    # Serialize writers so replies of concurrent requests do not interleave
+    until mkdir $tmp/lock 2>/dev/null; do
+        sleep 0.01
+    done
+    cat "$1"
+    rmdir $tmp/lock
+}
+
+watch_measure() {
+    armed=1
+    while true; do
+        if [ -e $done_file ]; then
+            if [ $armed = 1 ]; then
+                echo "@@!measure_done" > $tmp/event
+                emit $tmp/event
+                armed=0
+            fi
+        else
+            armed=1
+        fi
+        sleep 0.2
+    done
+}
+
+watch_measure &
+watcher=$!
+trap 'kill $watcher 2>/dev/null; rm -rf $tmp' EXIT
+
+echo "@@!ready"
+while read -r id cmd; do
+    [ -z "$id" ] && continue
+    (
+        sh -c "$cmd" > $tmp/$id.raw 2>&1
+        rc=$?
+        sed "s/^/@@$id:/" $tmp/$id.raw > $tmp/$id.out
+        # Leading newline terminates a last output line that lacks one
+        printf '\n@@%s=%s\n' "$id" "$rc" >> $tmp/$id.out
+        emit $tmp/$id.out
+        rm -f $tmp/$id.raw $tmp/$id.out
+    ) &
+done
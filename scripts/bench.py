@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Harness throughput benchmark
+Runs the same sweep points through every harness variant against the hdc
+emulator and reports the wall time per point that is not spent running
+inference: reboots, fixed sleeps, polling and file transfers
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import hdc_emulator
+import plan
+import sweep
+
+EMU_PATH = os.path.join(sweep.SCRIPT_DIR, 'emu')
+RUN_MEM_RETRY = os.path.join(sweep.SCRIPT_DIR, 'run-mem-retry.sh')
+FLEET = os.path.join(sweep.SCRIPT_DIR, 'fleet.py')
+
+# name: (runner, soft reset, fleet options)
+VARIANTS = {
+    'bash': ('bash', False, []),
+    'bash-soft': ('bash', True, []),
+    'fleet': ('fleet', False, ['--no-channel']),
+    'fleet-soft': ('fleet', True, ['--no-channel']),
+    'fleet-channel': ('fleet', True, []),
+}
+
+
+def run_variant(name, jobs, work_dir, config, devices=1, timeout=None):
+    """Run jobs through one harness variant, return its measurements"""
+    runner, soft_reset, options = VARIANTS[name]
+    emu_dir = os.path.join(work_dir, name, 'emu')
+    results_dir = os.path.join(work_dir, name, 'results')
+    os.makedirs(results_dir, exist_ok=True)
+    targets = [f'emu-{i}' for i in range(devices if runner == 'fleet' else 1)]
+    hdc_emulator.write_config(emu_dir, **dict(config, targets=targets))
+
+    env = dict(os.environ, PATH=f"{EMU_PATH}:{os.environ['PATH']}", HDC_EMU_DIR=emu_dir,
+               RESULTS_DIR=results_dir + '/', SOFT_RESET='1' if soft_reset else '0')
+    start = time.time()
+    if runner == 'bash':
+        for point, repetition in jobs:
+            subprocess.run([RUN_MEM_RETRY] + point.args, env=dict(env, REPETITION=str(repetition)),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+    else:
+        manifest = os.path.join(work_dir, name, 'manifest.json')
+        with open(manifest, 'w') as f:
+            json.dump({'jobs': [{'args': point.args, 'repetition': repetition}
+                                for point, repetition in jobs]}, f)
+        subprocess.run([sys.executable, FLEET, '--manifest', manifest, '--results-dir', results_dir,
+                        '--targets'] + targets + (['--soft-reset'] if soft_reset else []) + options,
+                       env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+    wall = time.time() - start
+
+    log = hdc_emulator.read_log(emu_dir)
+    done = sum(os.path.exists(point.result_path(results_dir, repetition))
+               for point, repetition in jobs)
+    useful = sum(entry['useful'] for entry in log if entry['kind'] == 'measure' and entry['ok'])
+    return {
+        'variant': name,
+        'points': done,
+        'devices': len(targets),
+        'wall': wall,
+        'useful': useful,
+        # Board-seconds not spent on inference, per completed point
+        'overhead_per_point': (wall * len(targets) - useful) / max(1, done),
+        'hdc_calls': sum(entry['kind'] == 'hdc' for entry in log),
+        'reboots': sum(entry['kind'] == 'reboot' for entry in log),
+        'bytes': sum(entry.get('bytes', 0) for entry in log),
+    }
+
+
+def report(rows):
+    print(f"{'variant':<15}{'points':>7}{'wall (s)':>10}{'s/point':>9}"
+          f"{'overhead/pt':>13}{'hdc calls':>11}{'reboots':>9}")
+    for row in rows:
+        print(f"{row['variant']:<15}{row['points']:>7}{row['wall']:>10.1f}"
+              f"{row['wall'] / max(1, row['points']):>9.1f}{row['overhead_per_point']:>13.1f}"
+              f"{row['hdc_calls']:>11}{row['reboots']:>9}")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark the harness against the hdc emulator')
+    parser.add_argument('spec', nargs='?', default='e3',
+                        help='Sweep spec or one of ' + ', '.join(sorted(sweep.SWEEPS)))
+    parser.add_argument('--points', type=int, default=2, help='Sweep points to run (default: 2)')
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), metavar='VARIANT',
+                        help=f"Harness variants: {', '.join(VARIANTS)} (default: all)")
+    parser.add_argument('--devices', type=int, default=1, help='Emulated boards for fleet variants')
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help='Scale of emulated board delays; the harness sleeps are not '
+                             'scaled, so values below 1 overstate its share (default: 1)')
+    parser.add_argument('--config', help='JSON file with emulator settings, see hdc_emulator.py')
+    parser.add_argument('--work-dir', help='Keep emulator state and results here')
+    parser.add_argument('--json', action='store_true', help='Print the measurements as JSON')
+    args = parser.parse_args()
+
+    for name in args.variants:
+        if name not in VARIANTS:
+            parser.error(f"unknown variant {name}")
+    spec = args.spec
+    if not os.path.exists(spec):
+        spec = os.path.join(sweep.SPEC_DIR, f'{spec}.json')
+    jobs = plan.order(sweep.spec_jobs(sweep.load_spec(spec)))[:args.points]
+
+    config = {'time_scale': args.time_scale}
+    if args.config:
+        with open(args.config, 'r') as f:
+            config.update(json.load(f))
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='harness-bench-')
+    try:
+        rows = []
+        for name in args.variants:
+            print(f"Running {name}...", file=sys.stderr)
+            rows.append(run_variant(name, jobs, work_dir, config, args.devices))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(rows, indent=1))
+    else:
+        report(rows)
+
+
+if __name__ == '__main__':
+    main()
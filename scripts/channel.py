@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Persistent device channel
+Keeps one agent.sh session open per board, multiplexes shell commands over it
+and receives a measure_done event instead of polling with `hdc shell ls`
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import queue
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from device import REMOTE_DIR, HdcDevice
+
+logger = logging.getLogger(__name__)
+
+AGENT = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'agent.sh')
+MEASURE_DONE = 'measure_done'
+
+
+class ProcessTransport:
+    """Agent reached through a child process, e.g. `hdc -t <serial> shell`"""
+
+    def __init__(self, argv, bootstrap=None):
+        self.argv = argv
+        self.bootstrap = bootstrap
+        self.proc = None
+
+    def open(self):
+        self.proc = subprocess.Popen(self.argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, bufsize=0)
+        if self.bootstrap:
+            self.write(self.bootstrap + '\n')
+        return self.proc.stdout
+
+    def write(self, data):
+        self.proc.stdin.write(data.encode())
+        self.proc.stdin.flush()
+
+    def close(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+
+
+class SocketTransport:
+    """Agent reached over TCP, used with the local stand-in from `serve`"""
+
+    def __init__(self, host, port, timeout=5):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.sock = None
+
+    def open(self):
+        self.sock = socket.create_connection(self.address, timeout=self.timeout)
+        self.sock.settimeout(None)
+        return self.sock.makefile('rb')
+
+    def write(self, data):
+        self.sock.sendall(data.encode())
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+
+
+def hdc_transport(serial=None):
+    """Interactive hdc shell that execs the agent pushed by `HdcDevice.prepare`"""
+    # Without a serial, hdc talks to its only board
+    return ProcessTransport(['hdc'] + (['-t', serial] if serial else []) + ['shell'],
+                            bootstrap=f'exec sh {REMOTE_DIR}/agent.sh')
+
+
+class DeviceChannel:
+    """Multiplexed command channel to a running agent.sh"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.events = queue.Queue()
+        self.alive = False
+        self.ready = threading.Event()
+
+    def open(self, timeout=10):
+        """Start the session, return False if the agent does not come up"""
+        try:
+            stream = self.transport.open()
+        except OSError as e:
+            logger.warning(f"Could not open device channel: {e}")
+            return False
+        self.alive = True
+        threading.Thread(target=self._reader, args=(stream,), daemon=True).start()
+        if not self.ready.wait(timeout):
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        self.transport.close()
+        self._drop()
+
+    def _drop(self):
+        with self.lock:
+            self.alive = False
+            pending, self.pending = self.pending, {}
+        for request in pending.values():
+            request['done'].set()
+
+    def _reader(self, stream):
+        for raw in stream:
+            line = raw.decode(errors='replace').rstrip('\r\n')
+            if not line.startswith('@@'):
+                # Shell echo and banners of the underlying session
+                continue
+            if line.startswith('@@!'):
+                name = line[3:]
+                if name == 'ready':
+                    self.ready.set()
+                else:
+                    self.events.put(name)
+                continue
+
+            for sep in ':=':
+                head, found, body = line[2:].partition(sep)
+                if found and head.isdigit():
+                    break
+            else:
+                continue
+            with self.lock:
+                request = self.pending.get(head)
+                if request is None:
+                    continue
+                if sep == ':':
+                    request['lines'].append(body)
+                else:
+                    request['rc'] = int(body)
+                    del self.pending[head]
+                    request['done'].set()
+        self._drop()
+
+    def request(self, command, timeout=5):
+        """Run a command on the device, return (exit code, output)
+
+        The exit code is None when the command was sent but no reply came, on a
+        timeout or when the channel dropped; it may have run. None is returned
+        when the channel was down and nothing was sent.
+        """
+        request_id = str(next(self.ids))
+        request = {'lines': [], 'rc': None, 'done': threading.Event()}
+        with self.lock:
+            if not self.alive:
+                return None
+            self.pending[request_id] = request
+        try:
+            self.transport.write(f'{request_id} {command}\n')
+        except OSError:
+            self.close()
+            return None
+
+        if not request['done'].wait(timeout):
+            with self.lock:
+                self.pending.pop(request_id, None)
+        return request['rc'], '\n'.join(request['lines'])
+
+    def clear_events(self):
+        while not self.events.empty():
+            self.events.get_nowait()
+
+    def wait_event(self, name, timeout):
+        """Wait for an event, return False on timeout or when the channel drops"""
+        deadline = time.time() + timeout
+        while self.alive:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            try:
+                event = self.events.get(timeout=min(remaining, 1))
+            except queue.Empty:
+                continue
+            if event == name:
+                return True
+        return False
+
+
+class ChannelDevice(HdcDevice):
+    """HdcDevice that keeps an agent session open and falls back to hdc when it drops"""
+
+    def __init__(self, serial, soft_reset=False, transport_factory=hdc_transport):
+        super().__init__(serial, soft_reset)
+        self.transport_factory = transport_factory
+        self.channel = None
+
+    def _connect(self):
+        self.channel = DeviceChannel(self.transport_factory(self.serial))
+        if not self.channel.open():
+            logger.warning(f"[{self}] device channel unavailable, polling over hdc")
+            self.channel = None
+
+    def prepare(self):
+        super().prepare()
+        while not self.send(AGENT, f'{REMOTE_DIR}/agent.sh'):
+            pass
+
+    def shell(self, command, timeout=5):
+        if self.channel and self.channel.alive:
+            reply = self.channel.request(command, timeout)
+            if reply is not None:
+                # Not retried over hdc once sent: reboot or mem-stress.sh must not run twice
+                rc, output = reply
+                return output.strip() if rc == 0 else None
+        return super().shell(command, timeout)
+
+    def wait_connect(self):
+        if self.channel:
+            self.channel.close()
+            self.channel = None
+        super().wait_connect()
+        self._connect()
+
+    def wait_measure(self, max_retry):
+        if self.channel is None:
+            return super().wait_measure(max_retry)
+
+        # Same overall deadline as the polling loop
+        if self.channel.wait_event(MEASURE_DONE, max_retry * self.poll_interval):
+            return True
+        if self.channel.alive:
+            return False
+        logger.warning(f"[{self}] device channel dropped, polling over hdc")
+        self.channel = None
+        return super().wait_measure(max_retry)
+
+    def spawn(self, command, timeout=400):
+        if self.channel:
+            self.channel.clear_events()
+        return super().spawn(command, timeout)
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        proc = subprocess.Popen(['sh', AGENT, self.server.shm_dir],
+                                stdin=self.connection.fileno(),
+                                stdout=self.connection.fileno(),
+                                stderr=subprocess.DEVNULL)
+        proc.wait()
+
+
+def serve(port, shm_dir):
+    """Local stand-in for the device end: one agent.sh per TCP connection"""
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', port), _AgentHandler)
+    server.daemon_threads = True
+    server.shm_dir = shm_dir
+    return server
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Persistent device channel')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = sub.add_parser('serve', help='Run a local agent on a TCP port')
+    serve_parser.add_argument('--port', type=int, default=5555)
+    serve_parser.add_argument('--shm-dir', default='/tmp/tz-llm-shm',
+                              help='Directory standing in for /dev/shm')
+
+    shell_parser = sub.add_parser('shell', help='Run commands through a channel')
+    shell_parser.add_argument('commands', nargs='+')
+    shell_parser.add_argument('--connect', metavar='HOST:PORT',
+                              help='Local agent address (default: hdc target)')
+    shell_parser.add_argument('--target', help='hdc target serial')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        os.makedirs(args.shm_dir, exist_ok=True)
+        server = serve(args.port, args.shm_dir)
+        print(f"Agent listening on 127.0.0.1:{args.port}, shm dir {args.shm_dir}")
+        server.serve_forever()
+        return
+
+    if args.connect:
+        host, port = args.connect.rsplit(':', 1)
+        transport = SocketTransport(host, int(port))
+    else:
+        transport = hdc_transport(args.target)
+
+    channel = DeviceChannel(transport)
+    if not channel.open():
+        print("❌ Could not open device channel")
+        sys.exit(1)
+    for command in args.commands:
+        rc, output = channel.request(command, timeout=30) or (None, '')
+        if rc is None:
+            print(f"❌ No reply for: {command}")
+            sys.exit(1)
+        if output:
+            print(output)
+        if rc != 0:
+            print(f"Return code: {rc}")
+    channel.close()
+
+
+if __name__ == '__main__':
+    main()
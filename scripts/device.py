@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Device backends for the experiment harness
+HdcDevice drives a board through hdc, FakeDevice simulates one locally
+"""
+
+import abc
+import itertools
+import logging
+import os
+import random
+import subprocess
+import threading
+import time
+
+import pressure
+from paths import REMOTE_DIR, SCRIPT_DIR
+from sweep import SIDECARS
+from tokens import write_tokens
+
+logger = logging.getLogger(__name__)
+
+MEASURE_FILE = '/dev/shm/current_measure'
+# Written by mem-stress.sh once the inference run has finished
+MEASURE_DONE_FILE = '/dev/shm/current_measure.done'
+# Sidecars (per-token timestamps, prefill trace) are only written by binaries
+# that record them, as /dev/shm/current_measure.<kind>
+MEM_STRESS = os.path.join(SCRIPT_DIR, 'mem-stress.sh')
+SOFT_RESET = os.path.join(SCRIPT_DIR, 'soft-reset.sh')
+PRESSURE = os.path.join(SCRIPT_DIR, 'pressure.sh')
+INFER = os.path.join(SCRIPT_DIR, 'infer.sh')
+
+
+def list_targets():
+    """Serials of the boards hdc can see"""
+    try:
+        out = subprocess.run(['hdc', 'list', 'targets'], capture_output=True,
+                             text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    return [line.strip() for line in out.splitlines()
+            if line.strip() and '[Empty]' not in line]
+
+
+class Device(abc.ABC):
+    """A board sweep points can be run on"""
+
+    connect_interval = 5
+    poll_interval = 10
+
+    def __init__(self, serial, soft_reset=False):
+        self.serial = serial
+        self.soft_reset = soft_reset
+
+    def __str__(self):
+        return self.serial
+
+    @abc.abstractmethod
+    def shell(self, command, timeout=5):
+        """Run a shell command, return its stripped output or None on timeout"""
+
+    @abc.abstractmethod
+    def send(self, local, remote, timeout=20):
+        """Push a file to the board, return whether it arrived"""
+
+    @abc.abstractmethod
+    def recv(self, remote, local, timeout=20):
+        """Pull a file from the board, return whether it arrived"""
+
+    @abc.abstractmethod
+    def spawn(self, command, timeout=400):
+        """Start a long-running shell command without waiting for it"""
+
+    def wait_connect(self):
+        while self.shell('echo hello') != 'hello':
+            time.sleep(self.connect_interval)
+
+    def prepare(self):
+        """Push mem-stress.sh, infer.sh and the pressure profiles, as the sweep scripts do
+        before their loops"""
+        for local in (MEM_STRESS, INFER, SOFT_RESET, PRESSURE):
+            while not self.send(local, f'{REMOTE_DIR}/{os.path.basename(local)}'):
+                pass
+        self.shell(f'mkdir -p {pressure.REMOTE_PROFILE_DIR}')
+        for local in pressure.compile_all():
+            while not self.send(local, f'{pressure.REMOTE_PROFILE_DIR}/{os.path.basename(local)}'):
+                pass
+
+    def reset(self):
+        """Bring the device to a clean state, return the path taken or None to retry"""
+        if self.soft_reset:
+            check = self.shell(f'sh {REMOTE_DIR}/soft-reset.sh check', timeout=30)
+            if check == 'clean':
+                return 'soft'
+            logger.info(f"[{self}] soft reset: {check or 'timeout'}")
+
+        if self.shell('reboot') is None:
+            return None
+        logger.info(f"[{self}] system reboot")
+        self.wait_connect()
+        if self.soft_reset and self.shell(f'sh {REMOTE_DIR}/soft-reset.sh baseline') is None:
+            return None
+        return 'reboot'
+
+    def wait_measure(self, max_retry):
+        """Poll until mem-stress.sh has written its result"""
+        for _ in range(max_retry):
+            time.sleep(self.poll_interval)
+            if self.shell(f'ls {MEASURE_DONE_FILE}') == MEASURE_DONE_FILE:
+                return True
+        return False
+
+    def run_point(self, point, output_file, sidecars=None):
+        """Same protocol as run-mem-retry.sh: reset, run, poll, pull
+
+        sidecars maps a sidecar kind to the local file it is pulled to, when the
+        run wrote one.
+        """
+        sidecars = sidecars or {}
+        max_retry = 40 if point.setup == 'strawman' else 10
+        args = ' '.join(point.args)
+
+        while True:
+            self.wait_connect()
+            reset_path = self.reset()
+            if reset_path is None:
+                continue
+
+            stale = ' '.join(f'{MEASURE_FILE}.{kind}' for kind in SIDECARS)
+            if self.shell(f'mkdir -p /dev/shm/ && rm -f {MEASURE_FILE} {MEASURE_DONE_FILE} '
+                          f'{stale}') is None:
+                continue
+            if self.shell(f'chmod -R +x {REMOTE_DIR}/') is None:
+                continue
+            self.spawn(f'{REMOTE_DIR}/mem-stress.sh {args}')
+
+            if not self.wait_measure(max_retry):
+                logger.warning(f"[{self}] {point.name}: no result, retrying")
+                continue
+
+            while not self.recv(MEASURE_FILE, output_file):
+                pass
+            for kind, local in sidecars.items():
+                remote = f'{MEASURE_FILE}.{kind}'
+                if self.shell(f'ls {remote}') == remote:
+                    while not self.recv(remote, local):
+                        pass
+            with open(output_file, 'a') as f:
+                f.write(f"reset: {reset_path}\n")
+            return
+
+
+class HdcDevice(Device):
+    """A board reached through `hdc -t <serial>`"""
+
+    def _hdc(self, *args):
+        # Without a serial, hdc talks to its only board
+        return ['hdc'] + (['-t', self.serial] if self.serial else []) + list(args)
+
+    def shell(self, command, timeout=5):
+        try:
+            result = subprocess.run(self._hdc('shell', command), capture_output=True,
+                                    text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return None
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
+
+    def _transfer(self, args, timeout):
+        try:
+            result = subprocess.run(self._hdc('file', *args), capture_output=True,
+                                    text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False
+        return result.returncode == 0
+
+    def send(self, local, remote, timeout=20):
+        return self._transfer(['send', local, remote], timeout)
+
+    def recv(self, remote, local, timeout=20):
+        return self._transfer(['recv', remote, local], timeout)
+
+    def spawn(self, command, timeout=400):
+        return subprocess.Popen(['timeout', str(timeout)] + self._hdc('shell', command),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class FakeDevice(Device):
+    """Local stand-in for a board, for exercising the scheduler without hardware"""
+
+    def __init__(self, serial, point_time=0.1, fail_rate=0.0, seed=None, soft_reset=False):
+        super().__init__(serial, soft_reset)
+        self.point_time = point_time
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.runs = []
+
+    def shell(self, command, timeout=5):
+        return 'hello' if command == 'echo hello' else ''
+
+    def send(self, local, remote, timeout=20):
+        return True
+
+    def recv(self, remote, local, timeout=20):
+        return True
+
+    def spawn(self, command, timeout=400):
+        return None
+
+    def _prefill_trace(self, point, ttft, layers=32):
+        """Simulated (stage, layer, start, end) events in ms, ending at ttft"""
+        cached = round(point.cache / 5 * layers)
+        stages = ['load', 'compute'] if point.setup == 'base' else ['load', 'decrypt', 'compute']
+        mean = {'load': 40.0, 'decrypt': 20.0, 'compute': 18.0}
+        events = []
+        stage_end = dict.fromkeys(stages, 0.0)
+        for layer in range(layers):
+            ready = 0.0
+            for stage in stages:
+                if stage != 'compute' and layer < cached:
+                    continue
+                # Strawman runs every step back to back, the others pipeline
+                # layers with one step per stage in flight
+                start = max(ready, max(stage_end.values()) if point.setup == 'strawman'
+                            else stage_end[stage])
+                end = start + max(1.0, self.random.gauss(mean[stage], mean[stage] / 10))
+                events.append((stage, layer, start, end))
+                stage_end[stage] = ready = end
+        scale = ttft / events[-1][3]
+        return [(stage, layer, start * scale, end * scale) for stage, layer, start, end in events]
+
+    def run_point(self, point, output_file, sidecars=None):
+        sidecars = sidecars or {}
+        while True:
+            time.sleep(self.point_time)
+            with self.lock:
+                failed = self.random.random() < self.fail_rate
+                # Caching reduces TTFT linearly up to a level that drops for long prompts
+                knee = 5 - min(2, point.prompt // 256)
+                ttft = self.random.gauss(2000.0, 100.0) * (1 - 0.15 * min(point.cache, knee))
+                thpt = self.random.gauss(8.0, 0.2)
+                # Decode latency per token in ms, with an occasional stall
+                tpot = [self.random.gauss(1000.0 / thpt, 5.0) *
+                        (3 if self.random.random() < 0.03 else 1) for _ in range(point.n - 1)]
+                trace = self._prefill_trace(point, ttft)
+            if not failed:
+                break
+            logger.warning(f"[{self}] {point.name}: no result, retrying")
+
+        with open(output_file, 'w') as f:
+            f.write(f"ttft: {ttft:.2f}\ndecoding_thpt: {thpt:.2f}\n")
+            f.write(f"reset: {'soft' if self.soft_reset else 'reboot'}\n")
+        if 'tokens' in sidecars:
+            timestamps = itertools.accumulate([ttft] + tpot)
+            write_tokens(sidecars['tokens'], [int(t * 1e6) for t in timestamps])
+        if 'trace' in sidecars:
+            with open(sidecars['trace'], 'w') as f:
+                # Sidecar format, see plots/prefill_trace.py
+                f.write("# stage layer start_us end_us\n")
+                for stage, layer, start, end in trace:
+                    f.write(f"{stage} {layer} {int(start * 1000)} {int(end * 1000)}\n")
+        self.runs.append(point)
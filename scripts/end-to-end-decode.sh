@@ -2,17 +2,16 @@
 
 SCRIPT_DIR=$(realpath $(dirname $0))
 
-while true; do
-    timeout 20 hdc file send $SCRIPT_DIR/mem-stress.sh /data/local/tmp/rknpu/mem-stress.sh || continue
-    break
+# Sends the scripts and the memory-pressure profiles only when they changed since the last sweep
+until python3 $SCRIPT_DIR/sync.py $SCRIPT_DIR/mem-stress.sh $SCRIPT_DIR/infer.sh $SCRIPT_DIR/soft-reset.sh &&
+        python3 $SCRIPT_DIR/pressure.py push; do
+    sleep 1
 done
 
-for sys in tz base strawman; do
-    for stress in s; do
-        for cache in 5; do
-            for model in qwen llama; do
-                $SCRIPT_DIR/run-mem-retry.sh $sys $stress $cache 128 $model 64
-            done
-        done
-    done
+# Sweep axes are in sweeps/e2.json, plan.py orders the runs by model and setup
+plan=$(python3 $SCRIPT_DIR/plan.py e2 --args) || exit 1
+mapfile -t runs < <(printf "%s" "$plan")
+for run in "${runs[@]}"; do
+    set -- $run
+    REPETITION=$7 $SCRIPT_DIR/run-mem-retry.sh $1 $2 $3 $4 $5 $6
 done
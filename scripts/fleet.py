@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Fleet scheduler for the experiment sweeps
+Spreads sweep points across several boards at the same time
+"""
+
+import argparse
+import logging
+import math
+import os
+import queue
+import sys
+import threading
+import time
+
+import plan
+import sweep
+from channel import ChannelDevice
+from device import FakeDevice, HdcDevice, list_targets
+from stats import t_half_width
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class FleetScheduler:
+    """Runs sweep points on a pool of devices, one point per device at a time"""
+
+    def __init__(self, devices, results_dir=sweep.RESULTS_DIR):
+        self.devices = devices
+        self.results_dir = results_dir
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.done = []
+        # Points left over once every device has been retired
+        self.failed = []
+
+    def start(self, points):
+        todo = sweep.pending(points, self.results_dir)
+        logger.info(f"{len(points) - len(todo)} of {len(points)} points already done, "
+                    f"{len(todo)} to run on {len(self.devices)} device(s)")
+        for point in todo:
+            self.queue.put(point)
+
+    def next_job(self, device=None):
+        """Next (point, repetition) for a device to run, or None when there is nothing left"""
+        while True:
+            try:
+                point = self.queue.get_nowait()
+            except queue.Empty:
+                return None
+            if not os.path.exists(point.result_path(self.results_dir)):
+                return point, 0
+
+    def job_done(self, point, repetition, output_file):
+        with self.lock:
+            self.done.append(point)
+
+    def job_failed(self, point, repetition):
+        # Hand the point to another board
+        self.queue.put(point)
+
+    def finish(self):
+        while not self.queue.empty():
+            self.failed.append(self.queue.get_nowait())
+
+    def _worker(self, device):
+        try:
+            device.prepare()
+        except Exception as e:
+            logger.error(f"[{device}] could not prepare device: {e}")
+            return
+
+        while True:
+            job = self.next_job(device)
+            if job is None:
+                return
+            point, repetition = job
+            output_file = point.result_path(self.results_dir, repetition)
+            label = f"{point.name}.{repetition}" if repetition else point.name
+
+            logger.info(f"[{device}] running {label}")
+            start = time.time()
+            tmp_file = f"{output_file}.{device.serial}.part"
+            tmp_sidecars = {kind: f"{sweep.sidecar_path(output_file, kind)}.{device.serial}.part"
+                            for kind in sweep.SIDECARS}
+            try:
+                device.run_point(point, tmp_file, tmp_sidecars)
+                # Wall time of the point including retries, for planning later sweeps
+                with open(tmp_file, 'a') as f:
+                    f.write(f"duration: {time.time() - start:.1f}\n")
+                # Sidecars first, so the result file never lands without them
+                for kind, tmp in tmp_sidecars.items():
+                    if os.path.exists(tmp):
+                        os.replace(tmp, sweep.sidecar_path(output_file, kind))
+                os.replace(tmp_file, output_file)
+            except Exception as e:
+                logger.error(f"[{device}] {label} failed, retiring device: {e}")
+                for path in [tmp_file] + list(tmp_sidecars.values()):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self.job_failed(point, repetition)
+                return
+
+            logger.info(f"[{device}] {label} done in {time.time() - start:.1f}s")
+            self.job_done(point, repetition, output_file)
+
+    def run(self, points):
+        """Run every point without a result file, return the completed points"""
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.start(points)
+
+        workers = [threading.Thread(target=self._worker, args=(device,),
+                                    name=str(device), daemon=True)
+                   for device in self.devices]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.finish()
+        return self.done
+
+
+class AdaptiveScheduler(FleetScheduler):
+    """Repeats points until their confidence interval is narrow enough
+
+    Every free device gets the point whose TTFT (and decoding speed, for decode
+    runs) has the widest relative 95% interval. A point stops once the half
+    width is below `target`, or after `max_runs` runs; `budget` caps the runs
+    of the whole invocation.
+    """
+
+    def __init__(self, devices, results_dir=sweep.RESULTS_DIR, target=0.05,
+                 min_runs=3, max_runs=10, budget=None):
+        super().__init__(devices, results_dir)
+        self.target = target
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.budget = budget
+        self.cond = threading.Condition(self.lock)
+        self.values = {}
+        # Completed runs, whether or not their result file has the metrics
+        self.runs = {}
+        self.widths = {}
+        self.next_repetition = {}
+        self.in_flight = {}
+
+    @staticmethod
+    def metrics(point):
+        return ['ttft', 'decoding_thpt'] if point.n > 1 else ['ttft']
+
+    def width(self, point):
+        """Widest relative t-interval half width of the point's metrics, cached per run count"""
+        samples = self._samples(point)
+        if samples < 2:
+            return math.inf
+        if self.widths.get(point, (None,))[0] != samples:
+            self.widths[point] = samples, max(t_half_width(self.values[point][metric])
+                                              for metric in self.metrics(point))
+        return self.widths[point][1]
+
+    def start(self, points):
+        for point, found in sweep.repetitions(points, self.results_dir).items():
+            self.values[point] = {metric: [] for metric in self.metrics(point)}
+            self.runs[point] = 0
+            for path in found.values():
+                self._record(point, path)
+            self.next_repetition[point] = max(found, default=-1) + 1
+            self.in_flight[point] = 0
+        logger.info(f"{len(points)} points, target CI half width {self.target:.1%}, "
+                    f"{self.min_runs}-{self.max_runs} runs per point, "
+                    f"{len(self.devices)} device(s)")
+
+    def _record(self, point, path):
+        metrics = sweep.read_result(path)
+        self.runs[point] += 1
+        missing = [metric for metric in self.values[point]
+                   if not isinstance(metrics.get(metric), float)]
+        if missing:
+            logger.warning(f"{os.path.basename(path)} has no {', '.join(missing)}")
+        for metric, values in self.values[point].items():
+            if metric not in missing:
+                values.append(metrics[metric])
+
+    def _samples(self, point):
+        """Runs with every metric, the ones the interval is computed from"""
+        return min(len(values) for values in self.values[point].values())
+
+    def _candidates(self):
+        for point in self.values:
+            runs, in_flight = self.runs[point], self.in_flight[point]
+            if runs + in_flight >= self.max_runs:
+                continue
+            if runs + in_flight < self.min_runs:
+                yield math.inf, point
+            elif in_flight == 0 and self.width(point) > self.target:
+                # Wait for in-flight runs before deciding a point needs more
+                yield self.width(point), point
+
+    def next_job(self, device=None):
+        with self.cond:
+            while True:
+                if self.budget is not None and self.budget <= 0:
+                    return None
+                candidates = list(self._candidates())
+                if candidates:
+                    _, point = max(candidates, key=lambda c: (c[0], -self.in_flight[c[1]]))
+                    repetition = self.next_repetition[point]
+                    self.next_repetition[point] += 1
+                    self.in_flight[point] += 1
+                    if self.budget is not None:
+                        self.budget -= 1
+                    return point, repetition
+                if not any(self.in_flight.values()):
+                    return None
+                self.cond.wait()
+
+    def job_done(self, point, repetition, output_file):
+        with self.cond:
+            self._record(point, output_file)
+            self.in_flight[point] -= 1
+            self.done.append(point)
+            self.cond.notify_all()
+
+    def job_failed(self, point, repetition):
+        with self.cond:
+            self.in_flight[point] -= 1
+            if self.budget is not None:
+                self.budget += 1
+            self.cond.notify_all()
+
+    def finish(self):
+        for point in self.values:
+            width = self.width(point)
+            state = 'converged' if width <= self.target else 'not converged'
+            logger.info(f"{point.name}: {self.runs[point]} runs, "
+                        f"CI half width {width:.1%} ({state})")
+            if self._samples(point) < self.min_runs:
+                self.failed.append(point)
+
+
+class ManifestScheduler(FleetScheduler):
+    """Runs the (point, repetition) jobs of a run manifest in order
+
+    A device keeps taking jobs of the model and setup it ran last, and moves on
+    to a group no other device is working on when its group is done.
+    """
+
+    def __init__(self, devices, results_dir=sweep.RESULTS_DIR):
+        super().__init__(devices, results_dir)
+        self.jobs = []
+        self.groups = {}
+
+    @staticmethod
+    def group(point):
+        return point.model, point.setup
+
+    def start(self, jobs):
+        self.jobs = [(point, repetition) for point, repetition in jobs
+                     if not os.path.exists(point.result_path(self.results_dir, repetition))]
+        logger.info(f"{len(jobs) - len(self.jobs)} of {len(jobs)} runs already done, "
+                    f"{len(self.jobs)} to run on {len(self.devices)} device(s)")
+
+    def next_job(self, device=None):
+        with self.lock:
+            self.jobs = [(point, repetition) for point, repetition in self.jobs
+                         if not os.path.exists(point.result_path(self.results_dir, repetition))]
+            if not self.jobs:
+                return None
+            current = self.groups.get(device)
+            busy = {group for other, group in self.groups.items() if other is not device}
+            job = next((job for job in self.jobs if self.group(job[0]) == current), None) or \
+                next((job for job in self.jobs if self.group(job[0]) not in busy), None) or \
+                self.jobs[0]
+            self.jobs.remove(job)
+            self.groups[device] = self.group(job[0])
+            return job
+
+    def job_failed(self, point, repetition):
+        with self.lock:
+            self.jobs.append((point, repetition))
+
+    def finish(self):
+        self.failed.extend(point for point, _ in self.jobs)
+
+
+def build_points(args):
+    if args.sweep:
+        return sweep.SWEEPS[args.sweep]()
+    return sweep.expand(args.sys, args.stress, args.cache, args.model, args.prompt, args.n)
+
+
+def build_devices(args):
+    if args.fake:
+        return [FakeDevice(f"fake-{i}", point_time=args.fake_time, soft_reset=args.soft_reset)
+                for i in range(args.fake)]
+    targets = args.targets or list_targets()
+    if args.no_channel:
+        return [HdcDevice(serial, args.soft_reset) for serial in targets]
+    return [ChannelDevice(serial, args.soft_reset) for serial in targets]
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Run experiment sweeps on several boards')
+    parser.add_argument('sweep', nargs='?', choices=sorted(sweep.SWEEPS),
+                        help='Predefined sweep (e1: prefill, e2: decoding, e3: caching)')
+    parser.add_argument('--spec', help='Sweep spec file, run in planned order')
+    parser.add_argument('--manifest', help='Run manifest written by plan.py, run in its order')
+    parser.add_argument('--sys', nargs='+', default=['tz'], help='Setups (tz, base, strawman)')
+    parser.add_argument('--stress', nargs='+', default=['s'], help='Stress modes')
+    parser.add_argument('--cache', nargs='+', type=int, default=[0], help='Cache levels')
+    parser.add_argument('--model', nargs='+', default=['llama'], help='Models')
+    parser.add_argument('--prompt', nargs='+', type=int, default=[32], help='Prompts')
+    parser.add_argument('--n', nargs='+', type=int, default=[1], help='Tokens to decode')
+    parser.add_argument('--targets', nargs='+',
+                        help='hdc target serials (default: every board in `hdc list targets`)')
+    parser.add_argument('--soft-reset', action='store_true',
+                        help='Clean up boards between points instead of rebooting them')
+    parser.add_argument('--no-channel', action='store_true',
+                        help='Poll over one-shot hdc commands instead of a device agent session')
+    parser.add_argument('--results-dir', default=sweep.RESULTS_DIR,
+                        help=f'Results directory (default: {sweep.RESULTS_DIR})')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Repeat points until their 95%% CI is narrower than --target-ci')
+    parser.add_argument('--target-ci', type=float, default=0.05,
+                        help='Target CI half width relative to the mean (default: 0.05)')
+    parser.add_argument('--min-runs', type=int, default=3, help='Runs per point before stopping')
+    parser.add_argument('--max-runs', type=int, default=10, help='Run budget per point')
+    parser.add_argument('--budget', type=int, help='Run budget of the whole invocation')
+    parser.add_argument('--fake', type=int, default=0, metavar='N',
+                        help='Run on N local fake devices instead of boards')
+    parser.add_argument('--fake-time', type=float, default=0.1,
+                        help='Seconds a fake device spends per point')
+
+    args = parser.parse_args()
+
+    devices = build_devices(args)
+    if not devices:
+        print("❌ Error: no devices found")
+        sys.exit(1)
+
+    if args.spec or args.manifest:
+        if args.manifest:
+            jobs = plan.manifest_jobs(plan.read_manifest(args.manifest))
+        else:
+            jobs = plan.manifest_jobs(plan.plan(args.spec, args.results_dir, args.soft_reset))
+        scheduler = ManifestScheduler(devices, args.results_dir)
+        scheduler.run(jobs)
+        if scheduler.failed:
+            print(f"❌ {len(scheduler.failed)} run(s) failed: "
+                  f"{' '.join(p.name for p in scheduler.failed)}")
+            sys.exit(1)
+        return
+
+    points = build_points(args)
+    if args.adaptive:
+        scheduler = AdaptiveScheduler(devices, args.results_dir, args.target_ci,
+                                      args.min_runs, args.max_runs, args.budget)
+    else:
+        scheduler = FleetScheduler(devices, args.results_dir)
+    scheduler.run(points)
+
+    if scheduler.failed:
+        print(f"❌ {len(scheduler.failed)} point(s) failed: "
+              f"{' '.join(p.name for p in scheduler.failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
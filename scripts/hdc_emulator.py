@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Hermetic board emulator
+Impersonates `hdc` (shell, file send/recv, list targets, reboot) and the
+mem-stress.sh and infer.sh result contracts, so the harness can run without a board.
+Only the shell commands the harness sends are emulated, nothing runs on the host.
+Put scripts/emu first in PATH to use it:
+
+    PATH=scripts/emu:$PATH HDC_EMU_DIR=/tmp/hdc-emu ./scripts/run-mem-retry.sh tz s 0 32 llama 1
+
+Every board is a directory under $HDC_EMU_DIR standing in for its file
+system, with its boot state in state.json. Latencies, reboot time and TTFT
+distributions come from $HDC_EMU_DIR/config.json (see DEFAULT_CONFIG), and
+every hdc call and measurement is appended to $HDC_EMU_DIR/log.jsonl.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import random
+import shlex
+import shutil
+import sys
+import threading
+import time
+
+EMU_DIR = os.environ.get('HDC_EMU_DIR', '/tmp/hdc-emu')
+MEASURE_FILE = '/dev/shm/current_measure'
+MEASURE_DONE_FILE = '/dev/shm/current_measure.done'
+PRESSURE_DIR = '/data/local/tmp/rknpu/pressure'
+SSD_MOUNT = '/dev/block/nvme0n1p1 /data/ssd ext4 rw,relatime 0 0'
+
+DEFAULT_CONFIG = {
+    'targets': ['emu-0'],
+    # Every emulated delay is multiplied by this, the harness's own sleeps are not
+    'time_scale': 1.0,
+    # Round trip of one hdc invocation, s
+    'command_latency': 0.05,
+    # File transfer bandwidth, bytes/s
+    'bandwidth': 20e6,
+    'reboot_time': 30.0,
+    'soft_reset_time': 2.0,
+    # Share of soft reset checks that find the board dirty
+    'dirty_rate': 0.0,
+    # Share of mem-stress.sh runs that never produce a result
+    'failure_rate': 0.0,
+    # mem-stress.sh warm-up until the steady state (s, [mean, stddev]): after mounting the
+    # SSD, then with stress-ng or without; the script gives up after settle_timeout
+    'settle': {'mount': [3.5, 0.5], 'stress': [9.0, 3.0], 'idle': [3.2, 0.2]},
+    'settle_timeout': 45.0,
+    # TTFT (ms) at cache level 0 as [mean, stddev], each level saves 15%
+    'ttft': {'base': [900.0, 40.0], 'tz': [1100.0, 50.0], 'strawman': [5200.0, 200.0]},
+    # Decoding speed (tokens/s) as [mean, stddev]
+    'decoding_thpt': {'base': [9.0, 0.2], 'tz': [8.8, 0.2], 'strawman': [7.5, 0.3]},
+}
+
+
+def load_config(emu_dir=EMU_DIR):
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(os.path.join(emu_dir, 'config.json'), 'r') as f:
+            config.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    return config
+
+
+def write_config(emu_dir, **overrides):
+    """Set up an emulator directory, return its config"""
+    os.makedirs(emu_dir, exist_ok=True)
+    config = dict(DEFAULT_CONFIG, **overrides)
+    with open(os.path.join(emu_dir, 'config.json'), 'w') as f:
+        json.dump(config, f, indent=1)
+    return config
+
+
+def read_log(emu_dir=EMU_DIR):
+    try:
+        with open(os.path.join(emu_dir, 'log.jsonl'), 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+class Board:
+    """File system and boot state of one emulated board"""
+
+    def __init__(self, serial, emu_dir=EMU_DIR, config=None):
+        self.serial = serial
+        self.emu_dir = emu_dir
+        self.config = config or load_config(emu_dir)
+        self.dir = os.path.join(emu_dir, serial)
+        self.root = os.path.join(self.dir, 'root')
+        self.random = random.Random()
+        os.makedirs(os.path.join(self.root, 'dev', 'shm'), exist_ok=True)
+        os.makedirs(os.path.join(self.root, 'data', 'local', 'tmp', 'rknpu'), exist_ok=True)
+
+    # State shared by every hdc process of this board
+
+    def _locked_state(self, update=None):
+        with open(os.path.join(self.dir, 'state.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            path = os.path.join(self.dir, 'state.json')
+            try:
+                with open(path, 'r') as f:
+                    state = json.load(f)
+            except (FileNotFoundError, ValueError):
+                state = {'boot': 0, 'online_at': 0.0, 'mounted': False}
+            if update:
+                update(state)
+                with open(path + '.tmp', 'w') as f:
+                    json.dump(state, f)
+                os.replace(path + '.tmp', path)
+            return state
+
+    def state(self):
+        return self._locked_state()
+
+    def online(self):
+        return time.time() >= self.state()['online_at']
+
+    def sleep(self, seconds):
+        time.sleep(max(0.0, seconds) * self.config['time_scale'])
+
+    def log(self, kind, **fields):
+        entry = dict(time=time.time(), serial=self.serial, kind=kind, **fields)
+        with open(os.path.join(self.emu_dir, 'log.jsonl'), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def path(self, remote):
+        """Host path of a device path"""
+        return os.path.join(self.root, remote.lstrip('/'))
+
+    # Device operations
+
+    def reboot(self):
+        def update(state):
+            state['boot'] += 1
+            state['online_at'] = time.time() + self.config['reboot_time'] * self.config['time_scale']
+            state['mounted'] = False
+        self._locked_state(update)
+        # tmpfs and the mounts do not survive a reboot
+        shutil.rmtree(self.path('/dev/shm'), ignore_errors=True)
+        shutil.rmtree(self.path('/proc'), ignore_errors=True)
+        os.makedirs(self.path('/dev/shm'), exist_ok=True)
+        self.log('reboot')
+
+    def mount(self):
+        """Mount the SSD, listed in /proc/mounts until the next reboot"""
+        self._locked_state(lambda state: state.update(mounted=True))
+        os.makedirs(self.path('/proc'), exist_ok=True)
+        with open(self.path('/proc/mounts'), 'w') as f:
+            f.write(SSD_MOUNT + '\n')
+
+    def soft_reset(self, action):
+        if action == 'baseline':
+            return 0, '1000000 500000'
+        self.sleep(self.config['soft_reset_time'])
+        if self.random.random() < self.config['dirty_rate']:
+            return 1, 'dirty: CmaFree 400000 < 500000'
+        return 0, 'clean'
+
+    def mem_stress(self, args):
+        """mem-stress.sh contract: result in current_measure, then the done marker"""
+        setup, stress, cache, prompt, model, n = args[:6]
+        boot = self.state()['boot']
+        start = time.time()
+        warmup, timed_out = 0.0, 0
+        profile = self.path(f'{PRESSURE_DIR}/{stress}.prof')
+        # A pressure profile starts after the idle baseline has settled
+        phases = ['stress' if stress == 's' else 'idle']
+        if not self.state()['mounted']:
+            phases.insert(0, 'mount')
+        for phase in phases:
+            mean, sd = self.config['settle'][phase]
+            settle = max(3.0, self.random.gauss(mean, sd))
+            if settle > self.config['settle_timeout']:
+                settle, timed_out = self.config['settle_timeout'], 1
+            self.sleep(settle)
+            warmup += settle
+            if phase == 'mount':
+                self.mount()
+
+        ttft, thpt, inference = self._inference(setup, cache, n)
+
+        if self.random.random() < self.config['failure_rate']:
+            self.log('measure', args=args, ok=False, useful=0.0, elapsed=time.time() - start)
+            return 1, 'inference failed'
+        if self.state()['boot'] != boot:
+            # Rebooted while running, the result is lost with /dev/shm
+            return 1, ''
+        with open(self.path(MEASURE_FILE), 'w') as f:
+            f.write(f"ttft: {ttft:.2f}\ndecoding_thpt: {thpt:.2f}\n")
+            if os.path.exists(profile):
+                f.write(f"pressure_profile: {stress}\n{self.pressure(profile, inference)}")
+            f.write(f"warmup: {warmup:.2f}\nwarmup_timed_out: {timed_out}\n")
+        open(self.path(MEASURE_DONE_FILE), 'w').close()
+        self.log('measure', args=args, ok=True, useful=inference * self.config['time_scale'],
+                 elapsed=time.time() - start)
+        return 0, f'Running {setup}...'
+
+    def _inference(self, setup, cache, n):
+        """Run of the inference binary: (ttft ms, decoding tokens/s, duration s)"""
+        mean, sd = self.config['ttft'].get(setup, self.config['ttft']['tz'])
+        ttft = max(1.0, self.random.gauss(mean, sd)) * (1 - 0.15 * int(cache))
+        mean, sd = self.config['decoding_thpt'].get(setup, self.config['decoding_thpt']['tz'])
+        thpt = max(0.1, self.random.gauss(mean, sd))
+        inference = ttft / 1000 + (int(n) - 1) / thpt
+        self.sleep(inference)
+        return ttft, thpt, inference
+
+    def infer(self, args):
+        """infer.sh contract: one inference run, result in current_measure"""
+        setup, cache, prompt, model, n = args[:5]
+        ttft, thpt, inference = self._inference(setup, cache, n)
+        if self.random.random() < self.config['failure_rate']:
+            return 1, 'inference failed'
+        with open(self.path(MEASURE_FILE), 'w') as f:
+            f.write(f"ttft: {ttft:.2f}\ndecoding_thpt: {thpt:.2f}\n")
+        self.log('infer', args=args, useful=inference * self.config['time_scale'])
+        return 0, f'Running {setup}...'
+
+    def pressure(self, profile, duration):
+        """pressure.sh contract: samples in current_measure.pressure, summary returned"""
+        phases = []
+        with open(profile) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 5 and not fields[0].startswith('#'):
+                    target = fields[1]
+                    # Percentages of an 8 GiB board
+                    mb = int(target[:-1]) * 80 if target.endswith('%') else int(target)
+                    phases += [mb] * int(fields[0])
+        now = int(time.time())
+        samples = [(now + t, phases[t % len(phases)]) for t in range(max(1, int(duration)))]
+        with open(self.path(f'{MEASURE_FILE}.pressure'), 'w') as f:
+            f.write("# epoch target_mb rss_mb mem_available_mb\n")
+            for epoch, target in samples:
+                f.write(f"{epoch} {target} {target} {8000 - target}\n")
+        targets = [target for _, target in samples]
+        mean = sum(targets) / len(targets)
+        return (f"pressure_target_mb: {int(mean)}\npressure_rss_mean_mb: {mean:.1f}\n"
+                f"pressure_rss_max_mb: {max(targets)}\nmem_available_min_mb: {8000 - max(targets)}\n")
+
+    def run(self, command):
+        """Run a device shell command line, return (exit code, output)
+
+        Lists are split on ';' and '&&' only, which is all the harness sends.
+        """
+        rc, out = 0, []
+        for sequence in command.split(';'):
+            for segment in sequence.split('&&'):
+                rc, text = self._redirected(segment.strip())
+                if text:
+                    out.append(text)
+                if rc != 0:
+                    break
+        return rc, '\n'.join(out)
+
+    def _redirected(self, command):
+        """One simple command with its >, 2> and 2>&1 redirections"""
+        try:
+            words = shlex.split(command)
+        except ValueError:
+            return 2, f'sh: syntax error: {command}'
+        args, targets = [], {}
+        while words:
+            word = words.pop(0)
+            stream, arrow, target = word.partition('>')
+            if not arrow or stream not in ('', '1', '2'):
+                args.append(word)
+                continue
+            if not target and words:
+                target = words.pop(0)
+            targets[stream or '1'] = target
+        if not args:
+            return 0, ''
+        rc, out, err = self._simple(args)
+        for stream in ('1', '2'):
+            text = out if stream == '1' else err
+            target = targets.get(stream)
+            if target in (None, '&1', '&2'):
+                continue
+            if target != '/dev/null':
+                with open(self.path(target), 'w') as f:
+                    f.write(text + '\n' if text else '')
+            if stream == '1':
+                out = ''
+            else:
+                err = ''
+        return rc, '\n'.join(text for text in (out, err) if text)
+
+    def _simple(self, words):
+        """(exit code, stdout, stderr) of a command the emulated board knows"""
+        name, args = os.path.basename(words[0]), words[1:]
+        if name == 'sh' and args:
+            name, args = os.path.basename(args[0]), args[1:]
+        options = [a for a in args if a.startswith('-')]
+        paths = [a for a in args if not a.startswith('-')]
+        missing = [p for p in paths if not os.path.exists(self.path(p))]
+
+        if name == 'echo':
+            return 0, ' '.join(args), ''
+        if name == 'reboot':
+            self.reboot()
+            return 0, '', ''
+        if name in ('mem-stress.sh', 'infer.sh', 'soft-reset.sh'):
+            if name == 'mem-stress.sh':
+                rc, text = self.mem_stress(args)
+            elif name == 'infer.sh':
+                rc, text = self.infer(args)
+            else:
+                rc, text = self.soft_reset(args[0] if args else 'check')
+            return (rc, text, '') if rc == 0 else (rc, '', text)
+        if name in ('true', 'sync', 'stty', 'set-npu-irq.sh'):
+            return 0, '', ''
+        if name == 'mount':
+            self.mount()
+            return 0, '', ''
+        if name == 'sleep':
+            self.sleep(float(args[0]) if args else 0.0)
+            return 0, '', ''
+        if name == 'ls':
+            found = ['\n'.join(sorted(os.listdir(self.path(p)))) if os.path.isdir(self.path(p))
+                     else p for p in paths if p not in missing]
+            return (1 if missing else 0, '\n'.join(found),
+                    '\n'.join(f'ls: {p}: No such file or directory' for p in missing))
+        if name == 'rm':
+            for p in paths:
+                if os.path.isdir(self.path(p)) and any('r' in o for o in options):
+                    shutil.rmtree(self.path(p))
+                elif os.path.isfile(self.path(p)):
+                    os.remove(self.path(p))
+            if missing and not any('f' in o for o in options):
+                return 1, '', '\n'.join(f'rm: {p}: No such file or directory' for p in missing)
+            return 0, '', ''
+        if name == 'mkdir':
+            for p in paths:
+                os.makedirs(self.path(p), exist_ok=True)
+            return 0, '', ''
+        if name == 'touch':
+            for p in paths:
+                open(self.path(p), 'a').close()
+            return 0, '', ''
+        if name == 'chmod':
+            # Modes are not emulated, the files only have to exist
+            missing = [p for p in paths[1:] if not os.path.exists(self.path(p))]
+            return (1 if missing else 0, '',
+                    '\n'.join(f'chmod: {p}: No such file or directory' for p in missing))
+        if name == 'cat':
+            text = ''.join(open(self.path(p)).read() for p in paths if p not in missing)
+            return (1 if missing else 0, text.rstrip('\n'),
+                    '\n'.join(f'cat: {p}: No such file or directory' for p in missing))
+        if name == 'stat' and args[:1] == ['-c'] and len(args) > 1:
+            missing = [p for p in args[2:] if not os.path.exists(self.path(p))]
+            lines = [args[1].replace('%s', str(os.path.getsize(self.path(p)))).replace('%n', p)
+                     for p in args[2:] if p not in missing]
+            return (1 if missing else 0, '\n'.join(lines),
+                    '\n'.join(f"stat: can't stat '{p}': No such file or directory"
+                              for p in missing))
+        if name == 'sha256sum':
+            lines = []
+            for p in paths:
+                if p not in missing:
+                    with open(self.path(p), 'rb') as f:
+                        lines.append(f'{hashlib.sha256(f.read()).hexdigest()}  {p}')
+            return (1 if missing else 0, '\n'.join(lines),
+                    '\n'.join(f'sha256sum: {p}: No such file or directory' for p in missing))
+        return 127, '', f'sh: {words[0]}: not found'
+
+    def transfer(self, kind, source, dest):
+        """Copy a file onto (send) or off (recv) the board"""
+        if kind == 'send':
+            source_path, dest_path = source, self.path(dest)
+        else:
+            source_path, dest_path = self.path(source), dest
+        if not os.path.isfile(source_path):
+            return 1, f'[Fail]Error opening file: {source}'
+        size = os.path.getsize(source_path)
+        self.sleep(size / self.config['bandwidth'])
+        if dest_path.endswith('/') or os.path.isdir(dest_path):
+            dest_path = os.path.join(dest_path, os.path.basename(source_path))
+        os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+        shutil.copyfile(source_path, dest_path)
+        self.log(kind, bytes=size)
+        return 0, f'FileTransfer finish, Size:{size}, File count = 1'
+
+    def agent(self, stdin, stdout):
+        """Same protocol as agent.sh, for scripts/channel.py"""
+        lock = threading.Lock()
+
+        def emit(text):
+            with lock:
+                stdout.write(text)
+                stdout.flush()
+
+        def request(request_id, command):
+            rc, out = self.run(command)
+            lines = ''.join(f'@@{request_id}:{line}\n' for line in out.splitlines())
+            emit(f'{lines}\n@@{request_id}={rc}\n')
+
+        def watch():
+            armed = True
+            while True:
+                if os.path.exists(self.path(MEASURE_DONE_FILE)):
+                    if armed:
+                        emit('@@!measure_done\n')
+                        armed = False
+                else:
+                    armed = True
+                time.sleep(0.2)
+
+        threading.Thread(target=watch, daemon=True).start()
+        emit('@@!ready\n')
+        for line in stdin:
+            request_id, _, command = line.strip().partition(' ')
+            if request_id:
+                threading.Thread(target=request, args=(request_id, command), daemon=True).start()
+
+
+def interactive(board, stdin=sys.stdin, stdout=sys.stdout):
+    """`hdc shell` without a command: a line-based shell that can exec the agent"""
+    for line in stdin:
+        line = line.strip()
+        if line.startswith('exec ') and line.endswith('agent.sh'):
+            board.agent(stdin, stdout)
+            return 0
+        if line == 'exit':
+            return 0
+        rc, out = board.run(line)
+        if out:
+            stdout.write(out + '\n')
+            stdout.flush()
+    return 0
+
+
+def hdc(argv, emu_dir=EMU_DIR):
+    """Entry point of the fake hdc binary, returns the exit code"""
+    config = load_config(emu_dir)
+    serial = None
+    if argv[:1] == ['-t'] and len(argv) > 1:
+        serial, argv = argv[1], argv[2:]
+    if not argv:
+        print('usage: hdc [-t serial] shell|file|list ...')
+        return 1
+
+    if argv[:2] == ['list', 'targets']:
+        online = [s for s in config['targets'] if Board(s, emu_dir, config).online()]
+        print('\n'.join(online) if online else '[Empty]')
+        return 0
+
+    board = Board(serial or config['targets'][0], emu_dir, config)
+    if board.serial not in config['targets']:
+        print(f'[Fail]Not match target founded, check connect-key please')
+        return 1
+    board.sleep(config['command_latency'])
+    board.log('hdc', command=argv[0])
+    if not board.online():
+        print('[Fail]Device not founded or connected')
+        return 1
+
+    if argv[0] == 'shell':
+        if len(argv) == 1:
+            return interactive(board)
+        command = ' '.join(argv[1:])
+        # hdc passes a single quoted command line through unquoted
+        if len(command) > 1 and command[0] == command[-1] and command[0] in '"\'':
+            command = command[1:-1]
+        rc, out = board.run(command)
+        if out:
+            print(out)
+        return rc
+    if argv[0] == 'file' and len(argv) == 4 and argv[1] in ('send', 'recv'):
+        rc, out = board.transfer(argv[1], argv[2], argv[3])
+        print(out)
+        return rc
+    print(f'[Fail]Unknown command: {" ".join(argv)}')
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(hdc(sys.argv[1:]))
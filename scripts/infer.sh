@@ -0,0 +1,42 @@
+#!/bin/sh
+# One inference run, as mem-stress.sh and loadgen.py start it.
+#
+#   infer.sh <setup> <cache> <len> <model> <n>
+#
+# The binary writes its measurement to /dev/shm/current_measure.
+
+setup=$1
+cache=$2
+len=$3
+model=$4
+n=$5
+
+if [ "$model" = "tinyllama" ]; then
+    model_path="/data/ssd/tinyllama-1.1b-chat-v1.0.Q8_0.gguf"
+elif [ "$model" = "gemma" ]; then
+    model_path="/data/ssd/gemma-2-2b-it-Q8_0.gguf"
+elif [ "$model" = "qwen" ]; then
+    model_path="/data/ssd/qwen2.5-3b-instruct-q8_0.gguf"
+elif [ "$model" = "phi" ]; then
+    model_path="/data/ssd/Phi-3-mini-4k-instruct.Q8_0.gguf"
+elif [ "$model" = "llama" ]; then
+    model_path="/data/ssd/Meta-Llama-3-8B-Instruct.Q8_0.gguf"
+else
+    echo "invalid model $model"
+    exit 1
+fi
+
+if [ "$setup" = "base" ]; then
+    echo "Running baseline..."
+    echo "111: $model#$len"
+    LD_LIBRARY_PATH=/data/local/tmp/rknpu/ /data/local/tmp/rknpu/ld-linux-aarch64.so.1 /data/local/tmp/rknpu/llama-cli --no-warmup -m $model_path -p "$model#$len" -n $n --cache $cache -s 1 -ngl 100 -t 4 --no-mmap -c 1124
+elif [ "$setup" = "tz" ]; then
+    echo "Running TZ-LLM..."
+    LD_LIBRARY_PATH=/data/local/tmp/rknpu/ /data/local/tmp/rknpu/ld-linux-aarch64.so.1 /data/local/tmp/rknpu/fake -c $cache -l $len -m $model -n $n -s 0
+elif [ "$setup" = "strawman" ]; then
+    echo "Running Strawman..."
+    LD_LIBRARY_PATH=/data/local/tmp/rknpu/ /data/local/tmp/rknpu/ld-linux-aarch64.so.1 /data/local/tmp/rknpu/fake -c $cache -l $len -m $model -n $n -s 1
+else
+    echo "invalid setup $setup"
+    exit 1
+fi
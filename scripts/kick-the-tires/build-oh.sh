@@ -11,14 +11,5 @@ cp $CURRENT_DIR/build-oh-docker.sh $SHARE_DIR/
 
 $CURRENT_DIR/oh-builder.sh $SHARE_DIR bash -c ./build-oh-docker.sh
 
-for file in $SHARE_DIR/rknpu/*; do
-    if [ -f "$file" ]; then
-        hdc file send "$file" /data/local/tmp/rknpu/
-    fi
-done
-
-for file in $SHARE_DIR/build-rknpure/*; do
-    if [ -f "$file" ]; then
-        hdc file send "$file" /data/local/tmp/rknpu/
-    fi
-done
+# Only files that changed since the last deploy are sent
+python3 $ROOT_DIR/scripts/sync.py $SHARE_DIR/rknpu $SHARE_DIR/build-rknpure
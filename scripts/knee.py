@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Adaptive cache-proportion sweep
+Instead of the full cache level x prompt grid of cache.sh, every TTFT curve
+is bisected only where it bends, and the measured curves give a recommended
+cache proportion for a memory budget and prompt length
+"""
+
+import argparse
+import bisect
+import logging
+import re
+import statistics
+import sys
+import threading
+
+import sweep
+from fleet import FleetScheduler, build_devices
+
+logger = logging.getLogger(__name__)
+
+# Cache levels understood by the inference binaries, level / 5 of the
+# parameters stays in secure memory
+LEVELS = [0, 1, 2, 3, 4, 5]
+# Approximate size of the model files mem-stress.sh loads, in bytes
+MODEL_BYTES = {
+    'tinyllama': 1.17e9,
+    'gemma': 2.78e9,
+    'qwen': 3.62e9,
+    'phi': 4.06e9,
+    'llama': 8.54e9,
+}
+# Completed runs of a level, per run wanted, before a level without a TTFT is given up
+MAX_ATTEMPTS = 3
+
+
+def parse_size(text):
+    """Bytes of a size like 6144M or 4G, as in mem-stress.sh"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMGT]?)B?', text.strip().upper())
+    if not match:
+        raise ValueError(f"invalid size {text}")
+    value, unit = match.groups()
+    return float(value) * 1024 ** ' KMGT'.index(unit or ' ')
+
+
+class KneeSearch:
+    """TTFT over cache levels of one curve, bisected where it is not linear
+
+    An interval of levels is split at its middle level; when the TTFT measured
+    there is within `tolerance` (relative to the TTFT range of the curve) of the
+    chord through the interval ends, the interval counts as linear and is not
+    refined further. A level whose runs keep producing no TTFT (failed
+    inference, OOM under stress) is given up after `MAX_ATTEMPTS * runs` runs,
+    and the bisection goes on over the remaining levels.
+    """
+
+    def __init__(self, curve, levels=LEVELS, tolerance=0.1, runs=1):
+        self.curve = curve
+        self.levels = sorted(levels)
+        self.tolerance = tolerance
+        self.runs = runs
+        self.values = {level: [] for level in self.levels}
+        # Completed runs, whether or not their result file has a TTFT
+        self.attempts = {level: 0 for level in self.levels}
+
+    def point(self, level):
+        setup, stress, prompt, model, n = self.curve
+        return sweep.SweepPoint(setup, stress, level, prompt, model, n)
+
+    def record(self, level, ttft):
+        """Count a completed run, with its TTFT or None when the result has none"""
+        self.attempts[level] += 1
+        if ttft is not None:
+            self.values[level].append(ttft)
+
+    def failed(self, level):
+        """Whether a level is given up, its runs having produced too few TTFTs"""
+        return (len(self.values[level]) < self.runs and
+                self.attempts[level] >= MAX_ATTEMPTS * self.runs)
+
+    def load(self, results_dir=sweep.RESULTS_DIR):
+        """Record the TTFTs already on disk, return the repetitions found per point"""
+        found = sweep.repetitions([self.point(level) for level in self.levels], results_dir)
+        for point, paths in found.items():
+            for path in paths.values():
+                ttft = sweep.read_result(path).get('ttft')
+                self.record(point.cache, ttft if isinstance(ttft, float) else None)
+        return found
+
+    def measured(self):
+        """Mean TTFT of every level with enough runs"""
+        return {level: statistics.fmean(values) for level, values in self.values.items()
+                if len(values) >= self.runs}
+
+    def _stderr(self, level):
+        values = self.values[level]
+        return statistics.stdev(values) / len(values) ** 0.5 if len(values) > 1 else 0.0
+
+    def _linear(self, measured, a, m, b):
+        span = max(measured.values()) - min(measured.values())
+        weight = (m - a) / (b - a)
+        chord = measured[a] + (measured[b] - measured[a]) * weight
+        # With repeated runs, deviations within twice the standard error are noise
+        noise = 2 * (self._stderr(m) ** 2 + ((1 - weight) * self._stderr(a)) ** 2 +
+                     (weight * self._stderr(b)) ** 2) ** 0.5
+        return abs(measured[m] - chord) <= max(self.tolerance * span, noise)
+
+    def wanted(self):
+        """Levels that need more runs before the curve is resolved"""
+        measured = self.measured()
+        levels = [level for level in self.levels if not self.failed(level)]
+        if not levels:
+            return []
+        ends = [level for level in (levels[0], levels[-1]) if level not in measured]
+        if ends:
+            return ends
+        wanted = []
+        intervals = [(0, len(levels) - 1)]
+        while intervals:
+            a, b = intervals.pop()
+            if b - a < 2:
+                continue
+            m = (a + b) // 2
+            la, lm, lb = levels[a], levels[m], levels[b]
+            if lm not in measured:
+                wanted.append(lm)
+            elif not self._linear(measured, la, lm, lb):
+                intervals += [(a, m), (m, b)]
+        return wanted
+
+    def predict(self, level):
+        """TTFT at a level, interpolated between the measured levels"""
+        measured = self.measured()
+        known = sorted(measured)
+        i = bisect.bisect_left(known, level)
+        if i < len(known) and known[i] == level:
+            return measured[level]
+        if i == 0 or i == len(known):
+            return None
+        lo, hi = known[i - 1], known[i]
+        return measured[lo] + (measured[hi] - measured[lo]) * (level - lo) / (hi - lo)
+
+    def knee(self):
+        """Level where the TTFT curve bends, from a least-squares hinge fit
+
+        The last level when a straight line already fits within the tolerance.
+        """
+        measured = self.measured()
+        known = sorted(measured)
+        if len(known) < 3:
+            return known[-1] if known else None
+        ys = [measured[level] for level in known]
+        span = max(ys) - min(ys)
+        line = _residuals(known, ys, [lambda x: 1.0, lambda x: x])
+        if max(abs(r) for r in line) <= self.tolerance * span:
+            return known[-1]
+        fits = []
+        for knee in known[1:-1]:
+            residuals = _residuals(known, ys, [lambda x: 1.0, lambda x: x,
+                                               lambda x, k=knee: max(0.0, x - k)])
+            fits.append((sum(r * r for r in residuals), knee))
+        return min(fits)[1]
+
+
+def _residuals(xs, ys, basis):
+    """Residuals of the least-squares fit of ys by a linear combination of basis(x)"""
+    rows = [[f(x) for f in basis] for x in xs]
+    n = len(basis)
+    # Normal equations, solved by Gaussian elimination
+    a = [[sum(r[i] * r[j] for r in rows) for j in range(n)] +
+         [sum(r[i] * y for r, y in zip(rows, ys))] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        if a[col][col] == 0:
+            continue
+        for r in range(n):
+            if r != col:
+                factor = a[r][col] / a[col][col]
+                a[r] = [v - factor * w for v, w in zip(a[r], a[col])]
+    coef = [a[i][n] / a[i][i] if a[i][i] else 0.0 for i in range(n)]
+    return [y - sum(c * v for c, v in zip(coef, r)) for r, y in zip(rows, ys)]
+
+
+class KneeScheduler(FleetScheduler):
+    """Runs only the cache levels the knee searches ask for, as devices free up"""
+
+    def __init__(self, devices, results_dir=sweep.RESULTS_DIR, levels=LEVELS,
+                 tolerance=0.1, runs=1):
+        super().__init__(devices, results_dir)
+        self.levels = levels
+        self.tolerance = tolerance
+        self.runs = runs
+        self.cond = threading.Condition(self.lock)
+        self.searches = []
+        self.next_repetition = {}
+        self.in_flight = {}
+
+    def start(self, curves):
+        for curve in curves:
+            search = KneeSearch(curve, self.levels, self.tolerance, self.runs)
+            for point, found in search.load(self.results_dir).items():
+                self.next_repetition[point] = max(found, default=-1) + 1
+                self.in_flight[point] = 0
+            self.searches.append(search)
+        logger.info(f"{len(curves)} curve(s) over cache levels {self.levels}, "
+                    f"{len(self.devices)} device(s)")
+
+    def _next_point(self):
+        for search in self.searches:
+            for level in search.wanted():
+                point = search.point(level)
+                in_flight = self.in_flight[point]
+                if (len(search.values[level]) + in_flight < self.runs and
+                        search.attempts[level] + in_flight < MAX_ATTEMPTS * self.runs):
+                    return point
+        return None
+
+    def next_job(self, device=None):
+        with self.cond:
+            while True:
+                point = self._next_point()
+                if point is not None:
+                    repetition = self.next_repetition[point]
+                    self.next_repetition[point] += 1
+                    self.in_flight[point] += 1
+                    return point, repetition
+                if not any(self.in_flight.values()):
+                    return None
+                # Wait for results that decide where the searches go next
+                self.cond.wait()
+
+    def _search(self, point):
+        curve = (point.setup, point.stress, point.prompt, point.model, point.n)
+        return next(search for search in self.searches if search.curve == curve)
+
+    def job_done(self, point, repetition, output_file):
+        with self.cond:
+            ttft = sweep.read_result(output_file).get('ttft')
+            search = self._search(point)
+            search.record(point.cache, ttft if isinstance(ttft, float) else None)
+            if search.failed(point.cache):
+                logger.warning(f"{point.name}: no TTFT in {search.attempts[point.cache]} runs, "
+                               f"giving up the level")
+            self.in_flight[point] -= 1
+            self.done.append(point)
+            self.cond.notify_all()
+
+    def job_failed(self, point, repetition):
+        with self.cond:
+            self.in_flight[point] -= 1
+            self.cond.notify_all()
+
+    def finish(self):
+        for search in self.searches:
+            measured = search.measured()
+            given_up = [level for level in search.levels if search.failed(level)]
+            self.failed.extend(search.point(level) for level in given_up + search.wanted())
+            logger.info(f"{'-'.join(str(v) for v in search.curve)}: measured levels "
+                        f"{sorted(measured)} of {len(self.levels)}, knee at level {search.knee()}")
+
+
+def load_searches(curves, results_dir=sweep.RESULTS_DIR, levels=LEVELS, tolerance=0.1, runs=1):
+    """Knee searches filled with the results already on disk"""
+    searches = []
+    for curve in curves:
+        search = KneeSearch(curve, levels, tolerance, runs)
+        search.load(results_dir)
+        searches.append(search)
+    return searches
+
+
+def recommend(searches, prompt, budget, model_bytes, slack=0.05):
+    """(level, predicted TTFT) for a memory budget and prompt length, or None
+
+    Among the levels whose cached share of the model fits into `budget` bytes,
+    this is the smallest one whose TTFT is within `slack` of the best,
+    i.e. caching beyond the knee is not recommended. The TTFT of a prompt
+    length between two measured ones is interpolated.
+    """
+    by_prompt = sorted((search.curve[2], search) for search in searches if search.measured())
+    if not by_prompt:
+        return None
+    prompts = [p for p, _ in by_prompt]
+    i = bisect.bisect_left(prompts, prompt)
+    if i == len(prompts) or prompts[i] == prompt:
+        lower = upper = by_prompt[min(i, len(prompts) - 1)]
+    else:
+        lower, upper = by_prompt[max(i - 1, 0)], by_prompt[i]
+
+    def predict(level):
+        lo = lower[1].predict(level)
+        hi = upper[1].predict(level)
+        if lo is None or hi is None:
+            return None
+        if upper[0] == lower[0]:
+            return lo
+        weight = (min(max(prompt, lower[0]), upper[0]) - lower[0]) / (upper[0] - lower[0])
+        return lo + (hi - lo) * weight
+
+    fitting = [level for level in lower[1].levels if level / LEVELS[-1] * model_bytes <= budget]
+    predicted = {level: predict(level) for level in fitting}
+    predicted = {level: ttft for level, ttft in predicted.items() if ttft is not None}
+    if not predicted:
+        return None
+    best = min(predicted.values())
+    for level in sorted(predicted):
+        if predicted[level] <= best * (1 + slack):
+            return level, predicted[level]
+
+
+def add_device_args(parser):
+    parser.add_argument('--targets', nargs='+',
+                        help='hdc target serials (default: every board in `hdc list targets`)')
+    parser.add_argument('--soft-reset', action='store_true',
+                        help='Clean up boards between points instead of rebooting them')
+    parser.add_argument('--no-channel', action='store_true',
+                        help='Poll over one-shot hdc commands instead of a device agent session')
+    parser.add_argument('--fake', type=int, default=0, metavar='N',
+                        help='Run on N local fake devices instead of boards')
+    parser.add_argument('--fake-time', type=float, default=0.1,
+                        help='Seconds a fake device spends per point')
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Adaptive cache-proportion sweep')
+    parser.add_argument('--sys', default='tz', help='Setup (default: tz)')
+    parser.add_argument('--stress', default='s', help='Stress mode (default: s)')
+    parser.add_argument('--model', nargs='+', default=['llama'], help='Models')
+    parser.add_argument('--n', type=int, default=1, help='Tokens to decode (default: 1)')
+    parser.add_argument('--levels', nargs='+', type=int, default=LEVELS,
+                        help='Cache levels to search (default: 0-5)')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Deviation from linear, relative to the TTFT range, that '
+                             'triggers a refinement (default: 0.1)')
+    parser.add_argument('--runs', type=int, default=1, help='Runs per measured level')
+    parser.add_argument('--results-dir', default=sweep.RESULTS_DIR,
+                        help=f'Results directory (default: {sweep.RESULTS_DIR})')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sweep_parser = sub.add_parser('sweep', help='Measure the TTFT curves around their knees')
+    sweep_parser.add_argument('--prompt', nargs='+', type=int, default=[32, 256, 512],
+                              help='Prompts (default: 32 256 512)')
+    add_device_args(sweep_parser)
+
+    recommend_parser = sub.add_parser('recommend', help='Recommend a cache proportion')
+    recommend_parser.add_argument('--budget', required=True,
+                                  help='Secure memory available for cached parameters, e.g. 4G')
+    recommend_parser.add_argument('--prompt', type=int, required=True, help='Prompt length')
+    recommend_parser.add_argument('--measured-prompts', nargs='+', type=int,
+                                  default=[32, 256, 512],
+                                  help='Prompts the curves were measured for')
+    recommend_parser.add_argument('--slack', type=float, default=0.05,
+                                  help='TTFT above the best fitting level that is traded for '
+                                       'less cached memory (default: 0.05)')
+    recommend_parser.add_argument('--model-size',
+                                  help='Size of the model parameters (default: known GGUF size)')
+
+    args = parser.parse_args()
+
+    if args.command == 'sweep':
+        devices = build_devices(args)
+        if not devices:
+            print("❌ Error: no devices found")
+            sys.exit(1)
+        curves = [(args.sys, args.stress, prompt, model, args.n)
+                  for model in args.model for prompt in args.prompt]
+        scheduler = KneeScheduler(devices, args.results_dir, args.levels,
+                                  args.tolerance, args.runs)
+        scheduler.run(curves)
+        grid = len(curves) * len(args.levels) * args.runs
+        print(f"Ran {len(scheduler.done)} point(s), the full grid is {grid}")
+        if scheduler.failed:
+            print(f"❌ {len(scheduler.failed)} point(s) failed: "
+                  f"{' '.join(p.name for p in scheduler.failed)}")
+            sys.exit(1)
+        return
+
+    budget = parse_size(args.budget)
+    for model in args.model:
+        curves = [(args.sys, args.stress, prompt, model, args.n)
+                  for prompt in args.measured_prompts]
+        searches = load_searches(curves, args.results_dir, args.levels, args.tolerance, args.runs)
+        model_bytes = parse_size(args.model_size) if args.model_size else MODEL_BYTES.get(model)
+        if model_bytes is None:
+            print(f"❌ {model}: unknown model size, pass --model-size")
+            continue
+        result = recommend(searches, args.prompt, budget, model_bytes, args.slack)
+        if result is None:
+            print(f"❌ {model}: no measured TTFT curve fits, run `knee.py sweep` first")
+            continue
+        level, ttft = result
+        share = level / LEVELS[-1]
+        knees = ', '.join(f"{s.curve[2]}: {s.knee()}" for s in searches if s.measured())
+        print(f"{model}, prompt {args.prompt}, budget {args.budget}: cache level {level} "
+              f"({share:.0%}, {share * model_bytes / 2 ** 30:.2f} GiB), "
+              f"predicted TTFT {ttft:.1f} ms (knee level per prompt: {knees})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator for the inference path
+Requests arrive on a Poisson process or at the times of a trace, whether or
+not earlier ones have finished, and wait in a FIFO queue for the board: one
+inference binary runs at a time per board. Every request pays the per-run
+setup of the binary, e.g. the secure memory of TZ-LLM. For each offered rate
+it reports the throughput reached and the TTFT (from arrival) and queueing
+delay percentiles, i.e. a throughput/latency curve. The mock backend models
+the service times, so curves can be drawn locally in virtual time
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from device import MEASURE_FILE, REMOTE_DIR, HdcDevice, list_targets
+
+logger = logging.getLogger(__name__)
+
+Request = namedtuple('Request', 'arrival prompt n')
+
+# Service time model of the mock backend, per setup: per-run setup (ms),
+# prefill (ms) before the prompt and per prompt token, decoding (tokens/s)
+MOCK_MODEL = {
+    'base': (0.0, 700.0, 3.0, 9.0),
+    'tz': (250.0, 700.0, 3.2, 8.8),
+    'strawman': (250.0, 4500.0, 12.0, 7.5),
+}
+# Relative stddev of the mock service times
+MOCK_NOISE = 0.05
+
+
+def parse_mix(text):
+    """[(value, weight)] of a mix like '32:0.5,256:0.3,1024:0.2' or '32'"""
+    mix = []
+    for item in text.split(','):
+        value, _, weight = item.partition(':')
+        mix.append((int(value), float(weight or 1)))
+    if not mix or any(weight < 0 for _, weight in mix) or sum(w for _, w in mix) <= 0:
+        raise ValueError(f"invalid mix {text}")
+    return mix
+
+
+def draw(mix, rng):
+    return rng.choices([value for value, _ in mix], [weight for _, weight in mix])[0]
+
+
+def poisson_arrivals(rate, count, rng):
+    """Arrival times (s) of count requests at a mean rate (requests/s)"""
+    arrivals, t = [], 0.0
+    for _ in range(count):
+        t += rng.expovariate(rate)
+        arrivals.append(t)
+    return arrivals
+
+
+def read_trace(path):
+    """[(arrival, prompt or None, n or None)] of a trace, one `<arrival_s>
+    [prompt n]` line per request"""
+    entries = []
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+            prompt, n = (int(fields[1]), int(fields[2])) if len(fields) >= 3 else (None, None)
+            entries.append((float(fields[0]), prompt, n))
+    entries.sort()
+    if not entries:
+        raise ValueError(f"{path}: empty trace")
+    return entries
+
+
+def make_requests(arrivals, prompts, outputs, rng):
+    """Requests at the arrival times, with prompt and output lengths drawn from
+    their mixes where a trace does not give them"""
+    requests = []
+    for arrival, prompt, n in arrivals:
+        requests.append(Request(arrival, prompt or draw(prompts, rng), n or draw(outputs, rng)))
+    return requests
+
+
+def scale_trace(trace, rate):
+    """Trace compressed or stretched in time to a mean arrival rate"""
+    span = trace[-1][0] - trace[0][0]
+    if rate is None or span <= 0:
+        return trace
+    factor = (len(trace) - 1) / span / rate
+    return [((arrival - trace[0][0]) * factor, prompt, n) for arrival, prompt, n in trace]
+
+
+class MockBackend:
+    """Service times of the MOCK_MODEL, without a board"""
+
+    realtime = False
+
+    def __init__(self, setup, cache=0, seed=None):
+        self.model = MOCK_MODEL[setup]
+        self.cache = cache
+        self.random = random.Random(seed)
+
+    def serve(self, request):
+        setup_ms, base_ms, token_ms, thpt = self.model
+        noise = max(0.5, self.random.gauss(1.0, MOCK_NOISE))
+        # Caching saves 15% of the prefill per level, as in the emulator
+        prefill = (base_ms + token_ms * request.prompt) * (1 - 0.15 * self.cache) * noise
+        ttft = setup_ms + prefill
+        thpt = thpt / noise
+        return {'ttft': ttft, 'decoding_thpt': thpt, 'setup': setup_ms,
+                'service': ttft / 1000 + (request.n - 1) / thpt}
+
+
+class HdcBackend:
+    """One infer.sh run per request on a board"""
+
+    realtime = True
+
+    def __init__(self, device, setup, model, cache=0):
+        self.device = device
+        self.setup = setup
+        self.model = model
+        self.cache = cache
+
+    def prepare(self):
+        """Push infer.sh, mount the SSD and route the NPU interrupts for the setup,
+        as mem-stress.sh does before its runs"""
+        self.device.prepare()
+        if self.device.shell(f'{REMOTE_DIR}/set-npu-irq.sh {self.setup}', timeout=30) is None:
+            logger.warning(f"[{self.device}] set-npu-irq.sh {self.setup} failed")
+        if ' /data/ssd ' not in (self.device.shell('cat /proc/mounts', timeout=10) or ''):
+            logger.info(f"[{self.device}] mounting /data/ssd")
+            self.device.shell('mount /dev/block/nvme0n1p1 /data/ssd/ && mkdir -p /dev/shm', timeout=60)
+
+    def serve(self, request):
+        start = time.monotonic()
+        out = self.device.shell(f'rm -f {MEASURE_FILE} && sh {REMOTE_DIR}/infer.sh {self.setup} '
+                                f'{self.cache} {request.prompt} {self.model} {request.n} '
+                                f'> /dev/null && cat {MEASURE_FILE}', timeout=600)
+        service = time.monotonic() - start
+        result = {}
+        for line in (out or '').splitlines():
+            key, sep, value = line.strip().partition(': ')
+            if sep:
+                try:
+                    result[key] = float(value)
+                except ValueError:
+                    pass
+        if 'ttft' not in result:
+            logger.warning(f"[{self.device}] request {request} failed")
+            return None
+        result['service'] = service
+        # Board time outside the binary's own prefill and decoding: the hdc round
+        # trip, loading the binary and its per-run setup
+        decode = (request.n - 1) / result['decoding_thpt'] if result.get('decoding_thpt') else 0.0
+        result['setup'] = max(0.0, service - result['ttft'] / 1000 - decode) * 1000
+        return result
+
+
+def _record(request, start, end, result):
+    record = {'arrival': request.arrival, 'prompt': request.prompt, 'n': request.n,
+              'start': start, 'end': end, 'queue': start - request.arrival, 'ok': result is not None}
+    if result is not None:
+        # TTFT as the user sees it: waiting for the board, then the binary's own TTFT
+        record['ttft'] = record['queue'] + result['ttft'] / 1000
+        record['service'] = end - start
+        if 'setup' in result:
+            record['setup'] = result['setup']
+    return record
+
+
+def simulate(requests, backends):
+    """FIFO queue in front of the backends, in virtual time"""
+    free = [(0.0, i) for i in range(len(backends))]
+    records = []
+    for request in requests:
+        free_at, i = heapq.heappop(free)
+        start = max(request.arrival, free_at)
+        result = backends[i].serve(request)
+        end = start + (result['service'] if result else 0.0)
+        heapq.heappush(free, (end, i))
+        records.append(_record(request, start, end, result))
+    return records
+
+
+def replay(requests, backends):
+    """FIFO queue in front of the backends, in real time: requests are queued
+    at their arrival times and each backend serves the oldest one when idle"""
+    pending = queue.Queue()
+    records = [None] * len(requests)
+    t0 = time.monotonic()
+
+    def serve(backend):
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            i, request = item
+            start = time.monotonic() - t0
+            result = backend.serve(request)
+            records[i] = _record(request, start, time.monotonic() - t0, result)
+
+    workers = [threading.Thread(target=serve, args=(backend,), daemon=True) for backend in backends]
+    for worker in workers:
+        worker.start()
+    for i, request in enumerate(requests):
+        delay = request.arrival - (time.monotonic() - t0)
+        if delay > 0:
+            time.sleep(delay)
+        pending.put((i, request))
+    for _ in workers:
+        pending.put(None)
+    for worker in workers:
+        worker.join()
+    return records
+
+
+def percentile(values, q):
+    """q-th percentile, linear between the closest ranks"""
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(records, servers):
+    """Throughput and latency of one load point"""
+    done = [r for r in records if r['ok']]
+    span = max(r['end'] for r in records) - min(r['arrival'] for r in records)
+    arrivals = [r['arrival'] for r in records]
+    offered = (len(records) - 1) / (arrivals[-1] - arrivals[0]) if arrivals[-1] > arrivals[0] else 0.0
+    ttft = [r['ttft'] for r in done]
+    delay = [r['queue'] for r in records]
+    summary = {
+        'requests': len(records),
+        'failed': len(records) - len(done),
+        'offered': offered,
+        'throughput': len(done) / span if span > 0 else 0.0,
+        'utilization': sum(r['service'] for r in done) / (servers * span) if span > 0 else 0.0,
+        'ttft_p50': percentile(ttft, 50),
+        'ttft_p99': percentile(ttft, 99),
+        'queue_p50': percentile(delay, 50),
+        'queue_p99': percentile(delay, 99),
+        'service_mean': sum(r['service'] for r in done) / len(done) if done else float('nan'),
+    }
+    setups = [r['setup'] for r in done if 'setup' in r]
+    if setups:
+        # Per-run setup time as a share of the time the board is busy
+        summary['setup_share'] = sum(setups) / 1000 / sum(r['service'] for r in done)
+    return summary
+
+
+def print_curve(points):
+    print(f"{'offered':>8}{'thpt':>8}{'util':>6}{'ttft p50':>10}{'ttft p99':>10}"
+          f"{'queue p50':>11}{'queue p99':>11}{'service':>9}{'setup':>7}{'failed':>8}  (req/s, s)")
+    for point in points:
+        s = point['summary']
+        setup = f"{s['setup_share']:.0%}" if 'setup_share' in s else '-'
+        print(f"{s['offered']:>8.3f}{s['throughput']:>8.3f}{s['utilization']:>6.0%}"
+              f"{s['ttft_p50']:>10.2f}{s['ttft_p99']:>10.2f}{s['queue_p50']:>11.2f}"
+              f"{s['queue_p99']:>11.2f}{s['service_mean']:>9.2f}{setup:>7}{s['failed']:>8}")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Open-loop load generator for the inference path')
+    parser.add_argument('--backend', choices=['mock', 'hdc'], default='mock',
+                        help='Modelled service times in virtual time, or the boards (default: mock)')
+    parser.add_argument('--sys', default='tz', choices=sorted(MOCK_MODEL),
+                        help='Setup (default: tz)')
+    parser.add_argument('--model', default='llama', help='Model (default: llama)')
+    parser.add_argument('--cache', type=int, default=0, help='Cache level (default: 0)')
+    parser.add_argument('--rates', nargs='+', type=float,
+                        help='Mean arrival rates to sweep, requests/s (default: 0.05 0.1 0.2 0.3, '
+                             'or the trace as recorded)')
+    parser.add_argument('--trace', help='Arrival trace, one `<arrival_s> [prompt n]` line per '
+                                        'request, rescaled to each rate')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Requests per rate with Poisson arrivals (default: 200)')
+    parser.add_argument('--prompts', default='32:0.5,256:0.3,512:0.2',
+                        help='Prompt length mix, value:weight,... (default: 32:0.5,256:0.3,512:0.2)')
+    parser.add_argument('--outputs', default='1:0.6,16:0.3,64:0.1',
+                        help='Output length mix (default: 1:0.6,16:0.3,64:0.1)')
+    parser.add_argument('--servers', type=int, default=1,
+                        help='Mock boards serving the queue (default: 1)')
+    parser.add_argument('--targets', nargs='+',
+                        help='hdc target serials (default: every board in `hdc list targets`)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--output', help='Write the curve and every request to this JSON file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    try:
+        prompts, outputs = parse_mix(args.prompts), parse_mix(args.outputs)
+        trace = read_trace(args.trace) if args.trace else None
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    rates = args.rates or ([None] if trace else [0.05, 0.1, 0.2, 0.3])
+
+    if args.backend == 'mock':
+        backends = [MockBackend(args.sys, args.cache, seed=args.seed + i) for i in range(args.servers)]
+    else:
+        targets = args.targets or list_targets()
+        if not targets:
+            print("❌ Error: no devices found")
+            sys.exit(1)
+        backends = [HdcBackend(HdcDevice(serial), args.sys, args.model, args.cache)
+                    for serial in targets]
+        for backend in backends:
+            backend.prepare()
+
+    rng = random.Random(args.seed)
+    points = []
+    for rate in rates:
+        if trace:
+            arrivals = scale_trace(trace, rate)
+        else:
+            arrivals = [(t, None, None) for t in poisson_arrivals(rate, args.requests, rng)]
+        requests = make_requests(arrivals, prompts, outputs, rng)
+        if backends[0].realtime:
+            logger.info(f"{len(requests)} requests over {requests[-1].arrival:.0f}s "
+                        f"on {len(backends)} boards")
+            records = replay(requests, backends)
+        else:
+            records = simulate(requests, backends)
+        points.append({'rate': rate, 'summary': summarize(records, len(backends)),
+                       'requests': records})
+
+    print(f"{args.sys} {args.model} cache {args.cache}, {args.backend} backend, "
+          f"{len(backends)} server(s)")
+    print_curve(points)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend': args.backend, 'setup': args.sys, 'model': args.model,
+                       'cache': args.cache, 'servers': len(backends), 'points': points}, f, indent=1)
+        print(f"✅ Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
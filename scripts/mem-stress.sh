@@ -5,29 +5,88 @@ len=$4
 model=$5
 n=$6
 
+# Warm-up ends once stress-ng holds its target (within SETTLE_TOLERANCE %) and
+# MemAvailable and the reclaim rate moved less than that for SETTLE_SAMPLES
+# consecutive 1 s samples, or after SETTLE_TIMEOUT s
+SETTLE_TOLERANCE=5
+SETTLE_SAMPLES=3
+SETTLE_TIMEOUT=45
+
+meminfo() {
+    awk -v key="$1:" '$1 == key { print $2 }' /proc/meminfo
+}
+
+# Pages scanned, stolen and swapped out by reclaim since boot
+reclaimed() {
+    awk '$1 ~ /^(pgscan|pgsteal)/ || $1 == "pswpout" { n += $2 } END { print n + 0 }' /proc/vmstat
+}
+
+stress_rss_mb() {
+    for pid in $(pidof stress-ng); do
+        cat /proc/$pid/status 2>/dev/null
+    done | awk '$1 == "VmRSS:" { kb += $2 } END { print int(kb / 1024) }'
+}
+
+uptime_cs() {
+    awk '{ printf "%d", $1 * 100 }' /proc/uptime
+}
+
+warmup_cs=0
+warmup_timed_out=0
+
+# settle <target_mb>: wait for the steady state, adding the time taken to warmup_cs
+settle() {
+    start=$(uptime_cs)
+    stable=0
+    avail=$(meminfo MemAvailable)
+    total=$(reclaimed)
+    rate=0
+    while [ $stable -lt $SETTLE_SAMPLES ]; do
+        if [ $(($(uptime_cs) - start)) -ge $((SETTLE_TIMEOUT * 100)) ]; then
+            warmup_timed_out=1
+            break
+        fi
+        sleep 1
+        prev_avail=$avail
+        prev_rate=$rate
+        avail=$(meminfo MemAvailable)
+        rate=$(($(reclaimed) - total))
+        total=$((total + rate))
+        avail_drift=$((avail - prev_avail))
+        rate_drift=$((rate - prev_rate))
+        # 256 pages/s of reclaim noise count as stable
+        if [ $(($(stress_rss_mb) * 100)) -ge $(($1 * (100 - SETTLE_TOLERANCE))) ] &&
+                [ $((${avail_drift#-} * 100)) -le $((prev_avail * SETTLE_TOLERANCE)) ] &&
+                [ $((${rate_drift#-} * 100)) -le $((prev_rate * SETTLE_TOLERANCE + 25600)) ]; then
+            stable=$((stable + 1))
+        else
+            stable=0
+        fi
+    done
+    warmup_cs=$((warmup_cs + $(uptime_cs) - start))
+}
+
 /data/local/tmp/rknpu/set-npu-irq.sh $setup
 
-mount /dev/block/nvme0n1p1 /data/ssd/ && mkdir /dev/shm
-sleep 5
+# After a soft reset the SSD is still mounted, only settle after a fresh mount
+if ! grep -q " /data/ssd " /proc/mounts; then
+    mount /dev/block/nvme0n1p1 /data/ssd/ && mkdir -p /dev/shm
+    settle 0
+fi
 
 set -e
 
-model_path=""
+# Memory stress-ng holds next to each model
 bytes=""
 if [ "$model" = "tinyllama" ]; then
-    model_path="/data/ssd/tinyllama-1.1b-chat-v1.0.Q8_0.gguf"
     bytes="13312M"
 elif [ "$model" = "gemma" ]; then
-    model_path="/data/ssd/gemma-2-2b-it-Q8_0.gguf"
     bytes="12288M"
 elif [ "$model" = "qwen" ]; then
-    model_path="/data/ssd/qwen2.5-3b-instruct-q8_0.gguf"
     bytes="11264M"
 elif [ "$model" = "phi" ]; then
-    model_path="/data/ssd/Phi-3-mini-4k-instruct.Q8_0.gguf"
     bytes="10240M"
 elif [ "$model" = "llama" ]; then
-    model_path="/data/ssd/Meta-Llama-3-8B-Instruct.Q8_0.gguf"
     bytes="6144M"
 else
     echo "invalid model $model"
@@ -38,26 +97,42 @@ if [ "$stress" = "s" ]; then
     echo "Running stress-ng with $bytes..."
     mkdir -p /data/local/tmp/stress-ng
     LD_LIBRARY_PATH=/data/local/tmp/rknpu/ /data/local/tmp/rknpu/ld-linux-aarch64.so.1 /data/local/tmp/rknpu/stress-ng -m 1 --vm-keep --vm-bytes $bytes -t 800s --temp-path /data/local/tmp/stress-ng --taskset 3 &
+    target_mb=${bytes%M}
     # n="1"
+elif [ -f /data/local/tmp/rknpu/pressure/$stress.prof ]; then
+    # A memory-pressure profile pushed by pressure.py, started once the baseline
+    # has settled: the profile, ramps included, is part of the measurement
+    profile=/data/local/tmp/rknpu/pressure/$stress.prof
+    target_mb=0
 else
     echo "no stress-ng"
+    target_mb=0
 fi
 
-sleep 15
-
-if [ "$setup" = "base" ]; then
-    echo "Running baseline..."
-    echo "111: $model#$len"
-    LD_LIBRARY_PATH=/data/local/tmp/rknpu/ /data/local/tmp/rknpu/ld-linux-aarch64.so.1 /data/local/tmp/rknpu/llama-cli --no-warmup -m $model_path -p "$model#$len" -n $n --cache $cache -s 1 -ngl 100 -t 4 --no-mmap -c 1124
-elif [ "$setup" = "tz" ]; then
-    echo "Running TZ-LLM..."
-    LD_LIBRARY_PATH=/data/local/tmp/rknpu/ /data/local/tmp/rknpu/ld-linux-aarch64.so.1 /data/local/tmp/rknpu/fake -c $cache -l $len -m $model -n $n -s 0
-elif [ "$setup" = "strawman" ]; then
-    echo "Running Strawman..."
-    LD_LIBRARY_PATH=/data/local/tmp/rknpu/ /data/local/tmp/rknpu/ld-linux-aarch64.so.1 /data/local/tmp/rknpu/fake -c $cache -l $len -m $model -n $n -s 1
-else
-    echo "invalid setup $setup"
-    exit 1
+settle $target_mb
+echo "warm-up: $((warmup_cs / 100)).$((warmup_cs / 10 % 10))s, timed out: $warmup_timed_out"
+if [ -n "$profile" ]; then
+    echo "Running pressure profile $stress..."
+    sh /data/local/tmp/rknpu/pressure.sh run $profile /dev/shm/current_measure.pressure &
+    pressure_pid=$!
+fi
+inference_start=$(date +%s)
+
+sh /data/local/tmp/rknpu/infer.sh $setup $cache $len $model $n
+
+if [ -n "$pressure_pid" ]; then
+    echo "pressure_profile: $stress" >> /dev/shm/current_measure
+    sh /data/local/tmp/rknpu/pressure.sh summary /dev/shm/current_measure.pressure $inference_start $(date +%s) >> /dev/shm/current_measure || true
+fi
+
+awk -v cs=$warmup_cs 'BEGIN { printf "warmup: %.2f\n", cs / 100 }' >> /dev/shm/current_measure
+echo "warmup_timed_out: $warmup_timed_out" >> /dev/shm/current_measure
+
+# Tell the harness the result is complete (stress-ng may keep running below)
+touch /dev/shm/current_measure.done
+
+if [ -n "$pressure_pid" ]; then
+    kill $pressure_pid
 fi
 
 wait
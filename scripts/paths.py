@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Paths shared by the harness scripts, on the host and on the boards
+Imports nothing of the harness, so every script can import it at the top
+"""
+
+import os
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+AE_ROOT = os.path.realpath(os.path.join(SCRIPT_DIR, '..'))
+RESULTS_DIR = os.path.join(AE_ROOT, 'results')
+# Scripts and binaries on the boards
+REMOTE_DIR = '/data/local/tmp/rknpu'
+# What sync.py sent to each board, and the files compiled to be sent
+SYNC_DIR = os.path.join(AE_ROOT, '.device-sync')
+
+# Result files and their sidecars (per-token timestamps, the prefill event trace
+# and memory-pressure samples) are read and named by the same helpers as the
+# figures
+PLOTS_DIR = os.path.join(AE_ROOT, 'plots')
+sys.path.append(PLOTS_DIR)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Sweep planner
+Turns a sweep spec into an ordered, resumable run manifest: runs that share
+a model file and setup are grouped, and the wall time is estimated from the
+durations recorded in earlier result files
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+import sweep
+
+# Per-point wall time (s) when no earlier run is known, from the README runtimes
+DEFAULT_DURATION = 180.0
+
+
+def group(point):
+    """Runs of a group load the same model file with the same setup"""
+    return point.model, point.setup
+
+
+def order(jobs):
+    """Jobs grouped by model, then by setup, each in order of first appearance"""
+    models = {}
+    for point, repetition in jobs:
+        models.setdefault(point.model, {}).setdefault(point.setup, []).append((point, repetition))
+    return [job for setups in models.values() for setup_jobs in setups.values()
+            for job in setup_jobs]
+
+
+def history(results_dir=sweep.RESULTS_DIR):
+    """Recorded durations of earlier runs, {(model, setup, reset path): [seconds]}"""
+    durations = {}
+    try:
+        filenames = os.listdir(results_dir)
+    except FileNotFoundError:
+        return durations
+    for filename in filenames:
+        parsed = sweep.parse_name(filename)
+        if parsed is None:
+            continue
+        metrics = sweep.read_result(os.path.join(results_dir, filename))
+        if isinstance(metrics.get('duration'), float):
+            key = group(parsed[0]) + (metrics.get('reset', 'reboot'),)
+            durations.setdefault(key, []).append(metrics['duration'])
+    return durations
+
+
+def estimate(point, durations, reset='reboot'):
+    """Expected wall time of a point: median of the same model, setup and reset
+    path, falling back to the same model and setup, then to every earlier run"""
+    same = durations.get(group(point) + (reset,))
+    if same:
+        return statistics.median(same)
+    same_group = [d for key, values in durations.items() if key[:2] == group(point)
+                  for d in values]
+    if same_group:
+        return statistics.median(same_group)
+    every = [d for values in durations.values() for d in values]
+    return statistics.median(every) if every else DEFAULT_DURATION
+
+
+def plan(spec_path, results_dir=sweep.RESULTS_DIR, soft_reset=False):
+    """Manifest of a spec: its jobs in run order, each with its estimate and status"""
+    durations = history(results_dir)
+    reset = 'soft' if soft_reset else 'reboot'
+    jobs = []
+    for point, repetition in order(sweep.spec_jobs(sweep.load_spec(spec_path))):
+        path = point.result_path(results_dir, repetition)
+        jobs.append({
+            'args': point.args,
+            'repetition': repetition,
+            'result': os.path.basename(path),
+            'done': os.path.exists(path),
+            'estimate': round(estimate(point, durations, reset), 1),
+        })
+    return {
+        'spec': os.path.abspath(spec_path),
+        'created': time.time(),
+        'soft_reset': soft_reset,
+        'jobs': jobs,
+    }
+
+
+def manifest_jobs(manifest):
+    """(point, repetition) of every job of a manifest, in order"""
+    jobs = []
+    for job in manifest['jobs']:
+        setup, stress, cache, prompt, model, n = job['args']
+        point = sweep.SweepPoint(setup, stress, int(cache), int(prompt), model, int(n))
+        jobs.append((point, job['repetition']))
+    return jobs
+
+
+def read_manifest(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def wall_time(manifest, devices=1):
+    """Estimated seconds for the jobs left, spread over a number of devices"""
+    remaining = sorted((job['estimate'] for job in manifest['jobs'] if not job['done']),
+                       reverse=True)
+    # Longest job first onto the least loaded device
+    loads = [0.0] * max(1, devices)
+    for seconds in remaining:
+        loads[loads.index(min(loads))] += seconds
+    return max(loads)
+
+
+def _format_time(seconds):
+    hours, rest = divmod(int(math.ceil(seconds)), 3600)
+    return f"{hours}h{rest // 60:02d}m" if hours else f"{rest // 60}m{rest % 60:02d}s"
+
+
+def summary(manifest, devices=1):
+    lines = []
+    groups = {}
+    for job in manifest['jobs']:
+        key = (job['args'][4], job['args'][0])
+        done, total, seconds = groups.get(key, (0, 0, 0.0))
+        groups[key] = (done + job['done'], total + 1,
+                       seconds + (0 if job['done'] else job['estimate']))
+    for (model, setup), (done, total, seconds) in groups.items():
+        lines.append(f"  {model:<10} {setup:<9} {done:>3}/{total:<3} done, "
+                     f"{_format_time(seconds)} left")
+    done = sum(job['done'] for job in manifest['jobs'])
+    lines.append(f"{done}/{len(manifest['jobs'])} runs done, estimated "
+                 f"{_format_time(wall_time(manifest, devices))} on {devices} device(s)")
+    return '\n'.join(lines)
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Plan a sweep from its spec')
+    parser.add_argument('spec', help='Sweep spec (.json, or .yaml with PyYAML), '
+                                     f'or one of {", ".join(sorted(sweep.SWEEPS))}')
+    parser.add_argument('-o', '--output', help='Write the run manifest to this file')
+    parser.add_argument('--results-dir', default=sweep.RESULTS_DIR,
+                        help=f'Results directory (default: {sweep.RESULTS_DIR})')
+    parser.add_argument('--devices', type=int, default=1,
+                        help='Boards the sweep is spread over, for the estimate')
+    parser.add_argument('--soft-reset', action='store_true',
+                        help='Estimate with durations of soft-reset runs')
+    parser.add_argument('--args', action='store_true',
+                        help='Print "<run-mem-retry.sh args> <repetition>" of every pending run')
+    args = parser.parse_args()
+
+    spec = args.spec
+    if not os.path.exists(spec) and spec in sweep.SWEEPS:
+        spec = next(os.path.join(sweep.SPEC_DIR, name) for name in os.listdir(sweep.SPEC_DIR)
+                    if os.path.splitext(name)[0] == spec)
+    try:
+        manifest = plan(spec, args.results_dir, args.soft_reset)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(manifest, f, indent=1)
+    if args.args:
+        for job in manifest['jobs']:
+            if not job['done']:
+                print(' '.join(job['args']), job['repetition'])
+    else:
+        print(summary(manifest, args.devices))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Memory-pressure profiles
+A profile (pressure/<name>.json) is a list of phases, each with a duration,
+a target amount of memory held, the number of stress-ng workers, the rate
+the memory is allocated at and whether it is anonymous or file-backed.
+pressure.sh plays a compiled profile back on the board while mem-stress.sh
+runs inference; a sweep selects it by using its name as the stress value.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import sync
+from paths import REMOTE_DIR, SCRIPT_DIR, SYNC_DIR
+
+PROFILE_DIR = os.path.join(SCRIPT_DIR, 'pressure')
+REMOTE_PROFILE_DIR = f'{REMOTE_DIR}/pressure'
+# Compiled profiles, rewritten only when they change so sync.py skips them
+COMPILED_DIR = os.path.join(SYNC_DIR, 'pressure')
+# Profile names are the stress field of result file names
+NAME = re.compile(r'^[a-z][a-z0-9_]*$')
+KINDS = ('anon', 'file')
+# Stress values mem-stress.sh handles itself: static stress-ng, and none
+RESERVED = ('s', 'n')
+
+
+def parse_mb(value):
+    """Megabytes of '512M', '4G' or a plain number of MB"""
+    match = re.match(r'^(\d+(?:\.\d+)?)([MG]?)$', str(value).strip().upper())
+    if not match:
+        raise ValueError(f'Bad size {value!r}, expected e.g. 512M or 4G')
+    number, unit = float(match.group(1)), match.group(2)
+    return int(number * 1024) if unit == 'G' else int(number)
+
+
+def parse_target(value):
+    """Target as MB, or as a percentage of MemTotal resolved on the board"""
+    value = str(value).strip()
+    if value.endswith('%'):
+        percent = int(value[:-1])
+        if not 0 <= percent <= 95:
+            raise ValueError(f'Target {value} outside 0-95%')
+        return f'{percent}%'
+    return str(parse_mb(value))
+
+
+def load_profile(path):
+    with open(path, 'r') as f:
+        profile = json.load(f)
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not NAME.match(name) or name in RESERVED:
+        raise ValueError(f'{path}: profile names are [a-z][a-z0-9_]* and not {RESERVED}')
+    if not profile.get('phases'):
+        raise ValueError(f'{path}: profile has no phases')
+    for phase in profile['phases']:
+        if phase.get('kind', 'anon') not in KINDS:
+            raise ValueError(f"{path}: kind must be one of {', '.join(KINDS)}")
+        if phase['duration'] <= 0 or phase.get('workers', 1) < 1:
+            raise ValueError(f'{path}: phases need a positive duration and workers')
+    return profile
+
+
+def compile_profile(profile):
+    """Line format read by pressure.sh: duration target workers rate_mb kind"""
+    lines = ['# duration_s target_mb|pct workers rate_mb_per_s kind']
+    for phase in profile['phases']:
+        lines.append(f"{int(phase['duration'])} {parse_target(phase['target'])} "
+                     f"{int(phase.get('workers', 1))} {parse_mb(phase.get('rate', '256M'))} "
+                     f"{phase.get('kind', 'anon')}")
+    if profile.get('loop'):
+        lines.append('loop')
+    return '\n'.join(lines) + '\n'
+
+
+def profiles(profile_dir=PROFILE_DIR):
+    """{name: path} of the profiles of a directory"""
+    return {os.path.splitext(name)[0]: os.path.join(profile_dir, name)
+            for name in sorted(os.listdir(profile_dir)) if name.endswith('.json')}
+
+
+def compile_all(profile_dir=PROFILE_DIR, out_dir=COMPILED_DIR):
+    """Write <name>.prof of every profile to out_dir, return their paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, path in profiles(profile_dir).items():
+        out = os.path.join(out_dir, f'{name}.prof')
+        text = compile_profile(load_profile(path))
+        try:
+            with open(out, 'r') as f:
+                unchanged = f.read() == text
+        except FileNotFoundError:
+            unchanged = False
+        if not unchanged:
+            with open(out, 'w') as f:
+                f.write(text)
+        paths.append(out)
+    return paths
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Memory-pressure profiles for mem-stress.sh')
+    parser.add_argument('--profile-dir', default=PROFILE_DIR,
+                        help='Directory of <name>.json profiles (default: scripts/pressure)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help='List the profiles')
+    show = sub.add_parser('compile', help='Print the compiled form of a profile')
+    show.add_argument('name')
+    push = sub.add_parser('push', help='Send pressure.sh and the compiled profiles to the boards')
+    push.add_argument('--targets', nargs='+', metavar='SERIAL',
+                      help='Boards (default: every board `hdc list targets` reports)')
+    args = parser.parse_args()
+
+    try:
+        found = profiles(args.profile_dir)
+        if args.command == 'list':
+            for name, path in found.items():
+                profile = load_profile(path)
+                print(f"{name:<12} {sum(p['duration'] for p in profile['phases']):>5}s"
+                      f"{' loop' if profile.get('loop') else '     '}  "
+                      f"{profile.get('description', '')}")
+        elif args.command == 'compile':
+            if args.name not in found:
+                raise ValueError(f"unknown profile {args.name}, one of {', '.join(found)}")
+            sys.stdout.write(compile_profile(load_profile(found[args.name])))
+        else:
+            files = sync.expand([os.path.join(SCRIPT_DIR, 'pressure.sh')], REMOTE_DIR)
+            files += sync.expand(compile_all(args.profile_dir), REMOTE_PROFILE_DIR)
+            reports = sync.sync_targets(files, args.targets)
+            for report in reports:
+                sync.print_report(report)
+            sys.exit(1 if any(report.failed for report in reports) else 0)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
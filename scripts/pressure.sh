@@ -0,0 +1,121 @@
+#!/bin/sh
+# Memory-pressure profile driver, started by mem-stress.sh.
+#
+#   pressure.sh run <profile.prof> <samples>      play a profile back until killed
+#   pressure.sh summary <samples> <from> <to>     pressure during [from, to] (epoch s)
+#
+# A compiled profile (see pressure.py) has one phase per line:
+#   <duration_s> <target_mb|pct%> <workers> <rate_mb_per_s> <anon|file>
+# and a last "loop" line for profiles that repeat. Every second the driver starts
+# stress-ng slices of at most rate MB until target MB are held, or stops the newest
+# slices while it holds more, and appends "<epoch> <target_mb> <rss_mb> <avail_mb>"
+# to the samples file.
+
+RKNPU_DIR=/data/local/tmp/rknpu
+TMP_DIR=/data/local/tmp/stress-ng
+
+meminfo() {
+    awk -v key="$1:" '$1 == key { print $2 }' /proc/meminfo
+}
+
+# Resident memory of every stress-ng process, MB
+rss_mb() {
+    for pid in $(pidof stress-ng); do
+        cat /proc/$pid/status 2>/dev/null
+    done | awk '$1 == "VmRSS:" { kb += $2 } END { print int(kb / 1024) }'
+}
+
+held=0
+slices=""
+
+add_slice() {
+    mb=$1
+    workers=$2
+    per=$((mb / workers))
+    [ $per -lt 1 ] && per=1
+    if [ "$3" = "file" ]; then
+        opts="--mmap $workers --mmap-bytes ${per}M --mmap-file"
+    else
+        opts="-m $workers --vm-keep --vm-bytes ${per}M"
+    fi
+    LD_LIBRARY_PATH=$RKNPU_DIR/ $RKNPU_DIR/ld-linux-aarch64.so.1 $RKNPU_DIR/stress-ng $opts -t 800s \
+        --temp-path $TMP_DIR --taskset 3 < /dev/null > /dev/null 2>&1 &
+    slices="$slices $!:$mb"
+    held=$((held + mb))
+}
+
+drop_slice() {
+    last=${slices##* }
+    slices=${slices% *}
+    kill ${last%%:*} 2>/dev/null
+    held=$((held - ${last##*:}))
+}
+
+cleanup() {
+    while [ -n "$slices" ]; do
+        drop_slice
+    done
+}
+
+sample() {
+    echo "$(date +%s) $1 $(rss_mb) $(($(meminfo MemAvailable) / 1024))" >> $samples
+}
+
+if [ "$1" = "summary" ]; then
+    awk -v from="$3" -v to="$4" '
+        !/^#/ && $1 >= from && $1 <= to {
+            n++; target += $2; rss += $3
+            if ($3 > rss_max) rss_max = $3
+            if (avail_min == "" || $4 < avail_min) avail_min = $4
+        }
+        END {
+            if (!n) exit 1
+            printf "pressure_target_mb: %d\npressure_rss_mean_mb: %.1f\n", target / n, rss / n
+            printf "pressure_rss_max_mb: %d\nmem_available_min_mb: %d\n", rss_max, avail_min
+        }' "$2"
+    exit $?
+elif [ "$1" != "run" ] || [ ! -f "$2" ]; then
+    echo "usage: $0 run <profile> <samples> | summary <samples> <from> <to>"
+    exit 2
+fi
+
+profile=$2
+samples=$3
+total_mb=$(($(meminfo MemTotal) / 1024))
+mkdir -p $TMP_DIR
+trap 'cleanup; exit 0' TERM INT
+echo "# epoch target_mb rss_mb mem_available_mb" > $samples
+
+target=0
+while true; do
+    while read duration target_spec workers rate kind; do
+        case "$duration" in
+            ''|'#'*|loop) continue ;;
+        esac
+        case "$target_spec" in
+            *%) target=$((total_mb * ${target_spec%\%} / 100)) ;;
+            *) target=$target_spec ;;
+        esac
+        t=0
+        while [ $t -lt $duration ]; do
+            if [ $held -lt $target ]; then
+                step=$((target - held))
+                [ $step -gt $rate ] && step=$rate
+                add_slice $step $workers $kind
+            fi
+            while [ $held -gt $target ] && [ -n "$slices" ]; do
+                drop_slice
+            done
+            sample $target
+            sleep 1
+            t=$((t + 1))
+        done
+    done < $profile
+    grep -qx loop $profile || break
+done
+
+# Hold the last phase until mem-stress.sh stops the driver
+while true; do
+    sample $target
+    sleep 1
+done
@@ -3,13 +3,17 @@
 SCRIPT_DIR=$(realpath $(dirname $0))
 AE_ROOT=$(realpath $SCRIPT_DIR/../)
 
-RESULTS_DIR=$AE_ROOT/results/
+RESULTS_DIR=${RESULTS_DIR:-$AE_ROOT/results/}
 if [ "$1" = "strawman" ]; then
     MAX_RETRY_COUNT=40
 else
     MAX_RETRY_COUNT=10
 fi
 
+# SOFT_RESET=1 cleans up the board between runs instead of rebooting it,
+# and only reboots when soft-reset.sh finds it differs from its baseline
+SOFT_RESET=${SOFT_RESET:-0}
+
 hdc_timeout() {
     timeout 5 hdc "$@" 2>/dev/null
 }
@@ -29,7 +33,13 @@ wait_connect() {
 # Check if output file already exists
 args_str=$(printf "%s-" "$@")
 args_str=${args_str%-}
-output_file="$RESULTS_DIR/${args_str}.txt"
+# REPETITION=k (k > 0) writes the k-th repetition of a point, as planned by plan.py
+REPETITION=${REPETITION:-0}
+if [ "$REPETITION" -gt 0 ]; then
+    output_file="$RESULTS_DIR/${args_str}.${REPETITION}.txt"
+else
+    output_file="$RESULTS_DIR/${args_str}.txt"
+fi
 
 if [ -f "$output_file" ]; then
     echo "Output file $output_file already exists. Exiting."
@@ -38,27 +48,41 @@ fi
 
 
 echo "AE root: $AE_ROOT"
+start_time=$(date +%s)
 
 # Outer cycle so we can restart from the beginning on timeout
 while true; do
     # 1) Wait until device responds
     wait_connect
 
-    # 2) Reboot device then wait again
-    hdc_timeout shell reboot || continue
-    echo "system reboot"
+    # 2) Reset the device: soft reset if it comes back clean, reboot otherwise
+    reset_path=reboot
+    if [ "$SOFT_RESET" = "1" ]; then
+        check=$(timeout 30 hdc shell "sh /data/local/tmp/rknpu/soft-reset.sh check" 2>/dev/null | tr -d '\r')
+        echo "soft reset: $check"
+        if [ "$check" = "clean" ]; then
+            reset_path=soft
+        fi
+    fi
+    if [ "$reset_path" = "reboot" ]; then
+        hdc_timeout shell reboot || continue
+        echo "system reboot"
+        wait_connect
+        if [ "$SOFT_RESET" = "1" ]; then
+            hdc_timeout shell "sh /data/local/tmp/rknpu/soft-reset.sh baseline" || continue
+        fi
+    fi
     echo "/data/local/tmp/rknpu/mem-stress.sh $@"
-    wait_connect
 
     # 3) Prepare shm, start stress in background
     echo "clear measurement"
-    hdc_timeout shell "mkdir -p /dev/shm/ && rm /dev/shm/current_measure" || continue
+    hdc_timeout shell "mkdir -p /dev/shm/ && rm -f /dev/shm/current_measure /dev/shm/current_measure.done /dev/shm/current_measure.tokens /dev/shm/current_measure.trace /dev/shm/current_measure.pressure" || continue
     hdc_timeout shell "chmod -R +x /data/local/tmp/rknpu/" || continue
     timeout 400 hdc shell \"/data/local/tmp/rknpu/mem-stress.sh $@\" &
 
     mkdir -p "$RESULTS_DIR"
 
-    # 4) Wait for /dev/shm/current_measure with retry cap
+    # 4) Wait for mem-stress.sh to mark the result done, with retry cap
     retry_count=0
     while true; do
         retry_count=$((retry_count + 1))
@@ -69,8 +93,8 @@ while true; do
             break
         fi
 
-        connect=$(hdc_timeout shell ls /dev/shm/current_measure 2>/dev/null || continue)
-        if [ "$connect" = "/dev/shm/current_measure" ]; then
+        connect=$(hdc_timeout shell ls /dev/shm/current_measure.done 2>/dev/null | tr -d '\r')
+        if [ "$connect" = "/dev/shm/current_measure.done" ]; then
             break
         fi
     done
@@ -83,6 +107,20 @@ while true; do
         timeout 20 hdc file recv /dev/shm/current_measure "$output_file" || continue
         break
     done
+    # Per-token timestamps and prefill trace, only present when the binary records them,
+    # and the memory-pressure samples of profile runs
+    for kind in tokens trace pressure; do
+        sidecar=$(hdc_timeout shell ls /dev/shm/current_measure.$kind 2>/dev/null | tr -d '\r')
+        if [ "$sidecar" = "/dev/shm/current_measure.$kind" ]; then
+            while true; do
+                timeout 20 hdc file recv /dev/shm/current_measure.$kind "${output_file%.txt}.$kind" || continue
+                break
+            done
+        fi
+    done
+    echo "reset: $reset_path" >> "$output_file"
+    # Wall time of the point including retries, for planning later sweeps
+    echo "duration: $(( $(date +%s) - start_time ))" >> "$output_file"
 
     break
 done
@@ -0,0 +1,68 @@
+#!/bin/sh
+# Reboot-free run isolation.
+#
+#   soft-reset.sh baseline         record free memory / CMA of a freshly booted board
+#   soft-reset.sh check [tol_pct]  clean up the previous run and compare against the baseline
+#
+# check prints "clean" and exits 0 when the board is back to its baseline, otherwise
+# prints "dirty: <reason>" and exits 1 so the harness falls back to a full reboot.
+
+RKNPU_DIR=/data/local/tmp/rknpu
+BASELINE=$RKNPU_DIR/reset-baseline
+
+meminfo() {
+    awk -v key="$1:" '$1 == key { print $2 }' /proc/meminfo
+}
+
+if [ "$1" = "baseline" ]; then
+    echo "$(meminfo MemAvailable) $(meminfo CmaFree)" > $BASELINE
+    cat $BASELINE
+    exit 0
+elif [ "$1" != "check" ]; then
+    echo "usage: $0 baseline|check [tol_pct]"
+    exit 2
+fi
+
+tol=${2:-5}
+
+if [ ! -f $BASELINE ]; then
+    echo "dirty: no baseline"
+    exit 1
+fi
+
+# Leftovers of the previous run: the driver scripts, stress-ng and the inference binaries
+pkill -9 -f mem-stress.sh 2>/dev/null
+pkill -9 -f pressure.sh 2>/dev/null
+killall -9 stress-ng llama-cli fake 2>/dev/null
+for i in $(seq 20); do
+    pidof stress-ng llama-cli fake > /dev/null || break
+    sleep 0.5
+done
+if pidof stress-ng llama-cli fake > /dev/null; then
+    echo "dirty: processes still running"
+    exit 1
+fi
+
+rm -rf /data/local/tmp/stress-ng /dev/shm/current_measure*
+sync
+echo 3 > /proc/sys/vm/drop_caches
+
+if ! grep -q " /data/ssd " /proc/mounts; then
+    mount /dev/block/nvme0n1p1 /data/ssd/ || { echo "dirty: cannot mount ssd"; exit 1; }
+fi
+mkdir -p /dev/shm
+
+read base_avail base_cma < $BASELINE
+avail=$(meminfo MemAvailable)
+cma=$(meminfo CmaFree)
+
+if [ $((avail * 100)) -lt $((base_avail * (100 - tol))) ]; then
+    echo "dirty: MemAvailable ${avail} kB < baseline ${base_avail} kB"
+    exit 1
+fi
+if [ -n "$base_cma" ] && [ $((cma * 100)) -lt $((base_cma * (100 - tol))) ]; then
+    echo "dirty: CmaFree ${cma} kB < baseline ${base_cma} kB"
+    exit 1
+fi
+
+echo "clean"
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Sweep points and the experiment sweeps run by the evaluation scripts
+"""
+
+import itertools
+import json
+import os
+from collections import namedtuple
+
+import workload
+from paths import AE_ROOT, RESULTS_DIR, SCRIPT_DIR
+from results_store import AXES, SIDECARS, parse_result, parse_run_name, sidecar_path
+
+
+class SweepPoint(namedtuple('SweepPoint', 'setup stress cache prompt model n')):
+    """One invocation of mem-stress.sh, i.e. one run-mem-retry.sh call"""
+
+    __slots__ = ()
+
+    @property
+    def args(self):
+        """Arguments passed to run-mem-retry.sh / mem-stress.sh"""
+        return [str(v) for v in self]
+
+    @property
+    def name(self):
+        """Result file stem, e.g. tz-s-0-32-llama-1"""
+        return '-'.join(self.args)
+
+    def result_path(self, results_dir=RESULTS_DIR, repetition=0):
+        """results/<name>.txt, or results/<name>.<k>.txt for repetition k > 0"""
+        if repetition:
+            return os.path.join(results_dir, f"{self.name}.{repetition}.txt")
+        return os.path.join(results_dir, f"{self.name}.txt")
+
+
+def expand(setups, stresses, caches, models, prompts, ns):
+    """Expand sweep axes in the same nesting order as the shell scripts"""
+    points = []
+    for setup, stress, cache, model, n, prompt in itertools.product(
+            setups, stresses, caches, models, ns, prompts):
+        points.append(SweepPoint(setup, stress, int(cache), int(prompt), model, int(n)))
+    return points
+
+
+# Declarative sweeps, one JSON (or YAML) spec per experiment
+SPEC_DIR = os.path.join(SCRIPT_DIR, 'sweeps')
+# Spec keys in the nesting order of the shell scripts, with the type of their values
+SPEC_AXES = [('setups', str), ('stress', str), ('cache', int), ('models', str),
+             ('n_tokens', int), ('prompts', int)]
+
+
+def load_spec(path):
+    """Sweep blocks of a spec file: either one block or a list under `sweeps`"""
+    with open(path, 'r') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit(f"PyYAML is needed to read {path}, or use a JSON spec")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    blocks = spec.get('sweeps', [spec])
+    for block in blocks:
+        missing = [key for key, _ in SPEC_AXES if key not in block]
+        if missing:
+            raise ValueError(f"{path}: sweep is missing {', '.join(missing)}")
+        if block.get('repetitions', 1) < 1:
+            raise ValueError(f"{path}: repetitions must be at least 1")
+    return blocks
+
+
+def spec_jobs(blocks):
+    """(point, repetition) of every run of a spec, in spec order without duplicates"""
+    jobs = []
+    for block in blocks:
+        axes = {key: [kind(v) for v in _as_list(block[key])] for key, kind in SPEC_AXES
+                if key != 'prompts'}
+        axes['prompts'] = _prompts(_as_list(block['prompts']))
+        points = expand(axes['setups'], axes['stress'], axes['cache'], axes['models'],
+                        axes['prompts'], axes['n_tokens'])
+        for point in points:
+            jobs.extend((point, repetition) for repetition in range(block.get('repetitions', 1)))
+    return list(dict.fromkeys(jobs))
+
+
+def _prompts(values):
+    """Prompt axis of a spec: prompt values, or workloads by name (`name` or
+    `name:size`) that stand for theirs, see workload.py"""
+    prompts = []
+    for value in values:
+        if isinstance(value, str) and not value.isdigit():
+            name, _, size = value.partition(':')
+            prompts.extend(workload.resolve(name, int(size) if size else None))
+        else:
+            prompts.append(int(value))
+    return prompts
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _spec_sweep(path):
+    return lambda: [point for point, repetition in spec_jobs(load_spec(path)) if repetition == 0]
+
+
+# Same sweeps as end-to-end-prefill.sh, end-to-end-decode.sh and cache.sh
+SWEEPS = {os.path.splitext(name)[0]: _spec_sweep(os.path.join(SPEC_DIR, name))
+          for name in sorted(os.listdir(SPEC_DIR)) if name.endswith(('.json', '.yaml', '.yml'))}
+
+
+def parse_name(filename):
+    """(point, repetition) of a result file name, or None for other files"""
+    key = parse_run_name(filename)
+    if key is None:
+        return None
+    return SweepPoint(*(key[axis] for axis in AXES)), key['repetition']
+
+
+def pending(points, results_dir=RESULTS_DIR):
+    """Drop points whose result file already exists so sweeps can resume"""
+    return [p for p in points if not os.path.exists(p.result_path(results_dir))]
+
+
+def read_result(path):
+    """Metrics of a result file, see results_store.parse_result"""
+    with open(path, 'r') as f:
+        return parse_result(f.read())
+
+
+def repetitions(points, results_dir=RESULTS_DIR):
+    """Existing repetitions of every point, {point: {repetition: path}}"""
+    found = {point: {} for point in points}
+    try:
+        filenames = os.listdir(results_dir)
+    except FileNotFoundError:
+        return found
+    for filename in filenames:
+        parsed = parse_name(filename)
+        if parsed is not None and parsed[0] in found:
+            point, repetition = parsed
+            found[point][repetition] = os.path.join(results_dir, filename)
+    return found
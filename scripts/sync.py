@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Incremental sync of files to the boards
+Keeps a manifest of the content hashes already on each board and sends only
+files that changed, several transfers at a time, verifying them on the
+board afterwards
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import device
+from paths import REMOTE_DIR, SYNC_DIR
+
+# Sends of one file before the sync gives up
+SEND_ATTEMPTS = 3
+# Parallel `hdc file send` per board
+JOBS = 4
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return f'{n:.0f} {unit}' if unit == 'B' else f'{n:.1f} {unit}'
+        n /= 1024
+    return f'{n:.1f} GB'
+
+
+def file_hash(path, cache):
+    """SHA-256 of a local file, reused while its size and mtime are unchanged"""
+    st = os.stat(path)
+    key = os.path.realpath(path)
+    entry = cache.get(key)
+    if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+        return entry['sha256']
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    cache[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest.hexdigest()}
+    return cache[key]['sha256']
+
+
+def expand(sources, dest):
+    """(local, remote) of every file to sync: files as given, and the regular
+    files directly inside directories, as the build scripts push them"""
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            names = sorted(name for name in os.listdir(source)
+                           if os.path.isfile(os.path.join(source, name)))
+            files += [(os.path.join(source, name), f'{dest}/{name}') for name in names]
+        elif os.path.isfile(source):
+            files.append((source, f'{dest}/{os.path.basename(source)}'))
+        else:
+            raise FileNotFoundError(source)
+    return files
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(f'{path}.tmp', path)
+
+
+def remote_sizes(dev, remotes):
+    """{remote: size} of the files that exist on the board, one shell call"""
+    paths = ' '.join(shlex.quote(remote) for remote in remotes)
+    out = dev.shell(f'stat -c "%s %n" {paths} 2>/dev/null; true', timeout=30)
+    sizes = {}
+    for line in (out or '').splitlines():
+        size, _, name = line.partition(' ')
+        if size.isdigit():
+            sizes[name] = int(size)
+    return sizes
+
+
+def remote_hashes(dev, remotes):
+    """{remote: sha256} computed on the board, None if it cannot hash"""
+    paths = ' '.join(shlex.quote(remote) for remote in remotes)
+    out = dev.shell(f'sha256sum {paths} 2>/dev/null; true', timeout=120)
+    if out is None:
+        return None
+    hashes = {}
+    for line in out.splitlines():
+        digest, _, name = line.partition(' ')
+        if len(digest) == 64:
+            hashes[name.strip().lstrip('*')] = digest
+    return hashes or None
+
+
+class SyncReport:
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.sent = []
+        self.skipped = []
+        self.failed = []
+        self.bytes_sent = 0
+        self.bytes_skipped = 0
+        self.duration = 0.0
+
+
+def sync(dev, files, manifest_path, hash_cache, jobs=JOBS, verify_all=False, dry_run=False):
+    """Bring the files onto one board, return a SyncReport"""
+    start = time.time()
+    report = SyncReport(dev.serial)
+    manifest = _read_json(manifest_path)
+    wanted = {remote: (local, file_hash(local, hash_cache), os.path.getsize(local))
+              for local, remote in files}
+
+    # The manifest says what was verified on the board; the sizes catch files
+    # removed or truncated since, e.g. by reflashing the data partition
+    on_board = remote_hashes(dev, list(wanted)) if verify_all else None
+    sizes = remote_sizes(dev, list(wanted))
+    pending = []
+    for remote, (local, sha256, size) in wanted.items():
+        if on_board is not None:
+            current = on_board.get(remote) == sha256
+        else:
+            current = manifest.get(remote, {}).get('sha256') == sha256 and sizes.get(remote) == size
+        if current:
+            report.skipped.append(remote)
+            report.bytes_skipped += size
+            manifest[remote] = {'sha256': sha256, 'size': size}
+        else:
+            pending.append(remote)
+    if dry_run:
+        report.sent = pending
+        report.bytes_sent = sum(wanted[remote][2] for remote in pending)
+        report.duration = time.time() - start
+        return report
+
+    dirs = sorted({os.path.dirname(remote) for remote in pending})
+    if dirs:
+        dev.shell('mkdir -p ' + ' '.join(shlex.quote(d) for d in dirs), timeout=10)
+    for attempt in range(SEND_ATTEMPTS):
+        if not pending:
+            break
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            ok = dict(zip(pending, pool.map(lambda remote: dev.send(wanted[remote][0], remote,
+                                                                    timeout=600), pending)))
+        sent = [remote for remote in pending if ok[remote]]
+        hashes = remote_hashes(dev, sent) if sent else {}
+        if hashes is None:
+            # No sha256sum on the board, fall back to the sizes
+            sizes = remote_sizes(dev, sent)
+            verified = [r for r in sent if sizes.get(r) == wanted[r][2]]
+        else:
+            verified = [r for r in sent if hashes.get(r) == wanted[r][1]]
+        for remote in verified:
+            manifest[remote] = {'sha256': wanted[remote][1], 'size': wanted[remote][2]}
+            report.sent.append(remote)
+            report.bytes_sent += wanted[remote][2]
+        pending = [remote for remote in pending if remote not in verified]
+        for remote in pending:
+            manifest.pop(remote, None)
+    report.failed = pending
+    _write_json(manifest_path, manifest)
+    report.duration = time.time() - start
+    return report
+
+
+def sync_targets(files, serials=None, jobs=JOBS, verify_all=False, dry_run=False,
+                 sync_dir=SYNC_DIR):
+    """Sync files to several boards at once, by default every board hdc lists"""
+    # Without a listing, hdc talks to its only board
+    serials = serials or device.list_targets() or [None]
+    cache_path = os.path.join(sync_dir, 'local-hashes.json')
+    hash_cache = _read_json(cache_path)
+    # Hash the local files once for all boards
+    for local, _ in files:
+        file_hash(local, hash_cache)
+
+    def run(serial):
+        manifest = os.path.join(sync_dir, f"{serial or 'default'}.json")
+        return sync(device.HdcDevice(serial), files, manifest, hash_cache, jobs, verify_all,
+                    dry_run)
+
+    with ThreadPoolExecutor(max_workers=len(serials)) as pool:
+        reports = list(pool.map(run, serials))
+    _write_json(cache_path, hash_cache)
+    return reports
+
+
+def print_report(report, dry_run=False):
+    verb = 'would send' if dry_run else 'sent'
+    print(f"{'❌' if report.failed else '✅'} {report.serial or 'board'}: {verb} "
+          f"{len(report.sent)} ({format_bytes(report.bytes_sent)}), skipped "
+          f"{len(report.skipped)} unchanged ({format_bytes(report.bytes_skipped)}) "
+          f"in {report.duration:.1f}s")
+    for remote in report.failed:
+        print(f"   failed: {remote}")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Send files to the boards, skipping unchanged ones')
+    parser.add_argument('sources', nargs='+',
+                        help='Files, or directories whose files are sent')
+    parser.add_argument('--dest', default=REMOTE_DIR, help=f'Board directory (default: {REMOTE_DIR})')
+    parser.add_argument('--targets', nargs='+', metavar='SERIAL',
+                        help='Boards to sync (default: every board `hdc list targets` reports)')
+    parser.add_argument('--jobs', type=int, default=JOBS,
+                        help=f'Parallel transfers per board (default: {JOBS})')
+    parser.add_argument('--verify-all', action='store_true',
+                        help='Hash every file on the board instead of trusting the manifest')
+    parser.add_argument('--dry-run', action='store_true', help='Only list what would be sent')
+    parser.add_argument('--sync-dir', default=SYNC_DIR,
+                        help='Manifests of what is on each board (default: .device-sync/)')
+    args = parser.parse_args()
+
+    try:
+        files = expand(args.sources, args.dest.rstrip('/'))
+    except FileNotFoundError as e:
+        print(f"❌ No such file or directory: {e}", file=sys.stderr)
+        sys.exit(1)
+    reports = sync_targets(files, args.targets, args.jobs, args.verify_all, args.dry_run,
+                           args.sync_dir)
+    for report in reports:
+        print_report(report, args.dry_run)
+    sys.exit(1 if any(report.failed for report in reports) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Benchmark workloads
+A workload (workloads/<name>.json) is either a list of the prompts built into
+the inference binaries, or a JSONL dataset sampled by prompt length: the file
+is streamed once, each prompt tokenized as it passes, and a stratified sample
+drawn by token length. The binaries take a prompt length, so a sampled
+workload resolves to the token lengths of its sample; the sample itself is
+recorded in results/workloads/<name>.<size>.seed<seed>.json, where the figures
+read it from
+"""
+
+import argparse
+import bisect
+import gzip
+import json
+import os
+import random
+import re
+import sys
+
+from paths import AE_ROOT, RESULTS_DIR, SCRIPT_DIR
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+WORKLOAD_DIR = os.path.join(SCRIPT_DIR, 'workloads')
+MANIFEST_DIR = os.path.join(RESULTS_DIR, 'workloads')
+# Sample size and seed of dataset workloads whose spec sets none
+DEFAULT_SIZE = 10
+DEFAULT_SEED = 0
+# Prompt values below this select prompts built into the binaries (e.g. 5-9
+# for UltraChat), so sampled lengths start here
+MIN_LENGTH = 18
+# Pre-tokenization close to what BPE tokenizers split on, when no
+# tokenizer.json is given
+APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def load_workload(name, workload_dir=WORKLOAD_DIR):
+    path = os.path.join(workload_dir, f'{name}.json')
+    if not os.path.exists(path):
+        known = ', '.join(sorted(os.path.splitext(n)[0] for n in os.listdir(workload_dir)))
+        raise ValueError(f"unknown workload {name}, one of {known}")
+    with open(path, 'r') as f:
+        spec = json.load(f)
+    if ('prompts' in spec) == ('dataset' in spec):
+        raise ValueError(f"{path}: a workload has either prompts or a dataset")
+    if 'dataset' in spec:
+        spec['dataset'] = os.path.join(AE_ROOT, spec['dataset'])
+        strata = spec.get('strata', [MIN_LENGTH])
+        if strata != sorted(strata) or strata[0] < MIN_LENGTH:
+            raise ValueError(f"{path}: strata must be ascending and start at {MIN_LENGTH} or above")
+    return spec
+
+
+def workloads(workload_dir=WORKLOAD_DIR):
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(workload_dir)
+                  if name.endswith('.json'))
+
+
+def _field(record, path):
+    """Value at a dotted path such as conversations.0.value"""
+    for key in path.split('.'):
+        record = record[int(key)] if isinstance(record, list) else record[key]
+    return record
+
+
+def stream_prompts(path, field='prompt'):
+    """(line number, prompt) of a JSONL dataset, read line by line"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                prompt = _field(json.loads(line), field)
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+            if isinstance(prompt, str) and prompt:
+                yield number, prompt
+
+
+class TokenCounter:
+    """Token counts of prompts, with the tokenizer loaded on first use"""
+
+    def __init__(self, tokenizer_path=None):
+        self.tokenizer_path = tokenizer_path
+        self.tokenizer = None
+
+    def __call__(self, text):
+        if self.tokenizer_path is None:
+            return len(APPROX_TOKEN.findall(text))
+        if self.tokenizer is None:
+            if Tokenizer is None:
+                raise SystemExit(f"The tokenizers module is needed to read {self.tokenizer_path}")
+            self.tokenizer = Tokenizer.from_file(self.tokenizer_path)
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def stratified_sample(items, strata, size, rng):
+    """Sample of size items in one pass, spread over the length strata in
+    proportion to how many items fall into each
+
+    Items are tuples with the token length second; strata are the lower edges
+    of the strata and shorter items are skipped. Every stratum keeps a uniform
+    reservoir of up to size items until the counts, and so the allocation, are
+    known. Returns the sample, by length, and the counts.
+    """
+    reservoirs = [[] for _ in strata]
+    counts = [0] * len(strata)
+    for item in items:
+        i = bisect.bisect_right(strata, item[1]) - 1
+        if i < 0:
+            continue
+        counts[i] += 1
+        if len(reservoirs[i]) < size:
+            reservoirs[i].append(item)
+        else:
+            j = rng.randrange(counts[i])
+            if j < size:
+                reservoirs[i][j] = item
+
+    total = sum(counts)
+    if total == 0:
+        return [], counts
+    # Largest remainder allocation of the sample over the strata
+    quotas = [size * count / total for count in counts]
+    allocation = [int(quota) for quota in quotas]
+    by_remainder = sorted(range(len(strata)), key=lambda i: quotas[i] - allocation[i], reverse=True)
+    for i in by_remainder[:min(size, total) - sum(allocation)]:
+        allocation[i] += 1
+    sample = []
+    for reservoir, take in zip(reservoirs, allocation):
+        rng.shuffle(reservoir)
+        sample.extend(reservoir[:take])
+    return sorted(sample, key=lambda item: item[1]), counts
+
+
+def _dataset_id(path):
+    st = os.stat(path)
+    return {'path': os.path.relpath(path, AE_ROOT), 'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns}
+
+
+def sampling(spec, size=None, seed=None):
+    """(size, seed) of a dataset workload sample, the spec's unless given"""
+    return (size or spec.get('size', DEFAULT_SIZE),
+            spec.get('seed', DEFAULT_SEED) if seed is None else seed)
+
+
+def manifest_path(name, size, seed, manifest_dir=MANIFEST_DIR):
+    """Sample of a dataset workload, one per size and seed so `name:20`, `name:50` and
+    a `--seed` sample do not replace the one the figures read"""
+    return os.path.join(manifest_dir, f'{name}.{size}.seed{seed}.json')
+
+
+def sample_workload(name, spec, size, seed, manifest_dir=MANIFEST_DIR):
+    """Manifest of a dataset workload, reused while dataset and parameters are unchanged"""
+    key = {'dataset': _dataset_id(spec['dataset']), 'field': spec.get('field', 'prompt'),
+           'tokenizer': spec.get('tokenizer'), 'strata': spec.get('strata', [MIN_LENGTH]),
+           'size': size, 'seed': seed}
+    path = manifest_path(name, size, seed, manifest_dir)
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('key') == key:
+            return manifest
+    except (FileNotFoundError, ValueError):
+        pass
+
+    count_tokens = TokenCounter(spec.get('tokenizer') and
+                                os.path.join(AE_ROOT, spec['tokenizer']))
+    # Lengths are counted as the lines stream past; only the reservoirs keep texts
+    items = ((number, count_tokens(prompt), prompt)
+             for number, prompt in stream_prompts(spec['dataset'], key['field']))
+    sample, counts = stratified_sample(items, key['strata'], size, random.Random(seed))
+    manifest = {
+        'name': name,
+        'key': key,
+        'strata': [{'min_tokens': edge, 'prompts': count} for edge, count in zip(key['strata'], counts)],
+        'prompts': sorted({length for _, length, _ in sample}),
+        'sample': [{'line': number, 'tokens': length, 'text': prompt}
+                   for number, length, prompt in sample],
+    }
+    os.makedirs(manifest_dir, exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f'{path}.tmp', path)
+    return manifest
+
+
+def resolve(name, size=None, seed=None):
+    """Prompt values a workload stands for, as the prompt axis of a sweep"""
+    spec = load_workload(name)
+    if 'prompts' in spec:
+        prompts = spec['prompts']
+        return prompts[:size] if size else prompts
+    manifest = sample_workload(name, spec, *sampling(spec, size, seed))
+    return manifest['prompts']
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark workloads for the sweeps and figures')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help='List the workloads')
+    resolve_parser = sub.add_parser('resolve', help='Sample a workload and print its prompts')
+    resolve_parser.add_argument('name')
+    resolve_parser.add_argument('--size', type=int, help='Sample size (default: the spec size)')
+    resolve_parser.add_argument('--seed', type=int, help='Sampling seed (default: the spec seed)')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'list':
+            for name in workloads():
+                spec = load_workload(name)
+                source = (f"prompts {spec['prompts']}" if 'prompts' in spec else
+                          f"{os.path.relpath(spec['dataset'], AE_ROOT)}, "
+                          f"{spec.get('size', DEFAULT_SIZE)} by length")
+                print(f"{name:<10} {source}  {spec.get('description', '')}")
+        else:
+            prompts = resolve(args.name, args.size, args.seed)
+            spec = load_workload(args.name)
+            if 'dataset' in spec:
+                with open(manifest_path(args.name, *sampling(spec, args.size, args.seed)),
+                          'r') as f:
+                    for stratum in json.load(f)['strata']:
+                        print(f"  >= {stratum['min_tokens']:>5} tokens: {stratum['prompts']} prompts")
+            print(' '.join(str(prompt) for prompt in prompts))
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()